@@ -14,14 +14,17 @@ def create_dataloader(dataset, dataset_opt, opt=None, sampler=None):
             batch_size = dataset_opt['batch_size'] // world_size
             shuffle = False
         else:
-            num_workers = dataset_opt['n_workers'] * len(opt['gpu_ids'])
+            # gpu_ids is None on the CPU (options.setup_device)
+            num_devices = max(len(opt['gpu_ids'] or []), 1)
+            num_workers = dataset_opt['n_workers'] * num_devices
             batch_size = dataset_opt['batch_size']
             shuffle = True
         return torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=shuffle,
                                            num_workers=num_workers, sampler=sampler, drop_last=True,
                                            pin_memory=False)
     else:
-        return torch.utils.data.DataLoader(dataset, batch_size=1, shuffle=False, num_workers=1,
+        num_workers = dataset_opt['n_workers'] if dataset_opt['n_workers'] else 1
+        return torch.utils.data.DataLoader(dataset, batch_size=1, shuffle=False, num_workers=num_workers,
                                            pin_memory=False)
 
 
@@ -24,6 +24,8 @@ class VideoTestDataset(data.Dataset):
         self.kernel_size = kwargs['kernel_size']
         self.model_name = kwargs['model_name']
         idx = kwargs['idx'] if 'idx' in kwargs else None
+        # GT frames per folder shared between datasets of other degradations, filled here when empty
+        gt_cache = kwargs['gt_cache'] if 'gt_cache' in kwargs else None
         self.opt = opt
         self.cache_data = opt['cache_data']
         self.half_N_frames = opt['N_frames'] // 2
@@ -69,7 +71,12 @@ class VideoTestDataset(data.Dataset):
                 self.data_info['border'].extend(border_l)
 
                 if self.cache_data:
-                    self.imgs_GT[subfolder_name] = util.read_img_seq(img_paths_GT, img_type)
+                    if gt_cache is not None and subfolder_name in gt_cache:
+                        self.imgs_GT[subfolder_name] = gt_cache[subfolder_name]
+                    else:
+                        self.imgs_GT[subfolder_name] = util.read_img_seq(img_paths_GT, img_type)
+                    if gt_cache is not None:
+                        gt_cache[subfolder_name] = self.imgs_GT[subfolder_name]
         elif opt['name'].lower() in ['vimeo90k-test']:
             pass  # TODO
         else:
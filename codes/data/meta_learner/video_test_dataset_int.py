@@ -24,6 +24,8 @@ class VideoTestDataset(data.Dataset):
         self.kernel_size = kwargs['kernel_size']
         self.model_name = kwargs['model_name']
         idx = kwargs['idx'] if 'idx' in kwargs else None
+        # GT frames per folder shared between datasets of other degradations, filled here when empty
+        gt_cache = kwargs['gt_cache'] if 'gt_cache' in kwargs else None
         self.opt = opt
         self.cache_data = opt['cache_data']
         self.half_N_frames = opt['N_frames'] // 2
@@ -175,7 +177,10 @@ class VideoTestDataset(data.Dataset):
                     border_l[i] = 1
                     border_l[max_idx - i - 1] = 1
                 self.data_info['border'].extend(border_l)
-                self.imgs_GT[subfolder_name] = util.read_img_seq(img_paths_GT, img_type)
+                if gt_cache is not None and subfolder_name in gt_cache:
+                    self.imgs_GT[subfolder_name] = gt_cache[subfolder_name]
+                else:
+                    self.imgs_GT[subfolder_name] = util.read_img_seq(img_paths_GT, img_type)
                 if opt['degradation_mode'] == 'preset':
                     self.imgs_LQ[subfolder_name] = torch.stack([util.read_img_seq(util.glob_file_list(paths_LQ), img_type) for paths_LQ in img_paths_LQ], dim=0)
                     self.imgs_SLQ[subfolder_name] = torch.stack([util.read_img_seq(util.glob_file_list(paths_SLQ), img_type) for paths_SLQ in img_paths_SLQ], dim=0)
@@ -187,6 +192,8 @@ class VideoTestDataset(data.Dataset):
                     self.imgs_SLQ[subfolder_name] = self.imgs_SLQ[subfolder_name][..., :h - (h%4), :w - (w%4)]
                     self.imgs_LQ[subfolder_name] = self.imgs_LQ[subfolder_name][..., :self.scale*(h - (h%4)), :self.scale*(w - (w%4))]
                     self.imgs_GT[subfolder_name] = self.imgs_GT[subfolder_name][..., :self.scale*self.scale*(h - (h%4)), :self.scale*self.scale*(w - (w%4))]
+                if gt_cache is not None:
+                    gt_cache[subfolder_name] = self.imgs_GT[subfolder_name]
 
         else:
             raise ValueError(
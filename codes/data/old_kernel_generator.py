@@ -16,8 +16,10 @@ base_kernel_dict = {
 
 
 class Degradation:
-    def __init__(self, kernel_size, scale_factor, type=0.0, theta=0.0, sigma=[1.0, 1.0]):
+    def __init__(self, kernel_size, scale_factor, type=0.0, theta=0.0, sigma=[1.0, 1.0], device='cuda'):
         self.kernel_size = kernel_size
+        # Kernels are built and applied on device, see options.setup_device
+        self.device = torch.device(device)
         self.scale = scale_factor
 
         self.basis_kernel = None
@@ -28,8 +30,8 @@ class Degradation:
 
         self.Gaussian_kernel = None
         self.G_kernel_size = 21
-        self.theta = torch.tensor([theta]).cuda()
-        self.sigma = torch.tensor(sigma).cuda()
+        self.theta = torch.tensor([theta], device=self.device)
+        self.sigma = torch.tensor(sigma, device=self.device)
         self.build_G_kernel()
 
         self.kernel = self.convolve_kernel()
@@ -40,7 +42,7 @@ class Degradation:
 
     def build_base_kernel(self):
         kernel_center = self.b_kernel_size // 2
-        kernel = torch.zeros((self.b_kernel_size, self.b_kernel_size)).cuda()
+        kernel = torch.zeros((self.b_kernel_size, self.b_kernel_size), device=self.device)
         '''
         if self.type < 0.2:
             type_name = 'impulse'
@@ -58,7 +60,7 @@ class Degradation:
         else:
             type_name = 'bicubic'
 
-        kernel_1d = torch.Tensor(base_kernel_dict[type_name][self.scale]).cuda()
+        kernel_1d = torch.tensor(base_kernel_dict[type_name][self.scale], device=self.device)
         k_length = kernel_1d.size(0)
         kernel_2d = kernel_1d[:, None] * kernel_1d[None]
         l_length, r_length = (k_length - 1) // 2, (k_length + 2) // 2
@@ -75,8 +77,7 @@ class Degradation:
         else:
             kernel_radius = self.G_kernel_size // 2
             kernel_range = torch.linspace(-kernel_radius, kernel_radius, self.G_kernel_size)
-            if self.sigma.is_cuda:
-                kernel_range = kernel_range.cuda()
+            kernel_range = kernel_range.to(self.sigma.device)
 
             horizontal_range = kernel_range[None].repeat((self.G_kernel_size, 1))
             vertical_range = kernel_range[:, None].repeat((1, self.G_kernel_size))
@@ -125,12 +126,10 @@ class Degradation:
         return torch.reshape(self.kernel, (self.kernel_size ** 2,))
 
     def apply(self, img):
-        cu = False
-        if img.is_cuda:
-            cu = True
+        in_device = img.device
 
-        weights = self.kernel.repeat((3, 1, 1, 1)).cuda()
-        img = img.cuda()
+        weights = self.kernel.repeat((3, 1, 1, 1)).to(self.device)
+        img = img.to(self.device)
         pad_func = torch.nn.ReflectionPad2d(self.kernel_size // 2)
         dimension = 4
         if img.ndim == 3:
@@ -140,8 +139,7 @@ class Degradation:
         img = pad_func(img)
         lr_img = conv2d(img, weights, groups=3, stride=int(self.scale))
 
-        if not cu:
-            lr_img = lr_img.cpu()
+        lr_img = lr_img.to(in_device)
         if dimension == 3:
             lr_img = lr_img[0]
 
@@ -111,6 +111,43 @@ def read_img_seq(path, img_type='img'):
     return imgs
 
 
+def read_y4m(path):
+    """Read the frames of a YUV4MPEG2 (.y4m) file one at a time
+    Only 8-bit 4:2:0 and 4:4:4 streams are supported, chroma is upsampled by repetition.
+
+    Yields:
+        img (Tensor): size (C, H, W), RGB, [0, 1]
+    """
+    with open(path, 'rb') as f:
+        header = f.readline().split()
+        if not header or header[0] != b'YUV4MPEG2':
+            raise ValueError('Not a YUV4MPEG2 file: {}'.format(path))
+        params = {p[:1]: p[1:] for p in header[1:]}
+        W, H = int(params[b'W']), int(params[b'H'])
+        colorspace = params.get(b'C', b'420').decode()
+        if colorspace.startswith('420'):
+            cw, ch = (W + 1) // 2, (H + 1) // 2
+        elif colorspace.startswith('444') and colorspace != '444alpha':
+            cw, ch = W, H
+        else:
+            raise ValueError('Unsupported Y4M colorspace: {}'.format(colorspace))
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            if not line.startswith(b'FRAME'):
+                raise ValueError('Corrupted Y4M frame header in {}'.format(path))
+            y = np.frombuffer(f.read(W * H), dtype=np.uint8).reshape(H, W)
+            u = np.frombuffer(f.read(cw * ch), dtype=np.uint8).reshape(ch, cw)
+            v = np.frombuffer(f.read(cw * ch), dtype=np.uint8).reshape(ch, cw)
+            if cw != W:
+                u = u.repeat(2, axis=0).repeat(2, axis=1)[:H, :W]
+                v = v.repeat(2, axis=0).repeat(2, axis=1)[:H, :W]
+            ycbcr = np.stack([y, u, v], axis=2).astype(np.float32) / 255.
+            img = np.clip(ycbcr2rgb(ycbcr), 0, 1)
+            yield torch.from_numpy(np.ascontiguousarray(np.transpose(img, (2, 0, 1)))).float()
+
+
 def index_generation(crt_i, max_n, N, padding='reflection'):
     """Generate an index list for reading N frames from a sequence of images
     Args:
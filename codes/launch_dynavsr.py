@@ -0,0 +1,142 @@
+"""Run test_dynavsr.py on several worker processes, each handling a shard of the clips.
+
+The meta-learned G/E weights, the fixed estimator, the bicubic-trained G and the cached
+frames of the test set are loaded once by the launcher and put in shared memory, so every
+worker only allocates its adapted working copy. Each worker is pinned to its own set of
+cores with as many intra-op threads, and writes its own psnr_update_shard{rank}.csv, which
+are merged into psnr_update.csv at the end.
+
+    python launch_dynavsr.py -opt options/test/EDVR/EDVR_R.yml -save_dir ../test_results --num_workers 4
+
+Clips are assigned whole (--shard_by clip, longest first to the least loaded worker), or
+the frames are split in contiguous ranges (--shard_by frame), which is only possible when
+no adaptation state is carried from frame to frame (adapt_mode frame without warm_start).
+"""
+import os
+import time
+
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+
+import test_dynavsr
+from models import weight_registry
+from data.meta_learner import create_dataset
+from utils.results import load_results, clip_average
+
+
+def shard_indices(val_set, num_shards, shard_by='clip'):
+    """Dataset indices of every shard"""
+    if shard_by == 'frame':
+        n = len(val_set)
+        bounds = [n * i // num_shards for i in range(num_shards + 1)]
+        return [list(range(bounds[i], bounds[i + 1])) for i in range(num_shards)]
+    if shard_by != 'clip':
+        raise NotImplementedError('Sharding [{:s}] is not recognized.'.format(shard_by))
+    clips = {}
+    for i, clip in enumerate(val_set.data_info['folder']):
+        clips.setdefault(clip, []).append(i)
+    shards = [[] for _ in range(num_shards)]
+    for clip in sorted(clips, key=lambda c: len(clips[c]), reverse=True):
+        min(shards, key=len).extend(clips[clip])
+    return [sorted(shard) for shard in shards]
+
+
+def share_dataset(val_set):
+    """Move the frames cached by the test dataset (cache_data) to shared memory"""
+    for name in ['imgs_GT', 'imgs_LQ', 'imgs']:
+        for v in getattr(val_set, name, {}).values():
+            if torch.is_tensor(v):
+                v.share_memory_()
+
+
+def split_cores(num_workers, threads=None):
+    """Disjoint sets of cores for the workers (all cores split evenly by default), None when
+    the affinity cannot be set on this platform"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    available = sorted(os.sched_getaffinity(0))
+    threads = threads if threads else max(len(available) // num_workers, 1)
+    return [[available[(rank * threads + i) % len(available)] for i in range(threads)]
+            for rank in range(num_workers)]
+
+
+def setup_worker(rank, cores):
+    # Pin the worker to its cores so that the intra-op thread pools do not oversubscribe them
+    if cores:
+        os.sched_setaffinity(0, cores[rank])
+        torch.set_num_threads(len(cores[rank]))
+    if torch.cuda.is_available():
+        torch.cuda.set_device(rank % torch.cuda.device_count())
+
+
+def worker(rank, args, shards, shared, cores):
+    setup_worker(rank, cores)
+    test_dynavsr.main(args, shard=(rank, shards[rank]), shared=shared)
+
+
+def merge_logs(result_dir, num_shards):
+    """Concatenate the per-worker pd_logs into psnr_update.csv and print the averages"""
+    logs = []
+    for rank in range(num_shards):
+        path = os.path.join(result_dir, 'psnr_update_shard{:d}.csv'.format(rank))
+        if os.path.exists(path):
+            # A resumed shard may have logged a frame twice, keep its last row
+            logs.append(load_results(path))
+    if not logs:
+        return None
+    pd_log = pd.concat(logs).sort_index()
+    pd_log.to_csv(os.path.join(result_dir, 'psnr_update.csv'))
+
+    # Average of the per-clip averages, as printed by test_dynavsr.py
+    avg, clip_avg = clip_average(pd_log, ['PSNR_Bicubic', 'PSNR_Ours', 'SSIM_Bicubic', 'SSIM_Ours'])
+    for k in avg.index:
+        log_s = '# Validation # {}: {:.4e}:'.format(k, avg[k])
+        for clip, v in clip_avg[k].items():
+            log_s += ' {}: {:.4e}'.format(clip, v)
+        print(log_s)
+    return pd_log
+
+
+def main():
+    parser = test_dynavsr.build_parser()
+    parser.add_argument('--num_workers', type=int, default=2)
+    parser.add_argument('--shard_by', choices=['clip', 'frame'], default='clip')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='intra-op threads (and pinned cores) per worker, num_threads of the options '
+                             'or all cores split evenly by default')
+    args = parser.parse_args()
+
+    opt, folder_name = test_dynavsr.load_options(args)
+    maml_opt = opt['train']['maml']
+    if args.shard_by == 'frame' and (maml_opt['adapt_mode'] not in [None, 'frame'] or maml_opt['warm_start']):
+        raise NotImplementedError('shard_by [frame] needs adapt_mode [frame] without warm_start.')
+
+    # Test set and frozen weights, loaded once and shared by the workers
+    dataset_opt = opt['datasets']['val']
+    val_set = create_dataset(dataset_opt, scale=opt['scale'],
+                             kernel_size=opt['datasets']['train']['kernel_size'],
+                             model_name=opt['network_E']['which_model_E'])
+    share_dataset(val_set)
+    shared = {'val_set': val_set,
+              'weights': {'G': weight_registry.share(opt['path']['pretrain_model_G']),
+                          'E': weight_registry.share(opt['path']['pretrain_model_E']),
+                          'bicubic_G': weight_registry.share(opt['path']['bicubic_G']),
+                          'fixed_E': weight_registry.share(opt['path']['fixed_E'])}}
+    num_workers = max(min(args.num_workers, len(val_set)), 1)
+    shards = shard_indices(val_set, num_workers, args.shard_by)
+
+    cores = split_cores(num_workers, args.threads if args.threads else opt['num_threads'])
+
+    with open(os.path.join(args.save_dir, 'DynaVSR-R.txt'), 'a') as f:
+        f.write('OK ' + args.opt + '\n')
+    begin = time.time()
+    mp.spawn(worker, args=(args, shards, shared, cores), nprocs=num_workers, join=True)
+    merge_logs(os.path.join('../test_results', folder_name), num_workers)
+    end = time.time()
+    with open(os.path.join(args.save_dir, 'DynaVSR-R.txt'), 'a') as f:
+        f.write('Full time on {} ({:d} workers): {}\n'.format(args.opt, num_workers, end - begin))
+
+
+if __name__ == '__main__':
+    main()
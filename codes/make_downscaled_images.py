@@ -12,6 +12,7 @@ import math
 import data.util as data_util
 from data import random_kernel_generator as rkg
 from data import old_kernel_generator as oldkg
+import options.options as option
 
 import imageio
 
@@ -32,7 +33,6 @@ def main():
     #################
     # configurations
     #################
-    device = torch.device('cuda')
     # os.environ['CUDA_VISIBLE_DEVICES'] = '0'
 
     prog = argparse.ArgumentParser()
@@ -42,8 +42,10 @@ def main():
     prog.add_argument('--sigma_y', '-sy', type=float, default=0, help='sigma_y')
     prog.add_argument('--theta', '-t', type=float, default=0, help='theta')
     prog.add_argument('--scale', '-sc', type=int, default=2, choices=(2, 4), help='scale factor')
+    prog.add_argument('--cpu', action='store_true', help='run on the CPU (also without a CUDA device)')
 
     args = prog.parse_args()
+    device = torch.device(option.setup_device({'cpu': args.cpu}))
 
     data_modes = args.dataset_mode
     degradation_mode = args.degradation_mode  # impulse | bicubic
@@ -113,7 +115,7 @@ def main():
                 if degradation_mode == 'preset':
                     kernel_preset = np.load(kernel_folder)
             else:
-                kernel_gen = oldkg.Degradation(kernel_size, 2, type=0.7, **gen_kwargs)
+                kernel_gen = oldkg.Degradation(kernel_size, 2, type=0.7, device=device, **gen_kwargs)
 
             if data_mode == 'Vimeo':
                 sub1 = osp.basename(osp.dirname(subfolder_GT))
@@ -11,6 +11,7 @@ import torch
 import math
 import data.util as data_util
 import utils.util as util
+import options.options as option
 
 from models.archs import LRimg_estimator as LRest
 
@@ -21,8 +22,6 @@ def main():
     #################
     # configurations
     #################
-    device = torch.device('cuda')
-
     prog = argparse.ArgumentParser()
     prog.add_argument('--dataset_mode', '-m', type=str, default='Vid4+REDS', help='data_mode')
     prog.add_argument('--degradation_mode', '-d', type=str, default='bicubic', choices=('impulse', 'bicubic', 'preset'), help='path to image output directory.')
@@ -31,8 +30,10 @@ def main():
     prog.add_argument('--sigma_y', '-sy', type=float, default=0, help='sigma_y')
     prog.add_argument('--theta', '-t', type=float, default=0, help='theta')
     prog.add_argument('--scale', '-sc', type=int, default=2, choices=(2, 4), help='scale factor')
+    prog.add_argument('--cpu', action='store_true', help='run on the CPU (also without a CUDA device)')
 
     args = prog.parse_args()
+    device = torch.device(option.setup_device({'cpu': args.cpu}))
 
     data_modes = args.dataset_mode
     degradation_mode = args.degradation_mode  # impulse | bicubic
@@ -82,16 +83,16 @@ def main():
         if args.model == 'SFDN':
             if scale == 2:
                 model = LRest.DirectKernelEstimator_CMS(nf=64)
-                model.load_state_dict(torch.load('../pretrained_models/MFDN/SFDN_{}.pth'.format(load_model)), strict=True)
+                model.load_state_dict(torch.load('../pretrained_models/MFDN/SFDN_{}.pth'.format(load_model), map_location=device), strict=True)
             else:
                 raise NotImplementedError('We do not support SFDN for scale factor 4 now.')
 
         else:
             model = LRest.DirectKernelEstimatorVideo(in_nc=3, nf=64, scale=scale)
             if scale == 2:
-                model.load_state_dict(torch.load('../pretrained_models/MFDN/MFDN_{}.pth'.format(load_model)), strict=True)
+                model.load_state_dict(torch.load('../pretrained_models/MFDN/MFDN_{}.pth'.format(load_model), map_location=device), strict=True)
             else:
-                model.load_state_dict(torch.load('../pretrained_models/MFDN/MFDN_{}_S4.pth'.format(load_model)), strict=True)
+                model.load_state_dict(torch.load('../pretrained_models/MFDN/MFDN_{}_S4.pth'.format(load_model), map_location=device), strict=True)
 
         model.eval()
         model = model.to(device)
@@ -0,0 +1,197 @@
+"""Evaluate DynaVSR over a matrix of option YAMLs and degradation settings in one run.
+
+Instead of one test_dynavsr.py launch per setting (run_visual.sh), the launcher shares the
+meta / fixed weights of every YAML and the GT frames of every test set once, and worker
+processes take the (YAML, setting) cells from a queue. A worker keeps the models of the
+YAMLs it has run, so consecutive settings of a YAML only reload the LR frames. Every cell
+writes its usual psnr_update.csv, and the averages of all cells are gathered in one table
+(<save_dir>/matrix.csv).
+
+    python matrix_dynavsr.py -opt options/test/EDVR/EDVR_R.yml options/test/EDVR/EDVR_V.yml -save_dir ../test_results --num_workers 2
+
+Settings are read from a YAML list (--settings), each entry either preset or a mapping with
+sigma_x, sigma_y, theta (and optionally degradation_type):
+
+    - {sigma_x: 0.8, sigma_y: 0.8, theta: 0}
+    - {degradation_type: impulse, sigma_x: 0.8, sigma_y: 1.6, theta: 45}
+    - preset
+
+Without --settings, the isotropic, anisotropic and preset settings of run_visual.sh are
+used. Other test_dynavsr.py arguments (e.g. --adapt_mode clip) are passed to every cell.
+"""
+import os
+import time
+import argparse
+
+import yaml
+import pandas as pd
+import torch.multiprocessing as mp
+
+import test_dynavsr
+from launch_dynavsr import share_dataset, split_cores, setup_worker
+from models import weight_registry
+from models.dynavsr_runner import DynaVSRRunner
+from data.meta_learner import create_dataset
+from utils.results import load_results, clip_average
+
+# Settings of run_visual.sh
+DEFAULT_SETTINGS = [{'sigma_x': s, 'sigma_y': s, 'theta': 0}
+                    for s in [0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 2.0, 3.0, 4.0]] + \
+                   [{'sigma_x': 0.8, 'sigma_y': 1.6, 'theta': t} for t in [0, 45, 90, 135]] + \
+                   ['preset']
+METRIC_COLUMNS = ['PSNR_Bicubic', 'PSNR_Ours', 'SSIM_Bicubic', 'SSIM_Ours']
+
+
+def setting_name(setting):
+    if setting == 'preset':
+        return 'preset'
+    return '{}_{}_{}_{}'.format(setting['degradation_type'], setting['sigma_x'], setting['sigma_y'], setting['theta'])
+
+
+def cell_argv(opt_path, setting, save_dir, extra):
+    """test_dynavsr.py arguments of one cell, which saves its images in its own subfolder"""
+    subfolder = '{}_{}'.format(os.path.splitext(os.path.basename(opt_path))[0], setting_name(setting))
+    argv = ['-opt', opt_path, '-save_dir', save_dir, '--img_subfolder', subfolder]
+    if setting == 'preset':
+        argv += ['--degradation_type', 'preset']
+    else:
+        argv += ['--degradation_type', setting['degradation_type'], '--sigma_x', str(setting['sigma_x']),
+                 '--sigma_y', str(setting['sigma_y']), '--theta', str(setting['theta'])]
+    return argv + extra
+
+
+def load_settings(path, degradation_type):
+    settings = DEFAULT_SETTINGS
+    if path is not None:
+        with open(path, 'r') as f:
+            settings = yaml.safe_load(f)
+    result = []
+    for setting in settings:
+        if setting == 'preset':
+            result.append(setting)
+        elif isinstance(setting, dict):
+            setting = dict(setting)
+            setting.setdefault('degradation_type', degradation_type)
+            result.append(setting)
+        else:
+            raise NotImplementedError('Degradation setting [{}] is not recognized.'.format(setting))
+    return result
+
+
+def dataset_key(opt):
+    dataset_opt = opt['datasets']['val']
+    return (dataset_opt['mode'], dataset_opt['name'], dataset_opt['dataroot_GT'], opt['scale'])
+
+
+def worker(rank, cells, tasks, results, weights, gt_caches, cores):
+    setup_worker(rank, cores)
+    runners = {}
+    while True:
+        i = tasks.get()
+        if i is None:
+            return
+        opt_path, setting, args = cells[i]
+        st = time.time()
+        try:
+            opt, _ = test_dynavsr.load_options(args)
+            dataset_opt = opt['datasets']['val']
+            val_set = create_dataset(dataset_opt, scale=opt['scale'],
+                                     kernel_size=opt['datasets']['train']['kernel_size'],
+                                     model_name=opt['network_E']['which_model_E'],
+                                     gt_cache=gt_caches[dataset_key(opt)])
+            # The models only depend on the YAML, except the SLR cache which depends on the mode
+            runner_key = (opt_path, dataset_opt['degradation_mode'])
+            if runner_key not in runners:
+                runners[runner_key] = DynaVSRRunner(opt, frame_shape=tuple(val_set[0]['LQs'].shape), reference=True,
+                                                    shared_weights=weights[opt_path])
+            log_path = test_dynavsr.main(args, shared={'val_set': val_set, 'weights': weights[opt_path],
+                                                       'runner': runners[runner_key]})
+            results.put((i, log_path, time.time() - st, None))
+        except Exception as e:
+            print('Cell {} [{}] failed: {}'.format(opt_path, setting_name(setting), e))
+            results.put((i, None, time.time() - st, '{}: {}'.format(type(e).__name__, e)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-opt', type=str, nargs='+', help='Paths to option YAML files.')
+    parser.add_argument('-save_dir', type=str, default='../test_results')
+    parser.add_argument('--settings', type=str, default=None,
+                        help='YAML list of degradation settings, those of run_visual.sh by default')
+    parser.add_argument('--degradation_type', type=str, default='impulse',
+                        help='degradation_type of the settings which do not give one')
+    parser.add_argument('--num_workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='intra-op threads (and pinned cores) per worker, all cores split evenly by default')
+    args, extra = parser.parse_known_args()
+    if '--exp_name' in extra or '--img_subfolder' in extra:
+        raise NotImplementedError('--exp_name / --img_subfolder would write every cell to the same folder.')
+
+    settings = load_settings(args.settings, args.degradation_type)
+    cells = []
+    for opt_path in args.opt:
+        for setting in settings:
+            cell_args = test_dynavsr.parse_args(cell_argv(opt_path, setting, args.save_dir, extra))
+            cells.append((opt_path, setting, cell_args))
+
+    # Weights of every YAML and GT frames of every test set, loaded once and shared by the workers
+    shared_files, weights, gt_caches = {}, {}, {}
+    for opt_path, setting, cell_args in cells:
+        opt, _ = test_dynavsr.load_options(cell_args)
+        if opt_path not in weights:
+            weights[opt_path] = {}
+            for key, path in [('G', opt['path']['pretrain_model_G']), ('E', opt['path']['pretrain_model_E']),
+                              ('bicubic_G', opt['path']['bicubic_G']), ('fixed_E', opt['path']['fixed_E'])]:
+                if path not in shared_files:
+                    shared_files[path] = weight_registry.share(path)
+                weights[opt_path][key] = shared_files[path]
+        key = dataset_key(opt)
+        if key not in gt_caches:
+            gt_caches[key] = {}
+            val_set = create_dataset(opt['datasets']['val'], scale=opt['scale'],
+                                     kernel_size=opt['datasets']['train']['kernel_size'],
+                                     model_name=opt['network_E']['which_model_E'], gt_cache=gt_caches[key])
+            share_dataset(val_set)
+            del val_set
+
+    num_workers = max(min(args.num_workers, len(cells)), 1)
+    cores = split_cores(num_workers, args.threads)
+    ctx = mp.get_context('spawn')
+    tasks, results = ctx.Queue(), ctx.Queue()
+    # Cells of the same YAML are queued together, so that a worker mostly reuses its models
+    for i in range(len(cells)):
+        tasks.put(i)
+    for _ in range(num_workers):
+        tasks.put(None)
+
+    begin = time.time()
+    context = mp.spawn(worker, args=(cells, tasks, results, weights, gt_caches, cores),
+                       nprocs=num_workers, join=False)
+    outcomes = {}
+    while len(outcomes) < len(cells):
+        i, log_path, cell_time, error = results.get()
+        outcomes[i] = (log_path, cell_time, error)
+        print('Matrix: {:d}/{:d} cells done.'.format(len(outcomes), len(cells)))
+    while not context.join():
+        pass
+
+    # One row per cell: average of the per-clip averages, as printed by test_dynavsr.py
+    rows = []
+    for i, (opt_path, setting, _) in enumerate(cells):
+        log_path, cell_time, error = outcomes[i]
+        row = {'YAML': os.path.basename(opt_path), 'Setting': setting_name(setting), 'Time': cell_time, 'Error': error}
+        if log_path is not None and os.path.exists(log_path):
+            pd_log = load_results(log_path)
+            avg, _ = clip_average(pd_log, METRIC_COLUMNS)
+            row.update(avg.to_dict())
+            row['Frames'] = len(pd_log)
+        rows.append(row)
+    table = pd.DataFrame(rows, columns=['YAML', 'Setting'] + METRIC_COLUMNS + ['Frames', 'Time', 'Error'])
+    os.makedirs(args.save_dir, exist_ok=True)
+    table.to_csv(os.path.join(args.save_dir, 'matrix.csv'), index=False)
+    print(table.to_string(index=False, float_format=lambda v: '{:.4f}'.format(v)))
+    print('Matrix of {:d} cells on {:d} workers: {:.2f}s'.format(len(cells), num_workers, time.time() - begin))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,7 @@ logger = logging.getLogger('base')
 
 def make_lr(img, kernel, scale):
     # img : BXT C H W
-    weights = kernel.repeat((3, 1, 1, 1)).cuda()
+    weights = kernel.repeat((3, 1, 1, 1)).to(img)
     pad_func = torch.nn.ReflectionPad2d(kernel.size(-1) // 2)
 
     img = pad_func(img)
@@ -49,7 +49,7 @@ class LRimgestimator_Model(BaseModel):
 
         self.netE = networks.define_E(opt).to(self.device)
         if opt['dist']:
-            self.netE = DistributedDataParallel(self.netE, device_ids=[torch.cuda.current_device()])
+            self.netE = DistributedDataParallel(self.netE, device_ids=self.device_ids())
         else:
             self.netE = DataParallel(self.netE)
         self.load()
@@ -25,7 +25,7 @@ class SRModel(BaseModel):
         # define network and load pretrained models
         self.netG = networks.define_G(opt).to(self.device)
         if opt['dist']:
-            self.netG = DistributedDataParallel(self.netG, device_ids=[torch.cuda.current_device()])
+            self.netG = DistributedDataParallel(self.netG, device_ids=self.device_ids())
         else:
             self.netG = DataParallel(self.netG)
         # print network
@@ -26,7 +26,7 @@ class VideoBaseModel(BaseModel):
         # define network and load pretrained models
         self.netG = networks.define_G(opt).to(self.device)
         if opt['dist']:
-            self.netG = DistributedDataParallel(self.netG, device_ids=[torch.cuda.current_device()])
+            self.netG = DistributedDataParallel(self.netG, device_ids=self.device_ids())
         else:
             self.netG = DataParallel(self.netG)
         # print network
@@ -0,0 +1,461 @@
+from copy import deepcopy
+
+import torch
+import torch.nn as nn
+from torch.nn import functional as F
+from torch.nn.parallel import DistributedDataParallel
+
+from models.meta_sgd import InnerLearningRates, MetaSGD
+from models import lora
+
+
+def zero_optimizer_state(optimizer):
+    """Reset the per-parameter state of an optimizer in place (e.g. Adam moments)"""
+    for state in optimizer.state.values():
+        for k, v in state.items():
+            if torch.is_tensor(v):
+                v.zero_()
+            else:
+                state[k] = 0
+
+
+def build_inner_optimizer(param_groups, opt_maml):
+    # Learned per-parameter step sizes (Meta-SGD) replace the configured optimizer
+    if any('step_sizes' in group for group in param_groups):
+        return MetaSGD(param_groups)
+    if opt_maml['optimizer'] == 'Adam':
+        return torch.optim.Adam(param_groups, lr=param_groups[0]['lr'],
+                                betas=(opt_maml['beta1'], opt_maml['beta2']))
+    elif opt_maml['optimizer'] == 'SGD':
+        return torch.optim.SGD(param_groups, lr=param_groups[0]['lr'])
+    else:
+        raise NotImplementedError()
+
+
+# Named subsets of the VSR network adapted at test time, as module path prefixes
+ADAPT_GROUPS = {
+    # EDVR: TSA fusion only (as train.ft_tsa_only)
+    'ft_tsa_only': {'adapt': ['tsa_fusion']},
+    # DUF: first 3D convolution and dense blocks kept fixed (as train.freeze_front)
+    'freeze_front': {'freeze': ['conv3d_1', 'dense_block_1', 'dense_block_2', 'dense_block_3']},
+    # EDVR: reconstruction trunk and upsampling only
+    'recon_only': {'adapt': ['recon_trunk', 'upconv1', 'upconv2', 'HRconv', 'conv_last']},
+}
+
+
+def _match(name, prefixes):
+    if name.startswith('module.'):
+        name = name[7:]
+    return any(name == p or name.startswith(p + '.') for p in prefixes)
+
+
+def adapt_filter(opt_maml):
+    """
+    Parameter filter of the VSR network from the train.maml options: adapt_group (a key of
+    ADAPT_GROUPS), or explicit adapt_params / freeze_params lists of module path prefixes.
+
+    Return:
+        f(name) -> True when the parameter is adapted, or None to adapt everything
+    """
+    adapt, freeze = opt_maml['adapt_params'], opt_maml['freeze_params']
+    if opt_maml['adapt_group']:
+        if opt_maml['adapt_group'] not in ADAPT_GROUPS:
+            raise NotImplementedError('Adaptation group [{:s}] is not recognized.'.format(opt_maml['adapt_group']))
+        group = ADAPT_GROUPS[opt_maml['adapt_group']]
+        adapt, freeze = group.get('adapt', None), group.get('freeze', None)
+    if not adapt and not freeze:
+        return None
+
+    def is_adapted(name):
+        if adapt and not _match(name, adapt):
+            return False
+        return not (freeze and _match(name, freeze))
+    return is_adapted
+
+
+def _unwrap(net):
+    if isinstance(net, nn.DataParallel) or isinstance(net, DistributedDataParallel):
+        return net.module
+    return net
+
+
+class PrefixCache():
+    """Run the frozen prefix of the VSR network once and only its suffix per inner step.
+
+    Architectures opt in by defining prefix_modules, forward_prefix(x) and
+    forward_suffix(*prefix_outputs) (EDVR, DUF, TOF). The cache is only valid when none of
+    the prefix parameters is adapted, no prefix module normalizes with batch statistics
+    (BatchNorm in train mode, as in the DUF dense blocks and the TOF SpyNet) and the input of
+    the network does not change between inner steps (real SLR inputs or a fixed estimator).
+
+    Args:
+        net (nn.Module): working copy of the VSR network
+    """
+
+    def __init__(self, net):
+        self.net = _unwrap(net)
+
+    @staticmethod
+    def batch_statistics(net):
+        """Prefix modules of net in train mode BatchNorm. Their output depends on the batch and
+        every forward updates their running stats, so the prefix is not constant over the steps."""
+        net = _unwrap(net)
+        return [k for k, m in net.named_modules()
+                if _match(k, net.prefix_modules) and isinstance(m, nn.modules.batchnorm._BatchNorm) and m.training]
+
+    @staticmethod
+    def supported(net, is_adapted):
+        """True when net has a prefix, is_adapted (see adapt_filter) freezes all of it and
+        none of its buffers changes in the forward (see batch_statistics)"""
+        net = _unwrap(net)
+        if is_adapted is None or not hasattr(net, 'forward_prefix'):
+            return False
+        if PrefixCache.batch_statistics(net):
+            return False
+        return not any(_match(k, net.prefix_modules) and is_adapted(k) for k, _ in net.named_parameters())
+
+    def prepare(self, x):
+        """Prefix activations of x, computed without autograd"""
+        with torch.no_grad():
+            return self.net.forward_prefix(x)
+
+    def forward(self, prefix):
+        return self.net.forward_suffix(*prefix)
+
+
+class AdaptationSession():
+    """Reusable working copy of the networks adapted in the inner loop.
+
+    The meta networks are deep-copied once. The floating point parameters and buffers of
+    the copies are then re-pointed into one flat buffer, so resetting them to the meta
+    weights is a single in-place copy from a preallocated snapshot. The inner optimizer is
+    built once and its state is zeroed on every reset.
+
+    Args:
+        meta_nets (list [nn.Module]): meta-learned networks, e.g. [model.netG, est_model.netE]
+        lrs (list [float]): inner learning rate of each network, None to keep it fixed, or
+            InnerLearningRates for learned per-parameter step sizes (Meta-SGD)
+        opt_maml (dict): train.maml options (optimizer, beta1, beta2)
+        filters (list): per network, None or f(name) -> bool selecting the adapted
+            parameters (see adapt_filter). The others are frozen in the working copy, so
+            autograd does not record the modules that only depend on frozen tensors.
+        adapters (list): per network, None or a list of module path prefixes ([] for the
+            lora_modules of the architecture) given low-rank adapters (opt_maml lora_rank,
+            lora_alpha). Only the adapters of that network are then adapted.
+    """
+
+    def __init__(self, meta_nets, lrs, opt_maml, filters=None, adapters=None):
+        self.meta_nets = meta_nets
+        self.nets = [deepcopy(net) for net in meta_nets]
+        filters = list(filters) if filters else [None] * len(self.nets)
+        for i, (net, modules) in enumerate(zip(self.nets, adapters if adapters else [None] * len(self.nets))):
+            if modules is None:
+                continue
+            if not lora.attach_lora(net, opt_maml['lora_rank'], opt_maml['lora_alpha'], modules if modules else None):
+                raise NotImplementedError('No convolution to attach low-rank adapters to in [{:s}].'.format(
+                    _unwrap(net).__class__.__name__))
+            filters[i] = lora.is_lora_param
+        for net, is_adapted in zip(self.nets, filters):
+            if is_adapted is not None:
+                for k, v in net.named_parameters():
+                    if not is_adapted(k):
+                        v.requires_grad_(False)
+
+        param_groups = []
+        for net, lr in zip(self.nets, lrs):
+            if lr is None:
+                continue
+            named = [(k, v) for k, v in net.named_parameters() if v.requires_grad]
+            if isinstance(lr, InnerLearningRates):
+                param_groups.append({'params': [v for _, v in named], 'lr': 0.,
+                                     'step_sizes': [lr.get(k) for k, _ in named]})
+            else:
+                param_groups.append({'params': [v for _, v in named], 'lr': lr})
+
+        # Pair every working tensor with its meta counterpart, by name. The adapters have
+        # none (meta_t is None) and are reset to their initial values.
+        self.flat_pairs, self.other_pairs = [], []
+        for net, meta_net in zip(self.nets, meta_nets):
+            meta_tensors = dict(meta_net.named_parameters())
+            meta_tensors.update(meta_net.named_buffers())
+            pairs = [(t, meta_tensors.get(k, None)) for k, t in net.named_parameters()]
+            pairs += [(t, meta_tensors.get(k, None)) for k, t in net.named_buffers()]
+            for t, meta_t in pairs:
+                if t.is_floating_point():
+                    self.flat_pairs.append((t, meta_t))
+                else:
+                    self.other_pairs.append((t, meta_t))
+
+        with torch.no_grad():
+            self.flat = torch.cat([t.detach().reshape(-1) for t, _ in self.flat_pairs])
+            offset = 0
+            for t, _ in self.flat_pairs:
+                n = t.numel()
+                t.data = self.flat[offset:offset + n].view_as(t)
+                offset += n
+            self.snapshot = self.flat.clone()
+            self.other_snapshot = [(t if meta_t is None else meta_t).detach().clone() for t, meta_t in self.other_pairs]
+
+        self.optimizer = build_inner_optimizer(param_groups, opt_maml)
+
+    def capture(self):
+        """Take a new snapshot of the meta weights (after they have been updated)"""
+        with torch.no_grad():
+            offset = 0
+            for t, meta_t in self.flat_pairs:
+                n = t.numel()
+                if meta_t is not None:
+                    self.snapshot[offset:offset + n].copy_(meta_t.reshape(-1))
+                offset += n
+            for snap, (_, meta_t) in zip(self.other_snapshot, self.other_pairs):
+                if meta_t is not None:
+                    snap.copy_(meta_t)
+
+    def reset(self, capture=False):
+        """Restore the working networks to the meta weights and clear the optimizer state"""
+        if capture:
+            self.capture()
+        with torch.no_grad():
+            self.flat.copy_(self.snapshot)
+            for snap, (t, _) in zip(self.other_snapshot, self.other_pairs):
+                t.copy_(snap)
+        self.optimizer.zero_grad()
+        zero_optimizer_state(self.optimizer)
+
+    def merged(self):
+        """Context in which the low-rank adapters are merged into the working weights, for
+        the final forward (no-op without adapters)"""
+        return lora.merged(self.nets)
+
+    def delta(self):
+        """Difference between the working and the meta weights, as one flat CPU tensor"""
+        return (self.flat - self.snapshot).detach().cpu()
+
+    def apply_delta(self, delta):
+        """Start from the meta weights plus delta (e.g. from a WarmStartBank)"""
+        with torch.no_grad():
+            self.flat.copy_(self.snapshot).add_(delta.to(self.flat))
+        self.optimizer.zero_grad()
+        zero_optimizer_state(self.optimizer)
+
+    def warm_start(self, decay=0.):
+        """Keep the current adapted weights as the next starting point, optionally decayed
+        toward the meta weights (decay=0: keep as is, decay=1: same as reset)"""
+        if decay > 0:
+            with torch.no_grad():
+                self.flat.lerp_(self.snapshot, decay)
+        self.optimizer.zero_grad()
+        zero_optimizer_state(self.optimizer)
+
+
+class EarlyStopping():
+    """Stop the inner loop once the SLR loss has plateaued.
+
+    A step counts as stalled when the loss improved by less than delta (absolute) or less
+    than rel (relative to the previous loss). The loop stops after patience consecutive
+    stalled steps, but never before min_steps.
+
+    Args:
+        delta (float): absolute loss improvement threshold, None to disable
+        rel (float): relative loss improvement threshold, None to disable
+        min_steps (int): number of steps always taken
+        patience (int): stalled steps tolerated before stopping
+    """
+
+    def __init__(self, delta=None, rel=None, min_steps=1, patience=1):
+        self.delta = delta
+        self.rel = rel
+        self.min_steps = min_steps
+        self.patience = patience
+        self.reset()
+
+    def reset(self):
+        self.prev_loss = None
+        self.num_steps = 0
+        self.num_stalled = 0
+
+    def step(self, loss):
+        """Record the loss of one step and return True when the loop should stop"""
+        self.num_steps += 1
+        if self.prev_loss is not None:
+            improvement = self.prev_loss - loss
+            stalled = False
+            if self.delta is not None and improvement < self.delta:
+                stalled = True
+            if self.rel is not None and improvement < self.rel * abs(self.prev_loss):
+                stalled = True
+            self.num_stalled = self.num_stalled + 1 if stalled else 0
+        self.prev_loss = loss
+        return self.num_steps >= self.min_steps and self.num_stalled >= self.patience
+
+
+def degradation_signature(LQs, slr):
+    """
+    Cheap descriptor of the degradation of a window, from the residual between the SLR
+    estimate of the fixed estimator and a plain bicubic downscale of the same frames.
+
+    Args:
+        LQs: (B=1) x T x C x H x W input window
+        slr: (B=1) x T x C x h x w SLR target of the window (e.g. SLRCache.get)
+
+    Return:
+        1-D tensor: per channel mean / std of the residual, and the ratio of the
+        gradient energy of the SLR frames to the one of the bicubic frames
+    """
+    slr = slr.reshape(-1, *slr.shape[-3:]).float()
+    LQs = LQs.reshape(-1, *LQs.shape[-3:]).to(slr.device).float()
+    bic = F.interpolate(LQs, size=slr.shape[-2:], mode='bicubic', align_corners=False)
+    residual = slr - bic
+
+    def grad_energy(x):
+        return (x[..., 1:, :] - x[..., :-1, :]).abs().mean() + (x[..., :, 1:] - x[..., :, :-1]).abs().mean()
+
+    ratio = grad_energy(slr) / (grad_energy(bic) + 1e-8)
+    residual = residual.transpose(0, 1).reshape(residual.size(1), -1)
+    return torch.cat([residual.mean(dim=1), residual.std(dim=1), ratio.view(1)])
+
+
+class DriftMonitor():
+    """Decide when to re-adapt from the drift of the degradation signature.
+
+    The signature of every frame is (optionally) smoothed with an exponential moving
+    average and compared to the reference signature taken at the last adaptation. The
+    drift is the relative L2 distance between the two.
+
+    Args:
+        threshold (float): drift above which the networks are adapted again
+        momentum (float): EMA momentum of the tracked signature, 0 to disable smoothing
+    """
+
+    def __init__(self, threshold, momentum=0.):
+        self.threshold = threshold
+        self.momentum = momentum
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.current = None
+        self.drift = 0.
+
+    def update(self, signature):
+        """Track the signature of a new frame and return True when it has drifted"""
+        signature = signature.detach()
+        if self.current is None or self.momentum <= 0:
+            self.current = signature.clone()
+        else:
+            self.current.mul_(self.momentum).add_((1 - self.momentum) * signature)
+        if self.reference is None:
+            self.drift = float('inf')
+            return True
+        self.drift = ((self.current - self.reference).norm() / (self.reference.norm() + 1e-8)).item()
+        return self.drift > self.threshold
+
+    def anchor(self):
+        """Use the current signature as reference, after the networks have been adapted"""
+        self.reference = self.current.clone()
+
+
+def batched_adaptation_available():
+    """torch.func (PyTorch >= 2.0) is needed to vectorize the inner loop over frames"""
+    return hasattr(torch, 'func') and hasattr(torch.func, 'vmap')
+
+
+class BatchedAdaptation():
+    """Adapt several frames concurrently, each with its own copy of the adapted weights.
+
+    The adapted parameters (and the buffers, e.g. BatchNorm statistics) are stacked along a
+    new leading frame dimension and the networks are called with torch.func.functional_call
+    under torch.func.vmap, so the per-frame convolutions run as larger batched kernels.
+    Adam and SGD are element-wise, so a single optimizer over the stacked tensors behaves
+    exactly like one inner optimizer per frame.
+
+    Custom autograd functions without a vmap rule (e.g. the DCN of EDVR) are not supported.
+
+    Args:
+        meta_nets (list [nn.Module]): meta-learned networks, e.g. [model.netG, est_model.netE]
+        lrs (list [float]): inner learning rate of each network, None to keep it fixed
+        opt_maml (dict): train.maml options (optimizer, beta1, beta2)
+        batch_size (int): maximum number of frames adapted together
+        filters (list): per network, None or f(name) -> bool selecting the adapted parameters
+    """
+
+    def __init__(self, meta_nets, lrs, opt_maml, batch_size, filters=None):
+        if not batched_adaptation_available():
+            raise NotImplementedError('Batched adaptation requires torch.func (PyTorch >= 2.0).')
+        self.batch_size = batch_size
+        self.nets = [_unwrap(net) for net in meta_nets]
+
+        # Per network: functional state, vmap in_dims and (stacked, meta) pairs to reset from
+        self.states, self.in_dims, self.pairs = [], [], []
+        param_groups = []
+        filters = filters if filters else [None] * len(self.nets)
+        for net, lr, is_adapted in zip(self.nets, lrs, filters):
+            state, in_dims, adapted = {}, {}, []
+            for k, v in net.named_parameters():
+                if lr is not None and v.requires_grad and (is_adapted is None or is_adapted(k)):
+                    state[k] = self._stack(v).requires_grad_()
+                    in_dims[k] = 0
+                    adapted.append(state[k])
+                    self.pairs.append((state[k], v))
+                else:
+                    state[k] = v.detach()
+                    in_dims[k] = None
+            for k, v in net.named_buffers():
+                state[k] = self._stack(v)
+                in_dims[k] = 0
+                self.pairs.append((state[k], v))
+            self.states.append(state)
+            self.in_dims.append(in_dims)
+            if adapted:
+                param_groups.append({'params': adapted, 'lr': lr})
+
+        self.optimizer = build_inner_optimizer(param_groups, opt_maml)
+
+    def _stack(self, t):
+        return t.detach().unsqueeze(0).repeat(self.batch_size, *([1] * t.dim())).contiguous()
+
+    def reset(self):
+        """Restore every frame slot to the meta weights and clear the optimizer state"""
+        with torch.no_grad():
+            for stacked, meta_t in self.pairs:
+                stacked.copy_(meta_t.unsqueeze(0).expand_as(stacked))
+        self.optimizer.zero_grad()
+        zero_optimizer_state(self.optimizer)
+
+    def params(self, n):
+        """Functional state of the first n frame slots, one dict per network"""
+        return [{k: v[:n] if in_dims[k] == 0 else v for k, v in state.items()}
+                for state, in_dims in zip(self.states, self.in_dims)]
+
+    def call(self, i):
+        """Functional form of network i: f(state, *inputs)"""
+        net = self.nets[i]
+
+        def f(state, *inputs):
+            return torch.func.functional_call(net, state, inputs)
+        return f
+
+    def step(self, loss_fn, inputs, n):
+        """
+        One inner step for n frames.
+
+        Args:
+            loss_fn: loss of a single frame, loss_fn(states, *frame_inputs) -> scalar
+            inputs (list [Tensor]): per-frame inputs stacked along dim 0
+        """
+        self.optimizer.zero_grad()
+        losses = torch.func.vmap(loss_fn, in_dims=(self.in_dims,) + (0,) * len(inputs),
+                                 randomness='same')(self.params(n), *inputs)
+        losses.sum().backward()
+        self.optimizer.step()
+        return losses.detach()
+
+    def forward(self, i, inputs, n):
+        """Evaluation forward of network i, each frame with its own adapted weights"""
+        net = self.nets[i]
+        net.eval()
+        with torch.no_grad():
+            output = torch.func.vmap(self.call(i), in_dims=(self.in_dims[i],) + (0,) * len(inputs))(
+                self.params(n)[i], *inputs)
+        net.train()
+        return output
@@ -142,6 +142,11 @@ class DUF_16L(nn.Module):
         self.scale = scale
         self.adapt_official = adapt_official
 
+    # Modules run by forward_prefix, see models.adaptation.PrefixCache
+    prefix_modules = ['conv3d_1', 'dense_block_1', 'dense_block_2']
+    # Convolutions given low-rank adapters, see models.lora
+    lora_modules = ['conv3d_2', 'conv3d_r1', 'conv3d_r2', 'conv3d_f1', 'conv3d_f2']
+
     def forward(self, x):
         '''
         x: [B, T, C, H, W], T = 7. reshape to [B, C, T, H, W] for Conv3D
@@ -149,13 +154,22 @@ class DUF_16L(nn.Module):
         Fx: [B, 25, 16, H, W] for DynamicUpsamplingFilter_3C
         Rx: [B, 3*16, 1, H, W]
         '''
+        return self.forward_suffix(*self.forward_prefix(x))
+
+    def forward_prefix(self, x):
+        '''3D convolution and dense blocks
+        x: [B, T, C, H, W] -> features [B, C', 1, H, W] and center frame [B, C, H, W]'''
         B, T, C, H, W = x.size()
         x = x.permute(0, 2, 1, 3, 4)  # [B, C, T, H, W] for Conv3D
         x_center = x[:, :, T // 2, :, :]
-
         x = self.conv3d_1(x)
         x = self.dense_block_1(x)
         x = self.dense_block_2(x)  # reduce T to 1
+        return x, x_center
+
+    def forward_suffix(self, x, x_center):
+        '''Filter and residual generation from the outputs of forward_prefix'''
+        B, _, _, H, W = x.size()
         x = F.relu(self.conv3d_2(F.relu(self.bn3d_2(x), inplace=True)), inplace=True)
 
         # image residual
@@ -173,7 +187,6 @@ class DUF_16L(nn.Module):
         out = self.dynamic_filter(x_center, Fx)  # [B, 3*R, H, W]
         out += Rx.squeeze_(2)
         out = F.pixel_shuffle(out, self.scale)  # [B, 3, H, W]
-
         return out
 
 
@@ -239,6 +252,11 @@ class DUF_28L(nn.Module):
         self.scale = scale
         self.adapt_official = adapt_official
 
+    # Modules run by forward_prefix, see models.adaptation.PrefixCache
+    prefix_modules = ['conv3d_1', 'dense_block_1', 'dense_block_2']
+    # Convolutions given low-rank adapters, see models.lora
+    lora_modules = ['conv3d_2', 'conv3d_r1', 'conv3d_r2', 'conv3d_f1', 'conv3d_f2']
+
     def forward(self, x):
         '''
         x: [B, T, C, H, W], T = 7. reshape to [B, C, T, H, W] for Conv3D
@@ -246,12 +264,22 @@ class DUF_28L(nn.Module):
         Fx: [B, 25, 16, H, W] for DynamicUpsamplingFilter_3C
         Rx: [B, 3*16, 1, H, W]
         '''
+        return self.forward_suffix(*self.forward_prefix(x))
+
+    def forward_prefix(self, x):
+        '''3D convolution and dense blocks
+        x: [B, T, C, H, W] -> features [B, C', 1, H, W] and center frame [B, C, H, W]'''
         B, T, C, H, W = x.size()
-        x = x.permute(0, 2, 1, 3, 4)  # [B,C,T,H,W] for Conv3D
+        x = x.permute(0, 2, 1, 3, 4)  # [B, C, T, H, W] for Conv3D
         x_center = x[:, :, T // 2, :, :]
         x = self.conv3d_1(x)
         x = self.dense_block_1(x)
         x = self.dense_block_2(x)  # reduce T to 1
+        return x, x_center
+
+    def forward_suffix(self, x, x_center):
+        '''Filter and residual generation from the outputs of forward_prefix'''
+        B, _, _, H, W = x.size()
         x = F.relu(self.conv3d_2(F.relu(self.bn3d_2(x), inplace=True)), inplace=True)
 
         # image residual
@@ -335,6 +363,11 @@ class DUF_52L(nn.Module):
         self.scale = scale
         self.adapt_official = adapt_official
 
+    # Modules run by forward_prefix, see models.adaptation.PrefixCache
+    prefix_modules = ['conv3d_1', 'dense_block_1', 'dense_block_2']
+    # Convolutions given low-rank adapters, see models.lora
+    lora_modules = ['conv3d_2', 'conv3d_r1', 'conv3d_r2', 'conv3d_f1', 'conv3d_f2']
+
     def forward(self, x):
         '''
         x: [B, T, C, H, W], T = 7. reshape to [B, C, T, H, W] for Conv3D
@@ -342,12 +375,22 @@ class DUF_52L(nn.Module):
         Fx: [B, 25, 16, H, W] for DynamicUpsamplingFilter_3C
         Rx: [B, 3*16, 1, H, W]
         '''
+        return self.forward_suffix(*self.forward_prefix(x))
+
+    def forward_prefix(self, x):
+        '''3D convolution and dense blocks
+        x: [B, T, C, H, W] -> features [B, C', 1, H, W] and center frame [B, C, H, W]'''
         B, T, C, H, W = x.size()
-        x = x.permute(0, 2, 1, 3, 4)  # [B,C,T,H,W] for Conv3D
+        x = x.permute(0, 2, 1, 3, 4)  # [B, C, T, H, W] for Conv3D
         x_center = x[:, :, T // 2, :, :]
         x = self.conv3d_1(x)
         x = self.dense_block_1(x)
-        x = self.dense_block_2(x)
+        x = self.dense_block_2(x)  # reduce T to 1
+        return x, x_center
+
+    def forward_suffix(self, x, x_center):
+        '''Filter and residual generation from the outputs of forward_prefix'''
+        B, _, _, H, W = x.size()
         x = F.relu(self.conv3d_2(F.relu(self.bn3d_2(x), inplace=True)), inplace=True)
 
         # image residual
@@ -251,7 +251,20 @@ class EDVR(nn.Module):
         #### activation function
         self.lrelu = nn.LeakyReLU(negative_slope=0.1, inplace=True)
 
+    # Modules run by forward_prefix, see models.adaptation.PrefixCache
+    prefix_modules = ['pre_deblur', 'conv_1x1', 'conv_first_1', 'conv_first_2', 'conv_first_3', 'conv_first',
+                      'feature_extraction', 'fea_L2_conv1', 'fea_L2_conv2', 'fea_L3_conv1', 'fea_L3_conv2',
+                      'pcd_align', 'tsa_fusion']
+    # Convolutions given low-rank adapters, see models.lora (after the prefix, so that the
+    # prefix cache still applies)
+    lora_modules = ['recon_trunk', 'upconv1', 'upconv2', 'HRconv', 'conv_last']
+
     def forward(self, x):
+        return self.forward_suffix(*self.forward_prefix(x))
+
+    def forward_prefix(self, x):
+        '''Feature extraction, PCD alignment and TSA fusion
+        x: [B, N, C, H, W] -> fused features [B, nf, H, W] and center frame [B, C, H, W]'''
         B, N, C, H, W = x.size()  # N video frames
         x_center = x[:, self.center, :, :, :].contiguous()
 
@@ -299,6 +312,10 @@ class EDVR(nn.Module):
         if not self.w_TSA:
             aligned_fea = aligned_fea.view(B, -1, H, W)
         fea = self.tsa_fusion(aligned_fea)
+        return fea, x_center
+
+    def forward_suffix(self, fea, x_center):
+        '''Reconstruction and upsampling from the outputs of forward_prefix'''
         out = self.recon_trunk(fea)
         if self.scale == 4:
             out = self.lrelu(self.pixel_shuffle(self.upconv1(out)))
@@ -105,12 +105,23 @@ class TOFlow(nn.Module):
 
         self.adapt_official = adapt_official  # True if using translated official weights else False
 
+    # Modules run by forward_prefix, see models.adaptation.PrefixCache
+    prefix_modules = ['SpyNet']
+    # Convolutions given low-rank adapters, see models.lora
+    lora_modules = ['conv_3x7_64_9x9', 'conv_64_64_9x9', 'conv_64_64_1x1', 'conv_64_3_1x1']
+
     def forward(self, x):
         """
         input: x: input frames - [B, 7, 3, H, W]
         output: SR reference frame - [B, 3, H, W]
         """
+        return self.forward_suffix(*self.forward_prefix(x))
 
+    def forward_prefix(self, x):
+        """
+        Flow estimation and warping
+        output: warped frames - [B, 7 * 3, H, W], normalized reference frame - [B, 3, H, W]
+        """
         B, T, C, H, W = x.size()
         x = normalize(x.view(-1, C, H, W)).view(B, T, C, H, W)
 
@@ -130,8 +141,10 @@ class TOFlow(nn.Module):
                 flow = self.SpyNet(x_ref, x_nbr).permute(0, 2, 3, 1)
                 x_warped.append(flow_warp(x_nbr, flow))
         x_warped = torch.stack(x_warped, dim=1)
+        return x_warped.view(B, -1, H, W), x_ref
 
-        x = x_warped.view(B, -1, H, W)
+    def forward_suffix(self, x, x_ref):
+        """SR network on the outputs of forward_prefix"""
         x = self.relu(self.conv_3x7_64_9x9(x))
         x = self.relu(self.conv_64_64_9x9(x))
         x = self.relu(self.conv_64_64_1x1(x))
@@ -7,7 +7,11 @@ from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.nn.modules.utils import _pair
 
-from . import deform_conv_cuda
+try:
+    from . import deform_conv_cuda
+except ImportError:
+    # CPU-only (or unbuilt) installs run torchvision.ops.deform_conv2d instead
+    deform_conv_cuda = None
 
 logger = logging.getLogger('base')
 
@@ -154,8 +158,31 @@ class ModulatedDeformConvFunction(Function):
         return n, channels_out, height_out, width_out
 
 
-deform_conv = DeformConvFunction.apply
-modulated_deform_conv = ModulatedDeformConvFunction.apply
+def _torchvision_deform_conv(input, offset, weight, bias, stride, padding, dilation, mask=None):
+    """Same offset / mask layout as the CUDA extension, groups are inferred from the shapes"""
+    try:
+        from torchvision.ops import deform_conv2d
+    except ImportError:
+        raise NotImplementedError('Deformable convolution needs the compiled DCN extension (CUDA) '
+                                  'or torchvision >= 0.9.')
+    return deform_conv2d(input, offset, weight, bias, stride=_pair(stride), padding=_pair(padding),
+                         dilation=_pair(dilation), mask=mask)
+
+
+def deform_conv(input, offset, weight, stride=1, padding=0, dilation=1, groups=1,
+                deformable_groups=1, im2col_step=64):
+    if input.is_cuda and deform_conv_cuda is not None:
+        return DeformConvFunction.apply(input, offset, weight, stride, padding, dilation, groups,
+                                        deformable_groups, im2col_step)
+    return _torchvision_deform_conv(input, offset, weight, None, stride, padding, dilation)
+
+
+def modulated_deform_conv(input, offset, mask, weight, bias=None, stride=1, padding=0, dilation=1,
+                          groups=1, deformable_groups=1):
+    if input.is_cuda and deform_conv_cuda is not None:
+        return ModulatedDeformConvFunction.apply(input, offset, mask, weight, bias, stride, padding,
+                                                 dilation, groups, deformable_groups)
+    return _torchvision_deform_conv(input, offset, weight, bias, stride, padding, dilation, mask=mask)
 
 
 class DeformConv(nn.Module):
@@ -3,16 +3,22 @@ from collections import OrderedDict
 import torch
 import torch.nn as nn
 from torch.nn.parallel import DistributedDataParallel
+from models import weight_registry
 
 
 class BaseModel():
     def __init__(self, opt):
         self.opt = opt
-        self.device = torch.device('cuda' if opt['gpu_ids'] is not None else 'cpu')
+        # Resolved by options.parse (cpu / gpu_ids)
+        self.device = torch.device(opt['device'] if opt['device'] else ('cuda' if opt['gpu_ids'] is not None else 'cpu'))
         self.is_train = opt['is_train']
         self.schedulers = []
         self.optimizers = []
 
+    def device_ids(self):
+        # DistributedDataParallel runs on the current GPU, or on the CPU without device ids
+        return [torch.cuda.current_device()] if self.device.type == 'cuda' else None
+
     def feed_data(self, data):
         pass
 
@@ -84,7 +90,7 @@ class BaseModel():
     def load_network(self, load_path, network, strict=True):
         if isinstance(network, nn.DataParallel) or isinstance(network, DistributedDataParallel):
             network = network.module
-        load_net = torch.load(load_path)
+        load_net = torch.load(load_path, map_location=lambda storage, loc: storage)
         load_net_clean = OrderedDict()  # remove unnecessary 'module.'
         for k, v in load_net.items():
             if k.startswith('module.'):
@@ -93,6 +99,11 @@ class BaseModel():
                 load_net_clean[k] = v
         network.load_state_dict(load_net_clean, strict=strict)
 
+    def restore_network(self, load_path, network, strict=True):
+        """Same as load_network, but the checkpoint is decoded once per process and
+        copied into the network in place on every later call"""
+        weight_registry.restore(network, load_path, strict=strict)
+
 
     def save_training_state(self, epoch, iter_step, model_type=None):
         """Save training state during training, which will be used for resuming"""
@@ -0,0 +1,530 @@
+"""Test-time adaptation and super-resolution with models kept in memory
+
+DynaVSRRunner builds the meta-learned VSR network, the estimators and the adaptation
+session once, and then adapts and upscales any number of windows or clips. It is used by
+test_dynavsr.py and can be imported by other programs:
+
+    runner = DynaVSRRunner('options/test/EDVR/EDVR_R.yml')
+    for sr in runner.upscale_clip(frames):
+        ...
+"""
+import itertools
+
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+import options.options as option
+from data import util as data_util
+from data.meta_learner import preprocessing
+from models import create_model, weight_registry
+from models.slr_cache import SLRCache, cacheable as slr_cacheable
+from models.adaptation import AdaptationSession, EarlyStopping, DriftMonitor, PrefixCache, \
+    adapt_filter, degradation_signature
+from models.lora import is_lora_param
+from models.meta_sgd import InnerLearningRates
+from models.memory_planner import GB, MemoryPlanner, available_memory, enable_checkpointing
+from utils import util
+from utils.telemetry import StageTimer
+
+
+class DynaVSRRunner():
+    """
+    Args:
+        opt (dict or str): parsed test options, or the path of an option YAML file
+        frame_shape (tuple): (T, C, H, W) of the input windows, used by the memory planner.
+            When None, the plan is made on the first adapted window.
+        reference (bool): also build the bicubic-trained VSR network (model_fixed), used
+            for the reference results of test_dynavsr.py
+        shared_weights (dict): state_dicts in shared memory (see weight_registry.share) for
+            'G', 'E', 'bicubic_G' and 'fixed_E'. The networks are bound to them instead of
+            keeping their own copy, only the adapted working copies are allocated.
+    """
+
+    def __init__(self, opt, frame_shape=None, reference=False, shared_weights=None):
+        if isinstance(opt, str):
+            opt = option.dict_to_nonedict(option.parse(opt, is_train=False))
+        self.opt = opt
+        maml_opt = opt['train']['maml']
+        val_opt = opt['datasets']['val']
+        self.scale = opt['scale']
+        self.N_frames = val_opt['N_frames']
+        self.padding = val_opt['padding'] if val_opt['padding'] else 'new_info'
+        self.center_idx = self.N_frames // 2
+        self.use_real = opt['train']['use_real']
+        self.upsample_input = opt['network_G']['which_model_G'] == 'TOF'
+
+        #### create model
+        build_opt = opt
+        if shared_weights is not None:
+            # The networks are bound to the shared weights below, so no checkpoint is read
+            build_opt = option.NoneDict(opt)
+            build_opt['path'] = option.NoneDict(opt['path'], pretrain_model_G=None, pretrain_model_E=None)
+        self.model, self.est_model = create_model(build_opt)
+        self.modelcp, self.est_modelcp = create_model(build_opt)
+        self.model_fixed, self.est_model_fixed = create_model(build_opt)
+        if shared_weights is None:
+            if reference:
+                # Baseline VSR network, only used for the bicubic-trained reference results
+                self.model_fixed.restore_network(opt['path']['bicubic_G'], self.model_fixed.netG)
+            # The fixed estimator never changes, so load it once and cache its SLR targets per clip
+            self.est_model_fixed.load_network(opt['path']['fixed_E'], self.est_model_fixed.netE)
+        else:
+            bound = [(self.model.netG, 'G'), (self.est_model.netE, 'E'), (self.est_model_fixed.netE, 'fixed_E')]
+            if reference:
+                bound.append((self.model_fixed.netG, 'bicubic_G'))
+            for net, key in bound:
+                weight_registry.bind(net, shared_weights[key])
+        self.slr_cache = SLRCache(self.est_model_fixed, self.N_frames, padding=self.padding,
+                                  share_frames=(val_opt['mode'] == 'demo' or val_opt['degradation_mode'] == 'set'),
+                                  enabled=slr_cacheable(val_opt))
+
+        self.lr_alpha = maml_opt['lr_alpha']
+        # Subset of G adapted in the inner loop (adapt_group / adapt_params / freeze_params),
+        # or only the low-rank adapters attached to its lora_modules (lora_rank)
+        self.lora = bool(maml_opt['lora_rank'])
+        self.filter_G = is_lora_param if self.lora else adapt_filter(maml_opt)
+        # With a subset, G gets a detached input so that backward stops at its first adapted
+        # layer; the estimator is then adapted through the SLR loss only
+        self.detach_G_input = self.filter_G is not None and maml_opt['subset_detach_input'] is not False
+        # The estimator is adapted jointly unless real SLR inputs are used or adapt_estimator is false
+        self.adapt_E = not self.use_real and maml_opt['adapt_estimator'] is not False
+        # One working copy of G/E, reset to the meta weights before each adaptation
+        lr_G, lr_E = self.lr_alpha, self.lr_alpha if self.adapt_E else None
+        # Meta-SGD: per-parameter step sizes saved next to the G/E checkpoints ({iter}_G_lr.pth)
+        self.meta_sgd = maml_opt['meta_sgd']
+        if self.meta_sgd and self.lora:
+            raise NotImplementedError('Meta-SGD step sizes are not learned for low-rank adapters (lora_rank).')
+        if self.meta_sgd:
+            lr_G = InnerLearningRates(self.model.netG, self.lr_alpha,
+                                      per_layer=self.meta_sgd == 'layer').to(self.model.device)
+            self.model.load_network(opt['path']['pretrain_model_G_lr'] if opt['path']['pretrain_model_G_lr']
+                                    else opt['path']['pretrain_model_G'].replace('.pth', '_lr.pth'), lr_G)
+            if self.adapt_E:
+                lr_E = InnerLearningRates(self.est_model.netE, self.lr_alpha,
+                                          per_layer=self.meta_sgd == 'layer').to(self.est_model.device)
+                self.est_model.load_network(opt['path']['pretrain_model_E_lr'] if opt['path']['pretrain_model_E_lr']
+                                            else opt['path']['pretrain_model_E'].replace('.pth', '_lr.pth'), lr_E)
+        self.session = AdaptationSession([self.model.netG, self.est_model.netE], [lr_G, lr_E],
+                                         maml_opt, filters=[self.filter_G, None],
+                                         adapters=[(maml_opt['lora_modules'] or []) if self.lora else None, None])
+        self.modelcp.netG, self.est_modelcp.netE = self.session.nets
+        self.inner_optimizer = self.session.optimizer
+
+        # Tiling for high resolution frames: the final forward runs on overlapping tile_size
+        # tiles (LR pixels) blended together, and the inner loss on num_adapt_tiles random
+        # adapt_tile tiles of each window
+        self.tile_size = maml_opt['tile_size']
+        self.tile_overlap = maml_opt['tile_overlap'] if maml_opt['tile_overlap'] is not None else 16
+        self.adapt_tile = maml_opt['adapt_tile']
+        self.num_adapt_tiles = maml_opt['num_adapt_tiles'] if maml_opt['num_adapt_tiles'] else 1
+        # Self ensemble of the final forward (4: flips, 8: flips and transposes), the
+        # transformed windows run as one batch of at most ensemble_batch windows
+        self.self_ensemble = maml_opt['self_ensemble']
+        self.ensemble_batch = maml_opt['ensemble_batch']
+
+        # Memory budget (GB, or auto): pick patches / activation checkpointing that fit
+        self.plan = None
+        self.plan_pending = bool(maml_opt['memory_budget'])
+        if self.plan_pending and frame_shape is not None:
+            self.plan_memory(frame_shape)
+
+        self.update_step = maml_opt['adapt_iter']
+        # Early stopping: adapt_iter becomes a per-window ceiling, which can be raised with
+        # max_adapt_iter, and the inner loop stops once the SLR loss plateaus
+        self.early_stopping = None
+        if maml_opt['early_stop']:
+            self.early_stopping = EarlyStopping(delta=maml_opt['stop_delta'], rel=maml_opt['stop_rel'],
+                                                min_steps=maml_opt['min_adapt_iter'] if maml_opt['min_adapt_iter'] else 1,
+                                                patience=maml_opt['stop_patience'] if maml_opt['stop_patience'] else 1)
+            if maml_opt['max_adapt_iter']:
+                self.update_step = maml_opt['max_adapt_iter']
+
+        # Frozen-prefix caching: the input of G is constant over the inner steps when the estimator
+        # is not adapted, so the frozen prefix (e.g. EDVR up to TSA) runs once per window.
+        # With use_patch the crops are then drawn once per window instead of once per step,
+        # which has to be allowed with prefix_cache_fixed_crops
+        self.prefix_cache = None
+        if maml_opt['prefix_cache']:
+            if self.adapt_E:
+                print('prefix_cache needs a fixed estimator (use_real or adapt_estimator: false). Running the full network.')
+            elif maml_opt['use_patch'] and not maml_opt['prefix_cache_fixed_crops']:
+                print('prefix_cache with use_patch draws the crops once per window, set prefix_cache_fixed_crops '
+                      'to allow it. Running the full network.')
+            elif PrefixCache.batch_statistics(self.modelcp.netG):
+                print('prefix_cache needs a prefix without BatchNorm in train mode ({}). Running the full network.'.format(
+                    PrefixCache.batch_statistics(self.modelcp.netG)[0]))
+            elif not PrefixCache.supported(self.modelcp.netG, self.filter_G):
+                print('prefix_cache needs every prefix module of G frozen (adapt_group / adapt_params). Running the full network.')
+            else:
+                self.prefix_cache = PrefixCache(self.modelcp.netG)
+
+        # Stage timings (see utils.telemetry), disabled unless a caller enables them
+        self.timer = StageTimer(self.modelcp.device, enabled=False)
+        self.num_clips = 0
+
+    def plan_memory(self, frame_shape):
+        """Choose use_patch / num_patch / patch_size / checkpointing within memory_budget"""
+        maml_opt = self.opt['train']['maml']
+        memory_budget = maml_opt['memory_budget']
+        budget = available_memory(self.modelcp.device) if memory_budget == 'auto' else memory_budget * GB
+        # Working copy of G, which knows the frozen parameters and the adapters
+        planner = MemoryPlanner(self.modelcp.netG, None if self.use_real else self.est_model.netE, self.est_model.mode,
+                                tuple(frame_shape), self.scale, upsample_input=self.upsample_input,
+                                optimizer=maml_opt['optimizer'],
+                                margin=maml_opt['memory_margin'] if maml_opt['memory_margin'] else 1.5,
+                                tile_size=self.tile_size, adapt_tile=self.adapt_tile,
+                                num_adapt_tiles=self.num_adapt_tiles,
+                                test_batch=self.ensemble_size(),
+                                G_input_grad=self.adapt_E and not self.detach_G_input, E_grad=self.adapt_E)
+        plan = planner.plan(maml_opt, budget)
+        if not plan['fits']:
+            print('WARNING: no adaptation plan fits in {:.2f} GB, using the smallest one.'.format(budget / GB))
+        for k in ['use_patch', 'num_patch', 'patch_size']:
+            maml_opt[k] = plan[k]
+        if plan['use_patch'] and self.prefix_cache is not None and not maml_opt['prefix_cache_fixed_crops']:
+            print('prefix_cache with use_patch draws the crops once per window, set prefix_cache_fixed_crops '
+                  'to allow it. Running the full network.')
+            self.prefix_cache = None
+        if plan['checkpointing']:
+            enable_checkpointing(self.modelcp.netG)
+            if not self.use_real:
+                enable_checkpointing(self.est_modelcp.netE)
+        print('Memory plan: use_patch {}, num_patch {:d}, patch_size {:d}, checkpointing {} ({:.2f} / {:.2f} GB)'.format(
+            plan['use_patch'], plan['num_patch'], plan['patch_size'], plan['checkpointing'],
+            plan['bytes'] / GB, budget / GB))
+        self.plan = plan
+        self.plan_pending = False
+        return plan
+
+    def bicubic_input(self, LQs):
+        """Bicubic upsampled B x T x C x H x W input of TOF, LQs unchanged for the other networks"""
+        if not self.upsample_input:
+            return LQs
+        B, T, C, H, W = LQs.shape
+        Bic_LQs = F.interpolate(LQs.reshape(B*T, C, H, W), scale_factor=self.scale, mode='bicubic', align_corners=True)
+        return Bic_LQs.reshape(B, T, C, H*self.scale, W*self.scale)
+
+    def sample_tiles(self, windows, slr_targets):
+        """
+        Random adapt_tile tiles of the windows, at the same position on every frame, with the
+        matching crops of their SLR targets (see preprocessing.common_crop).
+
+        Return:
+            tiles (list [dict]): num_adapt_tiles cropped windows per window
+            SLR targets of the tiles
+        """
+        keys = ['SuperLQs', 'LQs'] if self.use_real else ['LQs']
+        tiles, tile_targets = [], []
+        for window_data, slr_target in zip(windows, slr_targets):
+            # Tiles are drawn on the SLR grid, the lowest resolution
+            size = min(self.adapt_tile // self.scale, slr_target.shape[-2], slr_target.shape[-1])
+            for _ in range(self.num_adapt_tiles):
+                cropped = preprocessing.common_crop(slr_target, *[window_data[k] for k in keys], patch_size=size)
+                tile = dict(window_data)
+                for k, v in zip(keys, cropped[1:]):
+                    tile[k] = v
+                tiles.append(tile)
+                tile_targets.append(cropped[0])
+        return tiles, tile_targets
+
+    def crop(self, LR_seq, HR, num_patches_for_batch=4, patch_size=44):
+        """
+        Crop given patches.
+
+        Args:
+            LR_seq: (B=1) x T x C x H x W
+            HR: (B=1) x C x H x W
+
+            patch_size (int, optional):
+
+        Return:
+            B(=batch_size) x T x C x H x W
+        """
+        # Find the lowest resolution
+        cropped_lr = []
+        cropped_hr = []
+        assert HR.size(0) == 1
+        LR_seq_ = LR_seq[0]
+        HR_ = HR[0]
+        for _ in range(num_patches_for_batch):
+            patch_lr, patch_hr = preprocessing.common_crop(LR_seq_, HR_, patch_size=patch_size // 2)
+            cropped_lr.append(patch_lr)
+            cropped_hr.append(patch_hr)
+
+        cropped_lr = torch.stack(cropped_lr, dim=0)
+        cropped_hr = torch.stack(cropped_hr, dim=0)
+
+        return cropped_lr, cropped_hr
+
+    def inner_batch(self, window_data):
+        """
+        Training data of one window, built with the working (adapted) estimator.
+
+        Return:
+            batch for modelcp (SLR input, LR center frame as GT, cropped if use_patch)
+            SLR sequence compared to the target of the fixed estimator
+        """
+        maml_opt = self.opt['train']['maml']
+        meta_train_data = {}
+        meta_train_data['GT'] = window_data['LQs'][:, self.center_idx]
+
+        # Make SuperLR seq using UPDATED estimation model
+        if not self.use_real:
+            with torch.set_grad_enabled(self.adapt_E and torch.is_grad_enabled()):
+                self.est_modelcp.feed_data(window_data)
+                self.est_modelcp.forward_without_optim()
+            superlr_seq = self.est_modelcp.fake_L
+        else:
+            superlr_seq = window_data['SuperLQs']
+
+        meta_train_data['LQs'] = self.bicubic_input(superlr_seq)
+        slr_seq = superlr_seq.squeeze(0) if self.upsample_input else meta_train_data['LQs']
+        if self.detach_G_input:
+            meta_train_data['LQs'] = meta_train_data['LQs'].detach()
+
+        if maml_opt['use_patch']:
+            cropped_meta_train_data = {}
+            cropped_meta_train_data['LQs'], cropped_meta_train_data['GT'] = \
+                self.crop(meta_train_data['LQs'], meta_train_data['GT'],
+                          maml_opt['num_patch'], maml_opt['patch_size'])
+            return cropped_meta_train_data, slr_seq
+        return meta_train_data, slr_seq
+
+    def inner_loss(self, window_data, slr_initialized):
+        """SLR loss of one window, computed with the working (adapted) models"""
+        train_data, slr_seq = self.inner_batch(window_data)
+        self.modelcp.feed_data(train_data)
+        loss_train = self.modelcp.calculate_loss()
+
+        ##################### SLR LOSS ###################
+        loss_train += 10 * F.l1_loss(slr_seq.to(self.modelcp.device), slr_initialized)
+        return loss_train
+
+    def cached_window(self, window_data, slr_initialized):
+        """Constant part of the inner loss of one window: prefix activations of G (on crops
+        drawn once, if use_patch and prefix_cache_fixed_crops), target and SLR loss"""
+        with torch.no_grad():
+            train_data, slr_seq = self.inner_batch(window_data)
+            prefix = self.prefix_cache.prepare(train_data['LQs'].to(self.modelcp.device))
+            slr_loss = 10 * F.l1_loss(slr_seq.to(self.modelcp.device), slr_initialized)
+        return prefix, train_data['GT'].to(self.modelcp.device), slr_loss
+
+    def cached_loss(self, prefix, GT, slr_loss):
+        """Same as inner_loss, running only the adapted suffix of G"""
+        return self.modelcp.l_pix_w * self.modelcp.cri_pix(self.prefix_cache.forward(prefix), GT) + slr_loss
+
+    def adapt(self, windows, num_steps=None):
+        """
+        Inner loop update on the given windows, starting from the current working weights.
+
+        Args:
+            windows (list [dict]): batched (B=1) windows with LQs, folder and idx
+            num_steps (int): number of inner steps, update_step by default
+
+        Return:
+            number of inner steps taken (fewer than num_steps when stopped early)
+        """
+        if num_steps is None:
+            num_steps = self.update_step
+        if self.plan_pending:
+            self.plan_memory(windows[0]['LQs'].shape[1:])
+        ########## SLR LOSS Preparation ############
+        with self.timer.stage('slr'):
+            slr_targets = [self.slr_cache.get(window_data).to(self.modelcp.device) for window_data in windows]
+        if self.adapt_tile:
+            windows, slr_targets = self.sample_tiles(windows, slr_targets)
+        if self.prefix_cache is not None:
+            with self.timer.stage('inner_fwd'):
+                cached = [self.cached_window(w, t) for w, t in zip(windows, slr_targets)]
+            window_losses = [lambda c=c: self.cached_loss(*c) for c in cached]
+        else:
+            window_losses = [lambda w=w, t=t: self.inner_loss(w, t) for w, t in zip(windows, slr_targets)]
+        if self.early_stopping is not None:
+            self.early_stopping.reset()
+        for i in range(num_steps):
+            self.timer.next_step()
+            # Update both modelcp + estmodelcp jointly
+            with self.timer.stage('inner_opt'):
+                self.inner_optimizer.zero_grad()
+            step_loss = 0.
+            for window_loss in window_losses:
+                with self.timer.stage('inner_fwd'):
+                    loss_train = window_loss() / len(windows)
+                with self.timer.stage('inner_bwd'):
+                    loss_train.backward()
+                step_loss += loss_train.item() if self.early_stopping is not None else 0.
+            with self.timer.stage('inner_opt'):
+                self.inner_optimizer.step()
+            if self.early_stopping is not None and self.early_stopping.step(step_loss):
+                return i + 1
+        return num_steps
+
+    def ensemble_size(self):
+        """Number of windows batched in the final forward"""
+        if not self.self_ensemble:
+            return 1
+        if self.ensemble_batch:
+            return min(self.self_ensemble, self.ensemble_batch)
+        return self.self_ensemble
+
+    def test(self, model, LQs):
+        """Forward of a VSR model (modelcp, model_fixed) on a B x T x C x H x W network input,
+        tiled when tile_size is set, with the self ensemble when self_ensemble is set. The
+        low-rank adapters of modelcp are merged into its weights for the forward.
+
+        Return:
+            C x H x W float tensor on the CPU, output of the first window
+        """
+        if self.lora and model is self.modelcp:
+            with self.session.merged():
+                return self._test(model, LQs)
+        return self._test(model, LQs)
+
+    def _test(self, model, LQs):
+        if not self.tile_size and not self.self_ensemble:
+            model.feed_data({'LQs': LQs}, need_GT=False)
+            model.test()
+            return model.get_current_visuals(need_GT=False)['rlt']
+
+        def forward(x):
+            model.feed_data({'LQs': x}, need_GT=False)
+            model.test()
+            return model.fake_H
+
+        if self.self_ensemble:
+            single = forward
+
+            def forward(x):
+                return util.ensemble_forward(single, x, self.self_ensemble, self.ensemble_batch)
+
+        if not self.tile_size:
+            return forward(LQs)[0].float().cpu()
+        align = self.scale if self.upsample_input else 1
+        return util.tiled_forward(forward, LQs, self.tile_size, self.tile_overlap, align)[0].float().cpu()
+
+    def upscale(self, LQs):
+        """Super-resolve the center frame of a B x T x C x H x W window with the working weights
+
+        Return:
+            C x H x W float tensor on the CPU
+        """
+        return self.test(self.modelcp, self.bicubic_input(LQs))
+
+    def _to_tensor(self, frame):
+        # HWC uint8 RGB arrays (e.g. imageio) or CHW float RGB tensors in [0, 1]
+        if isinstance(frame, np.ndarray):
+            return torch.from_numpy(np.ascontiguousarray(frame.transpose(2, 0, 1))).float() / 255.
+        return frame.float()
+
+    def _window_data(self, LQs, folder, idx, max_idx):
+        # Same keys as the test datasets, so that the SLR cache knows the frames of the window
+        return {'LQs': LQs.unsqueeze(0), 'folder': folder, 'idx': '{}/{}'.format(idx, max_idx)}
+
+    def adapt_and_upscale(self, frames, num_steps=None):
+        """Adapt the meta weights to one window and super-resolve its center frame
+
+        Args:
+            frames: T x C x H x W tensor, or list of T frames (C x H x W tensors or
+                H x W x C uint8 RGB arrays)
+            num_steps (int): number of inner steps, update_step by default
+
+        Return:
+            C x H x W float tensor, or H x W x C uint8 RGB array for array inputs
+        """
+        as_array = isinstance(frames[0], np.ndarray)
+        if not torch.is_tensor(frames):
+            frames = torch.stack([self._to_tensor(f) for f in frames])
+        # Every call is a clip of its own, the SLR target is never reused
+        self.num_clips += 1
+        window_data = self._window_data(frames, '_window_{:d}'.format(self.num_clips), len(frames) // 2, len(frames))
+        self.session.reset()
+        self.adapt([window_data], num_steps)
+        output = self.upscale(window_data['LQs'])
+        return util.tensor2img(output, mode='rgb') if as_array else output
+
+    def upscale_clip(self, frames, adapt_mode=None, adapt_interval=None):
+        """Adapt and super-resolve a clip frame by frame, reading it lazily.
+
+        The windows are built with the padding of the dataset, so frame i is returned once
+        frame i + N_frames // 2 (or the end of the clip) has been read. With adapt_mode clip
+        or interval, the weights are adapted on the window of the first frame of each segment,
+        and warm_start / warm_start_iter / warm_start_decay / warm_start_reset are honoured as
+        in test_dynavsr.py.
+
+        Args:
+            frames (iterable): C x H x W tensors or H x W x C uint8 RGB arrays
+            adapt_mode (str): frame | clip | interval | drift, adapt_mode of the options by default
+            adapt_interval (int): frames per adaptation with adapt_mode interval
+
+        Yield:
+            super-resolved frames in order, in the format of the inputs
+        """
+        maml_opt = self.opt['train']['maml']
+        if adapt_mode is None:
+            adapt_mode = maml_opt['adapt_mode'] if maml_opt['adapt_mode'] else 'frame'
+        if adapt_interval is None:
+            adapt_interval = maml_opt['adapt_interval'] if maml_opt['adapt_interval'] else 1
+        if adapt_mode not in ['frame', 'clip', 'interval', 'drift']:
+            raise NotImplementedError('Adaptation mode [{:s}] is not recognized.'.format(adapt_mode))
+        drift_monitor = None
+        if adapt_mode == 'drift':
+            drift_monitor = DriftMonitor(
+                maml_opt['drift_threshold'] if maml_opt['drift_threshold'] is not None else 0.1,
+                momentum=maml_opt['drift_momentum'] if maml_opt['drift_momentum'] else 0.)
+        warm_start = maml_opt['warm_start']
+        warm_start_iter = maml_opt['warm_start_iter'] if maml_opt['warm_start_iter'] is not None else maml_opt['adapt_iter']
+        warm_start_decay = maml_opt['warm_start_decay'] if maml_opt['warm_start_decay'] else 0.
+        warm_start_reset = maml_opt['warm_start_reset']  # hard reset every N adaptations
+        num_warm_started = 0
+
+        self.num_clips += 1
+        folder = '_clip_{:d}'.format(self.num_clips)
+        n_pad = self.N_frames // 2
+        frames = iter(frames)
+        buffer = {}
+        as_array = None
+        num_read, ended = 0, False
+        adapted = False
+        for i in itertools.count():
+            # Read ahead far enough for every padding mode (new_info looks 2 * n_pad frames ahead)
+            while not ended and num_read <= i + 2 * n_pad:
+                frame = next(frames, None)
+                if frame is None:
+                    ended = True
+                    break
+                if as_array is None:
+                    as_array = isinstance(frame, np.ndarray)
+                buffer[num_read] = self._to_tensor(frame)
+                num_read += 1
+            if i >= num_read:
+                return
+            select_idx = data_util.index_generation(i, num_read, self.N_frames, padding=self.padding)
+            window_data = self._window_data(torch.stack([buffer[j] for j in select_idx]), folder, i, num_read)
+
+            if adapt_mode == 'frame':
+                adapt_now = True
+            elif adapt_mode == 'clip':
+                adapt_now = not adapted
+            elif adapt_mode == 'interval':
+                adapt_now = i % adapt_interval == 0
+            else:
+                adapt_now = drift_monitor.update(degradation_signature(window_data['LQs'],
+                                                                       self.slr_cache.get(window_data)))
+            if adapt_now:
+                if warm_start and adapted and (not warm_start_reset or num_warm_started < warm_start_reset):
+                    self.session.warm_start(warm_start_decay)
+                    self.adapt([window_data], warm_start_iter)
+                    num_warm_started += 1
+                else:
+                    self.session.reset()
+                    self.adapt([window_data])
+                    num_warm_started = 0
+                adapted = True
+                if drift_monitor is not None:
+                    drift_monitor.anchor()
+
+            output = self.upscale(window_data['LQs'])
+            yield util.tensor2img(output, mode='rgb') if as_array else output
+            # Frames before i - 2 * n_pad are not part of any later window
+            buffer.pop(i - 2 * n_pad, None)
@@ -0,0 +1,106 @@
+"""Low-rank adapters (LoRA) on the convolutions of the VSR network
+
+Instead of adapting the full weight W of a convolution, the inner loop only optimizes a
+low-rank delta W + alpha / r * B A, with A (r x fan_in) and B (out_channels x r), B starting
+at zero so that the adapted network starts as the meta network. The optimizer state and
+gradients then only cover A and B. For the final forward the deltas are merged into the
+weights once, so the (possibly tiled / self-ensembled) forward runs plain convolutions.
+"""
+import math
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+import torch.nn.init as init
+from torch.nn import functional as F
+
+LORA_PARAMS = ('lora_A', 'lora_B')
+
+
+class LoRAConv(nn.Module):
+    """Conv2d / Conv3d with a low-rank delta on its weight.
+
+    The weight and bias Parameters of the wrapped convolution are reused, so the
+    state_dict keys of the network only gain the lora_A / lora_B entries.
+
+    Args:
+        conv (nn.Conv2d or nn.Conv3d): convolution to adapt
+        rank (int): rank r of the delta
+        alpha (float): scale of the delta is alpha / rank, rank by default
+    """
+
+    def __init__(self, conv, rank, alpha=None):
+        super(LoRAConv, self).__init__()
+        self.conv_fn = F.conv3d if isinstance(conv, nn.Conv3d) else F.conv2d
+        self.weight, self.bias = conv.weight, conv.bias
+        self.stride, self.padding = conv.stride, conv.padding
+        self.dilation, self.groups = conv.dilation, conv.groups
+        fan_in = conv.weight[0].numel()
+        self.lora_A = nn.Parameter(conv.weight.new_empty(rank, fan_in))
+        self.lora_B = nn.Parameter(conv.weight.new_zeros(conv.weight.size(0), rank))
+        init.kaiming_uniform_(self.lora_A, a=math.sqrt(5))
+        self.scaling = (alpha if alpha else rank) / float(rank)
+        self.merged = None
+
+    def delta(self):
+        return torch.mm(self.lora_B, self.lora_A).view_as(self.weight) * self.scaling
+
+    def forward(self, x):
+        weight = self.weight if self.merged is not None else self.weight + self.delta()
+        return self.conv_fn(x, weight, self.bias, self.stride, self.padding, self.dilation, self.groups)
+
+    def merge(self):
+        """Add the delta to the weight, keeping the original weight to restore it exactly"""
+        if self.merged is None:
+            with torch.no_grad():
+                self.merged = self.weight.detach().clone()
+                self.weight.add_(self.delta())
+
+    def unmerge(self):
+        if self.merged is not None:
+            with torch.no_grad():
+                self.weight.copy_(self.merged)
+            self.merged = None
+
+
+def is_lora_param(name):
+    """Parameter filter (see adaptation.adapt_filter) selecting the adapters only"""
+    return name.split('.')[-1] in LORA_PARAMS
+
+
+def attach_lora(net, rank, alpha=None, modules=None):
+    """
+    Wrap the convolutions of net under the given module path prefixes with LoRAConv, in place.
+    The prefixes default to the lora_modules of the architecture (EDVR, DUF, TOF), or to
+    every convolution.
+
+    Return:
+        number of wrapped convolutions
+    """
+    if isinstance(net, nn.DataParallel) or isinstance(net, nn.parallel.DistributedDataParallel):
+        net = net.module
+    if modules is None:
+        modules = getattr(net, 'lora_modules', None)
+    targets = [(name, m) for name, m in net.named_modules()
+               if isinstance(m, (nn.Conv2d, nn.Conv3d)) and m.padding_mode == 'zeros' and
+               (not modules or any(name == p or name.startswith(p + '.') for p in modules))]
+    for name, m in targets:
+        parent = net
+        *path, child = name.split('.')
+        for p in path:
+            parent = getattr(parent, p)
+        setattr(parent, child, LoRAConv(m, rank, alpha))
+    return len(targets)
+
+
+@contextmanager
+def merged(nets):
+    """Merge the adapters of nets into their weights for the duration of the block"""
+    convs = [m for net in nets for m in net.modules() if isinstance(m, LoRAConv)]
+    for m in convs:
+        m.merge()
+    try:
+        yield
+    finally:
+        for m in convs:
+            m.unmerge()
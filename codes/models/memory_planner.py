@@ -0,0 +1,266 @@
+"""Pick a test-time adaptation plan (patches / activation checkpointing) that fits a memory budget
+
+The peak memory of the inner loop is estimated from the parameter count of the adapted
+networks and from their activation memory per input pixel, which is measured once with a
+small probe forward. Candidate plans are grouped by the data the inner loop sees (full
+frames, then the configured patches, then fewer / smaller patches): the most faithful group
+with a plan that fits is used, and within it the plan of lowest estimated cost.
+"""
+import inspect
+import math
+import os
+
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint_sequential
+
+GB = 1024 ** 3
+# Non-reentrant checkpointing where it exists (PyTorch >= 1.11): reentrant is no longer the
+# implicit default and raises without an explicit use_reentrant
+CHECKPOINT_KWARGS = {'use_reentrant': False} \
+    if 'use_reentrant' in inspect.signature(checkpoint_sequential).parameters else {}
+
+
+class CheckpointedSequential(nn.Sequential):
+    """nn.Sequential that recomputes its activations in the backward pass (training only)"""
+
+    def __init__(self, segments, *modules):
+        super(CheckpointedSequential, self).__init__(*modules)
+        self.segments = segments
+
+    def forward(self, x):
+        if self.training and torch.is_grad_enabled() and x.requires_grad:
+            return checkpoint_sequential(self, self.segments, x, **CHECKPOINT_KWARGS)
+        return super(CheckpointedSequential, self).forward(x)
+
+
+def _checkpointable(module):
+    # Residual trunks (arch_util.make_layer); BatchNorm statistics would be updated twice
+    return type(module) is nn.Sequential and len(module) >= 4 and \
+        not any(isinstance(m, nn.modules.batchnorm._BatchNorm) for m in module.modules())
+
+
+def enable_checkpointing(net):
+    """Replace the checkpointable trunks of net in place. The parameters are kept, so the
+    state_dict keys and any tensor views on them (e.g. AdaptationSession) are unchanged.
+
+    Return:
+        number of replaced trunks
+    """
+    targets = [(name, m) for name, m in net.named_modules() if _checkpointable(m)]
+    for name, m in targets:
+        parent = net
+        *path, child = name.split('.')
+        for p in path:
+            parent = getattr(parent, p)
+        setattr(parent, child, CheckpointedSequential(max(int(round(math.sqrt(len(m)))), 1), *m))
+    return len(targets)
+
+
+def profile_activations(net, inputs, grad=True):
+    """
+    Activation memory of one forward, from the outputs of the leaf modules. With grad, the
+    probe runs with autograd as the inner loop does, which tells the trunks that get an input
+    requiring grad: CheckpointedSequential only checkpoints those (e.g. not behind a
+    detached input and frozen layers).
+
+    Return:
+        total (int): bytes of all leaf outputs
+        largest (int): bytes of the largest leaf output
+        trunks (list [(int, int)]): (bytes, length) of every checkpointable trunk that
+            would actually be checkpointed
+    """
+    records = []
+    grad_inputs = set()
+    hooks = []
+
+    def hook(module, inp, out):
+        if torch.is_tensor(out):
+            records.append((module, out.numel() * out.element_size()))
+
+    def pre_hook(module, inp):
+        if torch.is_tensor(inp[0]) and inp[0].requires_grad:
+            grad_inputs.add(module)
+
+    for m in net.modules():
+        if len(list(m.children())) == 0:
+            hooks.append(m.register_forward_hook(hook))
+        elif _checkpointable(m):
+            hooks.append(m.register_forward_pre_hook(pre_hook))
+    was_training = net.training
+    net.eval()
+    with torch.set_grad_enabled(grad):
+        net(*inputs)
+    net.train(was_training)
+    for h in hooks:
+        h.remove()
+
+    total = sum(b for _, b in records)
+    largest = max([b for _, b in records] + [0])
+    trunks = []
+    for m in net.modules():
+        if _checkpointable(m) and m in grad_inputs:
+            members = set(m.modules())
+            trunks.append((sum(b for module, b in records if module in members), len(m)))
+    return total, largest, trunks
+
+
+def checkpointed_bytes(total, trunks):
+    """Activation bytes left with checkpoint_sequential(segments ~ sqrt(n)) on every trunk:
+    the segment boundaries plus one segment recomputed during backward"""
+    for nbytes, n in trunks:
+        segments = max(int(round(math.sqrt(n))), 1)
+        total -= nbytes - nbytes * (segments + n / segments) / n
+    return total
+
+
+def available_memory(device):
+    """Total memory of the GPU, or the physical memory of the host, in bytes"""
+    if device.type == 'cuda':
+        return torch.cuda.get_device_properties(device).total_memory
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def _num_bytes(tensors):
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class MemoryPlanner():
+    """Estimate the peak memory of test-time adaptation and choose a plan that fits.
+
+    Args:
+        netG (nn.Module): VSR network adapted in the inner loop
+        netE (nn.Module): estimator network, None when it is not adapted (use_real)
+        est_mode (str): 'video' (MFDN, B x C x T x H x W input) or 'image' (SFDN)
+        frame_shape (tuple): (T, C, H, W) of the LR input windows
+        scale (int): upscaling factor
+        upsample_input (bool): the VSR network takes bicubic upsampled inputs (TOF)
+        optimizer (str): inner optimizer, 'Adam' keeps two moments per parameter
+        margin (float): safety factor on the activation estimate, covering the
+            intermediate tensors of functional ops that are not seen by the probe
+        probe_size (int): side of the LR probe input
+        tile_size (int): side of the tiles of the final forward (LR pixels), None for full frames
+        adapt_tile (int): side of the tiles of the inner loss (LR pixels), None for full frames
+        num_adapt_tiles (int): number of adapt_tile tiles per window
+        test_batch (int): windows per forward in the final pass (batched self ensemble)
+        G_input_grad (bool): the input of netG requires grad in the inner loop (adapted
+            estimator, input not detached)
+        E_grad (bool): netE runs with autograd in the inner loop (adapted estimator)
+    """
+
+    def __init__(self, netG, netE, est_mode, frame_shape, scale, upsample_input=False, optimizer='Adam',
+                 margin=1.5, probe_size=32, tile_size=None, adapt_tile=None, num_adapt_tiles=1,
+                 test_batch=1, G_input_grad=False, E_grad=True):
+        self.T, self.C, self.H, self.W = frame_shape
+        self.scale = scale
+        self.tile_size = tile_size
+        self.adapt_tile = adapt_tile
+        self.num_adapt_tiles = num_adapt_tiles
+        self.test_batch = test_batch
+        self.upsample_input = upsample_input
+        self.margin = margin
+        device = next(netG.parameters()).device
+        self.device = device
+
+        # Weights of the meta, working and fixed copies, plus gradients and optimizer state
+        nets = [netG] if netE is None else [netG, netE]
+        params = [p for net in nets for p in net.parameters()]
+        adapted = [p for p in params if p.requires_grad]
+        state_copies = 3 if optimizer == 'Adam' else 1
+        self.static_bytes = 3 * _num_bytes(params) + state_copies * _num_bytes(adapted)
+
+        # Activation bytes per input pixel (one frame of the window)
+        p = probe_size * scale if upsample_input else probe_size
+        probe = torch.zeros(1, self.T, self.C, p, p, device=device, requires_grad=G_input_grad)
+        total, largest, trunks = profile_activations(netG, [probe])
+        self.G_px = total / float(p * p)
+        self.G_px_ckpt = checkpointed_bytes(total, trunks) / float(p * p)
+        # Checkpointed trunks run their forward again in the backward pass
+        self.G_recompute = sum(b for b, _ in trunks) / float(max(total, 1))
+        # Without autograd only a few feature maps are alive at a time
+        self.G_px_infer = 3 * largest / float(p * p)
+        self.E_px, self.E_px_ckpt, self.E_recompute = 0., 0., 0.
+        if netE is not None:
+            if est_mode == 'video':
+                probe = torch.zeros(1, self.C, self.T, probe_size, probe_size, device=device)
+            else:
+                probe = torch.zeros(self.T, self.C, probe_size, probe_size, device=device)
+            total, _, trunks = profile_activations(netE, [probe], grad=E_grad)
+            self.E_px = total / float(probe_size * probe_size)
+            self.E_px_ckpt = checkpointed_bytes(total, trunks) / float(probe_size * probe_size)
+            self.E_recompute = sum(b for b, _ in trunks) / float(max(total, 1))
+
+    def _pixels(self, use_patch, num_patch, patch_size):
+        """Input pixels of the estimator and of the VSR network in one inner step"""
+        if self.adapt_tile:
+            E_pixels = self.num_adapt_tiles * min(self.adapt_tile, self.H) * min(self.adapt_tile, self.W)
+        else:
+            E_pixels = self.H * self.W
+        if use_patch:
+            G_pixels = num_patch * (patch_size // 2) ** 2
+        elif self.upsample_input:
+            G_pixels = E_pixels
+        else:
+            G_pixels = E_pixels // (self.scale ** 2)
+        return E_pixels, G_pixels
+
+    def cost(self, use_patch, num_patch, patch_size, checkpointing):
+        """Relative compute of one inner step, with the activation bytes as a proxy of the work
+        per pixel. Forward and backward are ~3 forwards, checkpointing adds one of the trunks."""
+        E_pixels, G_pixels = self._pixels(use_patch, num_patch, patch_size)
+        G_cost = G_pixels * self.G_px * (3 + (self.G_recompute if checkpointing else 0.))
+        E_cost = E_pixels * self.E_px * (3 + (self.E_recompute if checkpointing else 0.))
+        return G_cost + E_cost
+
+    def estimate(self, use_patch, num_patch, patch_size, checkpointing):
+        """Estimated peak bytes of one inner step with the given plan"""
+        E_pixels, G_pixels = self._pixels(use_patch, num_patch, patch_size)
+        G_act = G_pixels * (self.G_px_ckpt if checkpointing else self.G_px)
+        E_act = E_pixels * (self.E_px_ckpt if checkpointing else self.E_px)
+        # The final forward (full frame or one tile, test_batch windows) runs without autograd
+        if self.tile_size:
+            test_pixels = min(self.tile_size, self.H) * min(self.tile_size, self.W)
+        else:
+            test_pixels = self.H * self.W
+        test_pixels *= self.scale ** 2 if self.upsample_input else 1
+        infer = self.test_batch * test_pixels * self.G_px_infer
+        return self.static_bytes + self.margin * max(G_act + E_act, infer)
+
+    def candidates(self, opt_maml):
+        """Groups of plans (same inner loop data, with and without checkpointing), from the
+        most to the least faithful to the configured adaptation, each sorted by cost"""
+        num_patch = opt_maml['num_patch'] if opt_maml['num_patch'] else 4
+        patch_size = opt_maml['patch_size'] if opt_maml['patch_size'] else 64
+        data = []
+        if not opt_maml['use_patch']:
+            data.append((False, num_patch, patch_size))
+        n = num_patch
+        while n >= 1:
+            data.append((True, n, patch_size))
+            n //= 2
+        size = (patch_size - 8) // 8 * 8
+        while size >= 16:
+            data.append((True, 1, size))
+            size -= 8
+        return [sorted([d + (False,), d + (True,)], key=lambda plan: self.cost(*plan)) for d in data]
+
+    def plan(self, opt_maml, budget):
+        """
+        Return:
+            dict with use_patch, num_patch, patch_size, checkpointing, the estimated bytes and
+            cost: the fastest plan that fits among the most faithful ones. When no plan fits,
+            the smallest one is returned with fits=False.
+        """
+        groups = self.candidates(opt_maml)
+        for group in groups:
+            fitting = [plan for plan in group if self.estimate(*plan) <= budget]
+            if fitting:
+                best = fitting[0]
+                break
+        else:
+            best = min(groups[-1], key=lambda plan: self.estimate(*plan))
+        use_patch, num_patch, patch_size, checkpointing = best
+        nbytes = self.estimate(*best)
+        return {'use_patch': use_patch, 'num_patch': num_patch, 'patch_size': patch_size,
+                'checkpointing': checkpointing, 'bytes': nbytes, 'cost': self.cost(*best),
+                'fits': nbytes <= budget}
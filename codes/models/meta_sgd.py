@@ -0,0 +1,78 @@
+"""Meta-SGD: inner-loop step sizes meta-learned together with the initial weights
+
+Li et al., Meta-SGD: Learning to Learn Quickly for Few-Shot Learning, 2017
+"""
+import torch
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+
+
+def _clean(name):
+    return name[7:] if name.startswith('module.') else name
+
+
+class InnerLearningRates(nn.Module):
+    """Learned inner step size of every adapted parameter of a network.
+
+    The step sizes are kept as parameters of a module, so they are optimized by the meta
+    optimizer and saved / loaded like a network ({iter}_G_lr.pth next to {iter}_G.pth).
+
+    Args:
+        net (nn.Module): network adapted in the inner loop
+        lr (float): initial step size (lr_alpha / lr_alpha_est)
+        per_layer (bool): one step size per parameter tensor instead of per element
+    """
+
+    def __init__(self, net, lr, per_layer=False):
+        super(InnerLearningRates, self).__init__()
+        if isinstance(net, nn.DataParallel) or isinstance(net, DistributedDataParallel):
+            net = net.module
+        self.step_sizes = nn.ParameterDict()
+        for k, v in net.named_parameters():
+            if v.requires_grad:
+                shape = (1, ) if per_layer else v.shape
+                self.step_sizes[k.replace('.', '-')] = nn.Parameter(torch.full(shape, lr))
+
+    def get(self, name):
+        """Step size of the parameter called name in the network"""
+        return self.step_sizes[_clean(name).replace('.', '-')]
+
+    def pairs(self, net):
+        """(parameter, step size) of every adapted parameter of net"""
+        return [(v, self.get(k)) for k, v in net.named_parameters() if v.requires_grad]
+
+    @staticmethod
+    def accumulate_grad(step_size, grad_sum, meta_grad):
+        """First-order Meta-SGD gradient of a step size: after theta' = theta - sum_k lr * g_k,
+        dL/dlr = -sum_k g_k * dL/dtheta'"""
+        g = -grad_sum * meta_grad
+        if step_size.numel() == 1:
+            g = g.sum().view_as(step_size)
+        if step_size.grad is None:
+            step_size.grad = g.detach().clone()
+        else:
+            step_size.grad += g.detach()
+
+
+class MetaSGD(torch.optim.Optimizer):
+    """SGD with one step size tensor per parameter.
+
+    A param_group has either a scalar 'lr' or a list 'step_sizes' aligned with its 'params'.
+    """
+
+    def __init__(self, params):
+        super(MetaSGD, self).__init__(params, {'lr': 0.})
+
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            loss = closure()
+        with torch.no_grad():
+            for group in self.param_groups:
+                step_sizes = group.get('step_sizes', None)
+                for i, p in enumerate(group['params']):
+                    if p.grad is None:
+                        continue
+                    lr = step_sizes[i].detach() if step_sizes is not None else group['lr']
+                    p.sub_(lr * p.grad)
+        return loss
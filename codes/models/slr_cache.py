@@ -0,0 +1,93 @@
+import torch
+
+from data import util as data_util
+
+
+def cacheable(dataset_opt):
+    """Whether every window of the test set is degraded the same way each time it is loaded:
+    real LR frames (demo), fixed (set) or per-index (preset) kernels, not random ones"""
+    return dataset_opt['mode'] == 'demo' or dataset_opt['degradation_mode'] in ['set', 'preset']
+
+
+class SLRCache():
+    """Clip-level cache of the SLR targets produced by the fixed estimator (MFDN / SFDN).
+
+    The fixed estimator is never updated during test-time adaptation, so its output for a
+    window only has to be computed once, not once per inner step. Entries are kept for the
+    current clip (folder) only and are dropped when a new clip starts.
+
+    Args:
+        est_model (LRimgestimator_Model): frozen estimator producing the SLR targets
+        N_frames (int): number of frames in each input window
+        padding (str): padding mode of the dataset, see data.util.index_generation
+        share_frames (bool): reuse per-frame outputs across overlapping windows.
+            Only used for image-mode estimators (SFDN), and only valid when a frame is
+            degraded identically in every window it appears in.
+        enabled (bool): cache at all. Entries are keyed by window only, so this is only
+            valid when a window is degraded identically every time it is loaded
+            (see cacheable), not with randomly drawn kernels.
+    """
+
+    def __init__(self, est_model, N_frames, padding='new_info', share_frames=False, enabled=True):
+        self.est_model = est_model
+        self.N_frames = N_frames
+        self.padding = padding
+        self.enabled = enabled
+        self.share_frames = share_frames and enabled and est_model.mode == 'image'
+        self.folder = None
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, folder=None):
+        self.folder = folder
+        self.cache = {}
+
+    def _window(self, data):
+        # Batched (DataLoader) and raw (Dataset) samples are both accepted
+        folder = data['folder'] if isinstance(data['folder'], str) else data['folder'][0]
+        idx = data['idx'] if isinstance(data['idx'], str) else data['idx'][0]
+        idx, max_idx = [int(v) for v in idx.split('/')]
+        select_idx = data_util.index_generation(idx, max_idx, self.N_frames, padding=self.padding)
+        return folder, select_idx
+
+    def _estimate(self, LQs):
+        self.est_model.feed_data({'LQs': LQs})
+        self.est_model.test()
+        return self.est_model.fake_L
+
+    def get(self, data):
+        """Return the SLR target (1 x T x C x H x W) of the window in data"""
+        if not self.enabled:
+            self.misses += 1
+            return self._estimate(data['LQs'])
+        folder, select_idx = self._window(data)
+        if folder != self.folder:
+            self.reset(folder)
+
+        if not self.share_frames:
+            key = tuple(select_idx)
+            if key in self.cache:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.cache[key] = self._estimate(data['LQs'])
+            return self.cache[key]
+
+        # Image-mode estimator: every frame is processed independently,
+        # so only the frames not seen in previous windows are computed
+        missing_pos = []
+        missing_idx = []
+        for pos, frame_idx in enumerate(select_idx):
+            if frame_idx not in self.cache and frame_idx not in missing_idx:
+                missing_pos.append(pos)
+                missing_idx.append(frame_idx)
+        if missing_pos:
+            self.misses += 1
+            fake_L = self._estimate(data['LQs'][:, missing_pos])
+            for i, frame_idx in enumerate(missing_idx):
+                self.cache[frame_idx] = fake_L[:, i]
+        else:
+            self.hits += 1
+
+        return torch.stack([self.cache[frame_idx] for frame_idx in select_idx], dim=1)
@@ -0,0 +1,137 @@
+"""Bounded on-disk bank of adapted weights, keyed by a degradation descriptor
+
+Each entry is the difference between the adapted and the meta weights of a clip, stored as
+one flat tensor (see AdaptationSession.delta). A new clip starts from the entry whose
+descriptor is nearest to its own, so it needs fewer inner steps. The least recently used
+entries are evicted once the bank is full.
+"""
+import os
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+
+import torch
+
+from utils.util import atomic_write
+
+logger = logging.getLogger('base')
+
+
+def _atomic_save(obj, path, as_json=False):
+    if as_json:
+        def write_fn(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(obj, f)
+    else:
+        def write_fn(tmp_path):
+            torch.save(obj, tmp_path)
+    atomic_write(path, write_fn)
+
+
+class WarmStartBank():
+    """
+    The bank may be shared by several processes (launch_dynavsr.py workers, serving
+    threads): every lookup / store re-reads the index under an exclusive lock on
+    index.lock, so that concurrent updates are not lost.
+
+    Args:
+        root (str): directory of the bank (index.json and one .pth file per entry)
+        num_params (int): size of the flat weight vector, entries of another model are kept
+            in the index but never matched
+        capacity (int): maximum number of entries
+        max_distance (float): relative descriptor distance up to which an entry is reused.
+            Storing a descriptor within that distance of an entry replaces the entry.
+    """
+
+    def __init__(self, root, num_params, capacity=32, max_distance=0.1):
+        self.root = root
+        self.num_params = num_params
+        self.capacity = capacity
+        self.max_distance = max_distance
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock_path = os.path.join(root, 'index.lock')
+        with self._locked():
+            pass
+
+    @contextmanager
+    def _locked(self):
+        """Hold the bank lock with an up-to-date index"""
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._load_index()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        else:
+            index = {'next_id': 0, 'clock': 0, 'entries': []}
+        self.next_id = index['next_id']
+        self.clock = index['clock']
+        self.entries = index['entries']
+
+    def _save_index(self):
+        _atomic_save({'next_id': self.next_id, 'clock': self.clock, 'entries': self.entries},
+                     self.index_path, as_json=True)
+
+    def _path(self, entry):
+        return os.path.join(self.root, '{:d}.pth'.format(entry['id']))
+
+    def _nearest(self, key):
+        key = torch.tensor(key, dtype=torch.float64)
+        best, best_distance = None, None
+        for entry in self.entries:
+            if entry['num_params'] != self.num_params:
+                continue
+            ref = torch.tensor(entry['key'], dtype=torch.float64)
+            if ref.numel() != key.numel():
+                continue
+            distance = ((key - ref).norm() / (ref.norm() + 1e-8)).item()
+            if best is None or distance < best_distance:
+                best, best_distance = entry, distance
+        return best, best_distance
+
+    def _touch(self, entry):
+        self.clock += 1
+        entry['last_used'] = self.clock
+
+    def lookup(self, key):
+        """
+        Return:
+            (delta, distance) of the nearest entry within max_distance, or (None, None)
+        """
+        with self._locked():
+            entry, distance = self._nearest(key)
+            if entry is None or distance > self.max_distance or not os.path.exists(self._path(entry)):
+                return None, None
+            self._touch(entry)
+            self._save_index()
+            return torch.load(self._path(entry)).float(), distance
+
+    def store(self, key, delta):
+        """Add (or refresh) the entry of key, evicting the least recently used ones"""
+        key = [float(v) for v in key]
+        with self._locked():
+            entry, distance = self._nearest(key)
+            if entry is None or distance > self.max_distance:
+                entry = {'id': self.next_id, 'num_params': self.num_params}
+                self.next_id += 1
+                self.entries.append(entry)
+            entry['key'] = key
+            self._touch(entry)
+            # Half precision is enough for a starting point and halves the I/O
+            _atomic_save(delta.detach().cpu().half(), self._path(entry))
+
+            self.entries.sort(key=lambda e: e['last_used'], reverse=True)
+            for evicted in self.entries[self.capacity:]:
+                if os.path.exists(self._path(evicted)):
+                    os.remove(self._path(evicted))
+                logger.info('Warm-start bank: evicted entry {:d}.'.format(evicted['id']))
+            self.entries = self.entries[:self.capacity]
+            self._save_index()
@@ -0,0 +1,93 @@
+"""Process-wide registry of decoded network weights
+
+Checkpoints are read from disk once per process and kept resident as cleaned state_dicts,
+keyed by path and modification time, so networks can be restored repeatedly without
+re-reading, unpickling and rebuilding the dict each time.
+"""
+import os
+import logging
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+
+logger = logging.getLogger('base')
+
+# path -> (mtime, state_dict)
+_registry = {}
+
+
+def clean_state_dict(load_net):
+    """Remove the 'module.' prefix added by (Distributed)DataParallel"""
+    load_net_clean = OrderedDict()
+    for k, v in load_net.items():
+        if k.startswith('module.'):
+            load_net_clean[k[7:]] = v
+        else:
+            load_net_clean[k] = v
+    return load_net_clean
+
+
+def get_state_dict(load_path):
+    """Return the cleaned state_dict of load_path, reading it from disk only when needed"""
+    mtime = os.path.getmtime(load_path)
+    entry = _registry.get(load_path, None)
+    if entry is None or entry[0] != mtime:
+        logger.info('Caching weights [{:s}] ...'.format(load_path))
+        load_net = torch.load(load_path, map_location=lambda storage, loc: storage)
+        entry = (mtime, clean_state_dict(load_net))
+        _registry[load_path] = entry
+    return entry[1]
+
+
+def restore(network, load_path, strict=True):
+    """Copy the registered weights of load_path into network in place"""
+    if isinstance(network, nn.DataParallel) or isinstance(network, DistributedDataParallel):
+        network = network.module
+    state_dict = get_state_dict(load_path)
+    own_state = network.state_dict()
+    if strict:
+        missing = set(own_state.keys()) - set(state_dict.keys())
+        unexpected = set(state_dict.keys()) - set(own_state.keys())
+        if missing or unexpected:
+            raise KeyError('Mismatched keys when restoring [{:s}]. Missing: {}, unexpected: {}'
+                           .format(load_path, sorted(missing), sorted(unexpected)))
+    with torch.no_grad():
+        for k, v in state_dict.items():
+            if k in own_state:
+                own_state[k].copy_(v)
+
+
+def release(load_path=None):
+    """Drop one (or every) registered checkpoint"""
+    if load_path is None:
+        _registry.clear()
+    else:
+        _registry.pop(load_path, None)
+
+
+def share(load_path):
+    """Move the registered weights of load_path to shared memory, so that they can be handed
+    to worker processes (torch.multiprocessing) without being copied"""
+    state_dict = get_state_dict(load_path)
+    for v in state_dict.values():
+        v.share_memory_()
+    return state_dict
+
+
+def bind(network, state_dict):
+    """Point the parameters and buffers of network at the tensors of state_dict, without
+    copying them. Tensors on another device than the network are copied instead."""
+    if isinstance(network, nn.DataParallel) or isinstance(network, DistributedDataParallel):
+        network = network.module
+    tensors = list(network.named_parameters()) + list(network.named_buffers())
+    missing = set(k for k, _ in tensors) - set(state_dict.keys())
+    if missing:
+        raise KeyError('Missing keys when binding shared weights: {}'.format(sorted(missing)))
+    with torch.no_grad():
+        for k, v in tensors:
+            if state_dict[k].device == v.device and state_dict[k].dtype == v.dtype:
+                v.data = state_dict[k]
+            else:
+                v.copy_(state_dict[k])
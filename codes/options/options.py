@@ -4,6 +4,7 @@ import math
 import logging
 import yaml
 from collections import OrderedDict
+import torch
 from utils.util import OrderedYaml
 Loader, Dumper = OrderedYaml()
 
@@ -34,6 +35,7 @@ def parse(opt_path, is_train=True, exp_name=None):
         '''
         pass
     opt['is_train'] = is_train
+    opt['device'] = setup_device(opt)
     if opt['distortion'] == 'sr':
         scale = opt['scale']
 
@@ -92,6 +94,32 @@ def parse(opt_path, is_train=True, exp_name=None):
     return opt
 
 
+def setup_device(opt):
+    '''Resolve the device every model and script runs on.
+    cpu: true (or no available CUDA device) runs on the CPU, gpu_ids is then ignored.'''
+    if opt.get('cpu', False) or not torch.cuda.is_available():
+        if not opt.get('cpu', False):
+            print('No CUDA device is available, running on the CPU.')
+        opt['cpu'] = True
+        opt['gpu_ids'] = None
+        return 'cpu'
+    return 'cuda'
+
+
+def set_threads(opt):
+    '''Size the intra-op / inter-op thread pools of PyTorch with num_threads /
+    num_interop_threads, its defaults are kept when they are missing. Only called by the
+    entry points, the workers of launch_dynavsr.py size their pools from their cores.'''
+    if opt.get('num_threads', None):
+        torch.set_num_threads(opt['num_threads'])
+    if opt.get('num_interop_threads', None) and torch.get_num_interop_threads() != opt['num_interop_threads']:
+        # Only possible before the first inter-op parallel work of the process
+        try:
+            torch.set_num_interop_threads(opt['num_interop_threads'])
+        except RuntimeError:
+            print('Inter-op threads are already in use, keeping {:d} of them.'.format(torch.get_num_interop_threads()))
+
+
 def dict2str(opt, indent_l=1):
     '''dict to string for logger'''
     msg = ''
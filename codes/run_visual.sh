@@ -30,4 +30,7 @@ YML_NAME="EDVR_R.yml"
 # python test_dynavsr.py -opt options/test/${MODEL}/${YML_NAME} --exp_name ${EXP_NAME} --degradation_type preset
 
 # Demo
-# python test_dynavsr.py -opt options/test/EDVR/EDVR_Demo.yml --exp_name Demo
\ No newline at end of file
+# python test_dynavsr.py -opt options/test/EDVR/EDVR_Demo.yml --exp_name Demo
+
+# Whole evaluation matrix (settings above) in one run, models and GT frames loaded once
+# python matrix_dynavsr.py -opt options/test/${MODEL}/${YML_NAME} -save_dir ../test_results --degradation_type ${DEG_TYPE} --num_workers 2
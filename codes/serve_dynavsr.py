@@ -0,0 +1,243 @@
+"""Long-lived DynaVSR server keeping the VSR and estimator networks loaded.
+
+Jobs are submitted over HTTP, on localhost or on a Unix socket:
+
+    POST /jobs        {"input": "<frame folder or .y4m file>", "output": "<folder>",
+                       "degradation": {"sigma_x": 1.0, "sigma_y": 1.0, "theta": 0},   (optional)
+                       "adapt_mode": "clip", "adapt_interval": 10}                   (optional)
+    GET  /jobs        every job
+    GET  /jobs/<id>   status, progress and timing of one job
+
+Without "degradation" the input frames are the LR frames to super-resolve. With it, they
+are HR frames, degraded on the fly with the given Gaussian kernel as in the test datasets.
+The output folder receives one PNG per frame ({:08d}.png).
+
+    python serve_dynavsr.py -opt options/test/EDVR/EDVR_R.yml --port 8000 --workers 1
+    curl -X POST localhost:8000/jobs -d '{"input": "../datasets/Vid4/BIx4/calendar", "output": "../results/calendar"}'
+"""
+import os
+import copy
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import imageio
+
+import options.options as option
+from utils import util
+from data import util as data_util
+from data import random_kernel_generator as rkg
+from data.meta_learner import preprocessing
+from models.dynavsr_runner import DynaVSRRunner
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-opt', type=str, help='Path to option YAML file.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket', type=str, default=None,
+                        help='listen on this Unix socket instead of host:port')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of jobs run concurrently, each worker keeps its own copy of the models')
+    parser.add_argument('--queue_size', type=int, default=16,
+                        help='maximum number of queued jobs, further submissions are rejected')
+    return parser.parse_args(argv)
+
+
+class JobQueue():
+    """Bounded queue of clip jobs served by worker threads, one DynaVSRRunner per worker.
+
+    Args:
+        opt (dict): parsed test options
+        num_workers (int): number of jobs run concurrently
+        max_queued (int): maximum number of jobs waiting for a worker
+    """
+
+    def __init__(self, opt, num_workers=1, max_queued=16):
+        self.opt = opt
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.runners = []
+        for i in range(num_workers):
+            st = time.time()
+            # The memory plan of a runner edits its options, so each one gets a copy
+            self.runners.append(DynaVSRRunner(copy.deepcopy(opt)))
+            print('Worker {:d}: models loaded in {:.2f}s.'.format(i, time.time() - st))
+        self.threads = [threading.Thread(target=self._work, args=(runner, ), daemon=True) for runner in self.runners]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, request):
+        """
+        Return:
+            the new job, or None when the queue is full
+        """
+        for key in ['input', 'output']:
+            if key not in request:
+                raise ValueError('Missing [{:s}] in the job.'.format(key))
+        if not os.path.exists(request['input']):
+            raise ValueError('Input [{:s}] does not exist.'.format(request['input']))
+        if request.get('adapt_mode', None) not in [None, 'frame', 'clip', 'interval', 'drift']:
+            raise ValueError('Adaptation mode [{:s}] is not recognized.'.format(str(request['adapt_mode'])))
+        with self.lock:
+            job = {'id': self.next_id, 'request': request, 'status': 'queued', 'frames_done': 0,
+                   'frames_total': None, 'submitted': time.time(), 'started': None, 'finished': None,
+                   'compute_time': 0., 'write_time': 0., 'error': None}
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                return None
+            self.jobs[job['id']] = job
+            self.next_id += 1
+        return job
+
+    def status(self, job):
+        """JSON-serializable progress and timing of a job"""
+        with self.lock:
+            s = {k: v for k, v in job.items()}
+        now = time.time()
+        s['wait_time'] = (s['started'] if s['started'] else now) - s['submitted']
+        if s['started']:
+            s['run_time'] = (s['finished'] if s['finished'] else now) - s['started']
+            s['fps'] = s['frames_done'] / s['run_time'] if s['run_time'] > 0 else 0.
+        return s
+
+    def _frames(self, job):
+        """Input frames of a job as C x H x W RGB tensors in [0, 1], read lazily"""
+        request = job['request']
+        if os.path.isdir(request['input']):
+            paths = data_util.glob_file_list(request['input'])
+            job['frames_total'] = len(paths)
+            frames = (data_util.read_img_seq([p]).squeeze(0) for p in paths)
+        elif request['input'].endswith('.y4m'):
+            frames = data_util.read_y4m(request['input'])
+        else:
+            raise ValueError('Input [{:s}] is neither a folder nor a .y4m file.'.format(request['input']))
+
+        degradation = request.get('degradation', None)
+        if degradation is None:
+            return frames
+        gen_kwargs = preprocessing.set_kernel_params(sigma_x=float(degradation['sigma_x']),
+                                                     sigma_y=float(degradation['sigma_y']),
+                                                     theta=float(degradation['theta']))
+        kernel_gen = rkg.Degradation(self.opt['datasets']['train']['kernel_size'], self.opt['scale'], **gen_kwargs)
+        # Same quantization of the LR frames as the test datasets
+        return (kernel_gen.apply(img).mul(255).clamp(0, 255).round().div(255) for img in frames)
+
+    def _run(self, runner, job):
+        request = job['request']
+        os.makedirs(request['output'], exist_ok=True)
+        frames = self._frames(job)
+        outputs = runner.upscale_clip(frames, adapt_mode=request.get('adapt_mode', None),
+                                      adapt_interval=request.get('adapt_interval', None))
+        st = time.time()
+        for i, output in enumerate(outputs):
+            # The runner reads the next frames and adapts inside next(), timed together
+            et = time.time()
+            img = util.tensor2img(output, mode='rgb')
+            util.atomic_write(os.path.join(request['output'], '{:08d}.png'.format(i)),
+                              lambda path: imageio.imwrite(path, img))
+            with self.lock:
+                job['compute_time'] += et - st
+                job['write_time'] += time.time() - et
+                job['frames_done'] = i + 1
+            st = time.time()
+
+    def _work(self, runner):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                job['status'] = 'running'
+                job['started'] = time.time()
+            try:
+                self._run(runner, job)
+                status, error = 'done', None
+            except Exception as e:
+                status, error = 'failed', '{}: {}'.format(type(e).__name__, e)
+            with self.lock:
+                job['status'], job['error'] = status, error
+                job['finished'] = time.time()
+            print('Job {:d} {:s}: {:d} frames in {:.2f}s{}'.format(
+                job['id'], status, job['frames_done'], job['finished'] - job['started'],
+                '' if error is None else ' ({})'.format(error)))
+            self.queue.task_done()
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            self._reply(200, [jobs.status(job) for job in list(jobs.jobs.values())])
+        elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() and int(parts[1]) in jobs.jobs:
+            self._reply(200, jobs.status(jobs.jobs[int(parts[1])]))
+        else:
+            self._reply(404, {'error': 'Unknown path [{:s}].'.format(self.path)})
+
+    def do_POST(self):
+        if self.path.strip('/') != 'jobs':
+            self._reply(404, {'error': 'Unknown path [{:s}].'.format(self.path)})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+            job = self.server.jobs.submit(request)
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': str(e)})
+            return
+        if job is None:
+            self._reply(503, {'error': 'The job queue is full.'})
+        else:
+            self._reply(202, self.server.jobs.status(job))
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main(args):
+    opt = option.dict_to_nonedict(option.parse(args.opt, is_train=False))
+    option.set_threads(opt)
+    jobs = JobQueue(opt, num_workers=args.workers, max_queued=args.queue_size)
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, JobHandler)
+        print('Serving DynaVSR on unix socket {:s}'.format(args.socket))
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), JobHandler)
+        print('Serving DynaVSR on http://{:s}:{:d}'.format(args.host, args.port))
+    server.jobs = jobs
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    if args.socket is not None and os.path.exists(args.socket):
+        os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -11,6 +11,7 @@ import cv2
 import torch
 
 import utils.util as util
+import options.options as option
 import data.Backup.util as data_util
 import models.archs.EDVR_arch as EDVR_arch
 import imageio
@@ -20,7 +21,6 @@ def main():
     #################
     # configurations
     #################
-    device = torch.device('cuda')
     os.environ['CUDA_VISIBLE_DEVICES'] = '1'
     flip_test = False
     scale = 4
@@ -37,8 +37,10 @@ def main():
     prog.add_argument('--sigma_x', '-sx', type=float, default=1, help='sigma_x')
     prog.add_argument('--sigma_y', '-sy', type=float, default=0, help='sigma_y')
     prog.add_argument('--theta', '-th', type=float, default=0, help='theta')
+    prog.add_argument('--cpu', action='store_true', help='run on the CPU (also without a CUDA device)')
 
     args = prog.parse_args()
+    device = torch.device(option.setup_device({'cpu': args.cpu}))
 
     train_data_mode = args.train_mode
     data_mode = args.data_mode
@@ -118,7 +120,7 @@ def main():
     logger.info('Flip test: {}'.format(flip_test))
 
     #### set up the models
-    model.load_state_dict(torch.load(model_path), strict=True)
+    model.load_state_dict(torch.load(model_path, map_location=device), strict=True)
     model.eval()
     model = model.to(device)
 
@@ -13,6 +13,7 @@ import torch
 from torch.nn import functional as F
 
 import utils.util as util
+import options.options as option
 import data.util as data_util
 import models.archs.TOF_arch as TOF_arch
 
@@ -31,6 +32,7 @@ def main():
     prog.add_argument('--sigma_x', '-sx', type=float, default=1, help='sigma_x')
     prog.add_argument('--sigma_y', '-sy', type=float, default=0, help='sigma_y')
     prog.add_argument('--theta', '-th', type=float, default=0, help='theta')
+    prog.add_argument('--cpu', action='store_true', help='run on the CPU (also without a CUDA device)')
 
     args = prog.parse_args()
 
@@ -91,7 +93,7 @@ def main():
     padding = 'new_info'  # different from the official setting
     save_imgs = False #True
     ############################################################################
-    device = torch.device('cuda')
+    device = torch.device(option.setup_device({'cpu': args.cpu}))
     save_folder = '../results/{}'.format(data_mode)
     util.mkdirs(save_folder)
     util.setup_logger('base', save_folder, 'test', level=logging.INFO, screen=True, tofile=True)
@@ -172,7 +174,7 @@ def main():
         sub_folder_GT_l = [k for k in sub_folder_GT_l if
                           k.find('000') >= 0 or k.find('011') >= 0 or k.find('015') >= 0 or k.find('020') >= 0]
     #### set up the models
-    model.load_state_dict(torch.load(model_path), strict=True)
+    model.load_state_dict(torch.load(model_path, map_location=device), strict=True)
     print('Eval')
     model.eval()
     model = model.to(device)
@@ -5,45 +5,77 @@ import random
 import logging
 import imageio
 import time
+import numpy as np
 import pandas as pd
-from copy import deepcopy
 
 import torch
 from torch.nn import functional as F
 import torch.distributed as dist
 import torch.multiprocessing as mp
+from torch.utils.data.dataloader import default_collate
 from data.data_sampler import DistIterSampler
 
 import options.options as option
 from utils import util
 from data.meta_learner import loader, create_dataloader, create_dataset, preprocessing
-from models import create_model
+from models.dynavsr_runner import DynaVSRRunner
+from models.adaptation import BatchedAdaptation, DriftMonitor, batched_adaptation_available, \
+    degradation_signature
+from models.warm_start_bank import WarmStartBank
+from utils.pipeline import Prefetcher, OrderedWorkerPool
+from utils.telemetry import StageTimer, STAGE_COLUMNS, TELEMETRY_COLUMNS
+from utils.results import ResultLog
 
 
 def init_dist(backend='nccl', **kwargs):
-    """initialization for distributed training"""
+    """initialization for distributed training (nccl on GPUs, gloo on CPUs)"""
     if mp.get_start_method(allow_none=True) != 'spawn':
         mp.set_start_method('spawn')
     rank = int(os.environ['RANK'])
-    num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(rank % num_gpus)
+    if backend == 'nccl':
+        num_gpus = torch.cuda.device_count()
+        torch.cuda.set_device(rank % num_gpus)
     dist.init_process_group(backend=backend, **kwargs)
 
 #### options
-parser = argparse.ArgumentParser()
-parser.add_argument('-opt', type=str, help='Path to option YAML file.')
-parser.add_argument('-save_dir', type=str, help='')
-parser.add_argument('--launcher', choices=['none', 'pytorch'], default='none',
-                    help='job launcher')
-parser.add_argument('--local_rank', type=int, default=0)
-parser.add_argument('--exp_name', type=str, default='temp')
-parser.add_argument('--degradation_type', type=str, default=None)
-parser.add_argument('--sigma_x', type=float, default=None)
-parser.add_argument('--sigma_y', type=float, default=None)
-parser.add_argument('--theta', type=float, default=None)
-args = parser.parse_args()
-
-def main():
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-opt', type=str, help='Path to option YAML file.')
+    parser.add_argument('-save_dir', type=str, help='')
+    parser.add_argument('--launcher', choices=['none', 'pytorch'], default='none',
+                        help='job launcher')
+    parser.add_argument('--local_rank', type=int, default=0)
+    parser.add_argument('--exp_name', type=str, default='temp')
+    parser.add_argument('--degradation_type', type=str, default=None)
+    parser.add_argument('--sigma_x', type=float, default=None)
+    parser.add_argument('--sigma_y', type=float, default=None)
+    parser.add_argument('--theta', type=float, default=None)
+    parser.add_argument('--adapt_mode', choices=['frame', 'clip', 'interval', 'drift'], default=None,
+                        help='adapt every frame, once per clip, once every --adapt_interval frames, '
+                             'or when the degradation drifts beyond --drift_threshold')
+    parser.add_argument('--adapt_interval', type=int, default=None)
+    parser.add_argument('--drift_threshold', type=float, default=None)
+    parser.add_argument('--memory_budget', type=str, default=None,
+                        help='memory budget of the adaptation in GB, or auto')
+    parser.add_argument('--self_ensemble', type=int, choices=[4, 8], default=None,
+                        help='final forward with the x4 (flips) or x8 (flips and transposes) self ensemble')
+    parser.add_argument('--lora_rank', type=int, default=None,
+                        help='adapt rank-r adapters on the lora_modules of G instead of its weights')
+    parser.add_argument('--img_subfolder', type=str, default=None,
+                        help='save the images under img_save_path/<img_subfolder>, one per matrix cell')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip the frames already saved by a previous run of the same experiment')
+    parser.add_argument('--telemetry', action='store_true',
+                        help='log the time of every stage and the peak memory of each frame in pd_log')
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+
+def load_options(args):
+    """Test options with the command line overrides, and the name of the result folder"""
     if args.exp_name == 'temp':
         opt = option.parse(args.opt, is_train=False)
     else:
@@ -65,6 +97,23 @@ def main():
         opt['datasets']['val']['sigma_y'] = args.sigma_y
     if args.theta is not None:
         opt['datasets']['val']['theta'] = args.theta
+    if args.adapt_mode is not None:
+        opt['train']['maml']['adapt_mode'] = args.adapt_mode
+    if args.adapt_interval is not None:
+        opt['train']['maml']['adapt_interval'] = args.adapt_interval
+    if args.drift_threshold is not None:
+        opt['train']['maml']['drift_threshold'] = args.drift_threshold
+    if args.telemetry:
+        opt['telemetry'] = True
+    if args.img_subfolder is not None:
+        opt['path']['img_save_path'] = os.path.join(opt['path']['img_save_path'], args.img_subfolder)
+    if args.self_ensemble is not None:
+        opt['train']['maml']['self_ensemble'] = args.self_ensemble
+    if args.lora_rank is not None:
+        opt['train']['maml']['lora_rank'] = args.lora_rank
+    if args.memory_budget is not None:
+        opt['train']['maml']['memory_budget'] = args.memory_budget if args.memory_budget == 'auto' \
+            else float(args.memory_budget)
     
     if 'degradation_mode' not in opt['datasets']['val'].keys():
         degradation_name = ''
@@ -76,9 +125,50 @@ def main():
     else:
         degradation_name = '_' + opt['datasets']['val']['degradation_mode']
     folder_name = opt['name'] + '_' + degradation_name
+    if opt['train']['maml']['lora_rank']:
+        folder_name += '_lora{}'.format(opt['train']['maml']['lora_rank'])
+    if opt['train']['maml']['self_ensemble']:
+        folder_name += '_x{}'.format(opt['train']['maml']['self_ensemble'])
 
     if args.exp_name != 'temp':
         folder_name = args.exp_name
+    return opt, folder_name
+
+
+def resume_point(frames, png_folder, pd_log=None):
+    """
+    Number of leading frames that are complete: their PNG exists and, with a pd_log, so does
+    their row.
+
+    Args:
+        frames (list [(str, int)]): (clip, frame index) of the frames, in processing order
+        png_folder (str): folder of the clip folders of PNGs
+        pd_log (DataFrame): rows written so far, indexed by clip/frame
+    """
+    start = 0
+    for clip, idx_d in frames:
+        png_path = os.path.join(png_folder, clip, '{:08d}.png'.format(idx_d))
+        if not os.path.exists(png_path) or (pd_log is not None and '{}/{:08d}'.format(clip, idx_d) not in pd_log.index):
+            break
+        start += 1
+    return start
+
+
+def main(args, shard=None, shared=None):
+    """
+    Args:
+        shard (tuple): (rank, dataset indices) of a worker started by launch_dynavsr.py,
+            None to run every frame
+        shared (dict): val_set and meta / fixed weights in shared memory, see launch_dynavsr.py,
+            and optionally a runner built for the same options by a previous call (matrix_dynavsr.py)
+
+    Return:
+        path of pd_log, None without GT
+    """
+    opt, folder_name = load_options(args)
+    if shard is None and shared is None:
+        # Workers of launch_dynavsr.py / matrix_dynavsr.py size their pools from their cores
+        option.set_threads(opt)
 
     torch.backends.cudnn.benchmark = False
     torch.backends.cudnn.deterministic = True
@@ -92,9 +182,12 @@ def main():
             if '+' in opt['datasets']['val']['name']:
                 raise NotImplementedError('Do not use + signs in test mode')
             else:
-                val_set = create_dataset(dataset_opt, scale=opt['scale'],
-                                         kernel_size=opt['datasets']['train']['kernel_size'],
-                                         model_name=opt['network_E']['which_model_E'])
+                if shared is not None:
+                    val_set = shared['val_set']
+                else:
+                    val_set = create_dataset(dataset_opt, scale=opt['scale'],
+                                             kernel_size=opt['datasets']['train']['kernel_size'],
+                                             model_name=opt['network_E']['which_model_E'])
                 # val_set = loader.get_dataset(opt, train=False)
                 val_loader = create_dataloader(val_set, dataset_opt, opt, None)
 
@@ -103,47 +196,187 @@ def main():
             raise NotImplementedError('Phase [{:s}] is not recognized.'.format(phase))
 
     #### create model
-    models = create_model(opt)
-    assert len(models) == 2
-    model, est_model = models[0], models[1]
-    modelcp, est_modelcp = create_model(opt)
-    _, est_model_fixed = create_model(opt)
-
-    center_idx = (opt['datasets']['val']['N_frames']) // 2
-    lr_alpha = opt['train']['maml']['lr_alpha']
-    update_step = opt['train']['maml']['adapt_iter']
+    # Models, adaptation session and inner loop are built once by the runner
+    if shared is not None and shared.get('runner', None) is not None:
+        runner = shared['runner']
+        # The SLR targets of the previous call belong to another degradation
+        runner.slr_cache.reset()
+    else:
+        runner = DynaVSRRunner(opt, frame_shape=tuple(val_set[0]['LQs'].shape), reference=True,
+                               shared_weights=shared['weights'] if shared is not None else None)
+    model, est_model = runner.model, runner.est_model
+    modelcp, est_modelcp = runner.modelcp, runner.est_modelcp
+    model_fixed = runner.model_fixed
+    slr_cache, session = runner.slr_cache, runner.session
+    val_opt = opt['datasets']['val']
+    center_idx = runner.center_idx
+    lr_alpha = runner.lr_alpha
+    filter_G, detach_G_input, adapt_E = runner.filter_G, runner.detach_G_input, runner.adapt_E
+    meta_sgd = runner.meta_sgd
+    crop, adapt = runner.crop, runner.adapt
     with_GT = False if opt['datasets']['val']['mode'] == 'demo' else True
 
-    pd_log = pd.DataFrame(columns=['PSNR_Bicubic', 'PSNR_Ours', 'SSIM_Bicubic', 'SSIM_Ours'])
+    # Frames run by this process, and per-worker logs when sharded (merged by launch_dynavsr.py)
+    indices = list(range(len(val_set))) if shard is None else list(shard[1])
+    log_suffix = '' if shard is None else '_shard{:d}'.format(shard[0])
+    log_path = os.path.join('../test_results', folder_name, 'psnr_update{}.csv'.format(log_suffix))
+    state_path = os.path.join('../test_results', folder_name, 'resume_state{}.pth'.format(log_suffix))
+    # Telemetry: per-frame time of every stage (utils.telemetry) and peak memory, next to the metrics
+    telemetry = opt['telemetry']
+    if telemetry:
+        runner.timer = StageTimer(modelcp.device)
+    timer = runner.timer
+    # pd_log is append-only: rows are buffered and appended in batches of log_flush, and the
+    # table is only loaded back for resuming and for the summaries at the end
+    # Saved_Warm: steps a warm start (or bank entry) avoided against the step budget of a frame
+    # adapted from the meta weights, Saved_Early: steps early stopping cut from the planned ones.
+    # Time is the adaptation time of the batch of Batch frames the frame was adapted in (adapt_batch)
+    log_columns = ['PSNR_Bicubic', 'PSNR_Ours', 'SSIM_Bicubic', 'SSIM_Ours', 'Adapted', 'Steps',
+                   'Saved_Warm', 'Saved_Early', 'Drift', 'Time', 'Batch'] \
+        + (TELEMETRY_COLUMNS if telemetry else [])
+    results = None
+    if with_GT:
+        results = ResultLog(log_path, log_columns, flush_every=val_opt['log_flush'] if val_opt['log_flush'] else 50,
+                            append=args.resume or opt['resume'])
+
+    # Adaptation amortization: every frame (default), once per clip, once every K frames,
+    # or whenever the degradation signature of the frames drifts
+    adapt_mode = opt['train']['maml']['adapt_mode'] if opt['train']['maml']['adapt_mode'] else 'frame'
+    adapt_interval = opt['train']['maml']['adapt_interval'] if opt['train']['maml']['adapt_interval'] else 1
+    adapt_windows = opt['train']['maml']['adapt_windows'] if opt['train']['maml']['adapt_windows'] else 3
+    if adapt_mode not in ['frame', 'clip', 'interval', 'drift']:
+        raise NotImplementedError('Adaptation mode [{:s}] is not recognized.'.format(adapt_mode))
+    drift_monitor = None
+    if adapt_mode == 'drift':
+        drift_monitor = DriftMonitor(
+            opt['train']['maml']['drift_threshold'] if opt['train']['maml']['drift_threshold'] is not None else 0.1,
+            momentum=opt['train']['maml']['drift_momentum'] if opt['train']['maml']['drift_momentum'] else 0.)
+    # Warm start: chain the adapted weights of consecutive adaptations within a clip
+    warm_start = opt['train']['maml']['warm_start']
+    warm_start_iter = opt['train']['maml']['warm_start_iter'] if opt['train']['maml']['warm_start_iter'] is not None else opt['train']['maml']['adapt_iter']
+    warm_start_decay = opt['train']['maml']['warm_start_decay'] if opt['train']['maml']['warm_start_decay'] else 0.
+    warm_start_reset = opt['train']['maml']['warm_start_reset']  # hard reset every N adaptations
+    steps_saved = {}  # folder -> [warm start, early stopping] savings
+    # Early stopping (early_stop in the options) is handled by the runner: update_step is
+    # the per-frame ceiling, raised to max_adapt_iter if set
+    maml_opt = opt['train']['maml']
+    update_step = runner.update_step
+    # Warm-start bank: adapted weights of previous clips persisted on disk, keyed by degradation.
+    # A clip with a near enough entry starts from it (instead of the meta weights) with bank_iter steps
+    bank = None
+    if maml_opt['warm_start_bank']:
+        bank = WarmStartBank(maml_opt['warm_start_bank'], session.flat.numel(),
+                             capacity=maml_opt['bank_size'] if maml_opt['bank_size'] else 32,
+                             max_distance=maml_opt['bank_distance'] if maml_opt['bank_distance'] is not None else 0.1)
+        bank_iter = maml_opt['bank_iter'] if maml_opt['bank_iter'] is not None else warm_start_iter
+        bank_key_mode = maml_opt['bank_key'] if maml_opt['bank_key'] else 'signature'
+        if bank_key_mode not in ['signature', 'kernel']:
+            raise NotImplementedError('Bank key [{:s}] is not recognized.'.format(bank_key_mode))
+        if bank_key_mode == 'kernel' and val_opt['degradation_mode'] != 'set':
+            raise NotImplementedError('bank_key [kernel] needs degradation_mode [set].')
+
+    def degradation_key(val_data):
+        """Descriptor of the degradation of a clip, from its first frame"""
+        if bank_key_mode == 'kernel':
+            return [val_opt['sigma_x'], val_opt['sigma_y'], val_opt['theta']]
+        return degradation_signature(val_data['LQs'], slr_cache.get(val_data)).tolist()
+
+    # Dataset indices of each clip, in frame order
+    clip_indices = {}
+    for i, clip in enumerate(val_set.data_info['folder']):
+        clip_indices.setdefault(clip, []).append(i)
+
+    def sample_windows(val_data, folder, idx_d):
+        """
+        Select the windows used to adapt the weights that serve the frames from idx_d on.
 
-    def crop(LR_seq, HR, num_patches_for_batch=4, patch_size=44):
+        Return:
+            list of batched (B=1) windows
         """
-        Crop given patches.
+        if adapt_mode in ['frame', 'drift']:
+            return [val_data]
+        if adapt_mode == 'clip':
+            segment = clip_indices[folder]
+        else:
+            segment = clip_indices[folder][idx_d:idx_d + adapt_interval]
+        num_windows = min(adapt_windows, len(segment))
+        picks = sorted(set(int(round(p)) for p in np.linspace(0, len(segment) - 1, num_windows)))
+        windows = []
+        for p in picks:
+            if segment[p] == clip_indices[folder][idx_d]:
+                windows.append(val_data)
+            else:
+                windows.append(default_collate([val_set[segment[p]]]))
+        return windows
+
+    # Concurrent adaptation of several frames, each with its own weights (frame mode only)
+    adapt_batch_size = opt['train']['maml']['adapt_batch'] if opt['train']['maml']['adapt_batch'] else 1
+    batched = None
+    if adapt_batch_size > 1:
+        if adapt_mode != 'frame':
+            print('adapt_batch is only used with adapt_mode [frame]. Adapting one frame at a time.')
+        elif opt['network_G']['which_model_G'] == 'EDVR':
+            print('The DCN of EDVR cannot be vectorized. Adapting one frame at a time.')
+        elif meta_sgd:
+            print('adapt_batch does not support Meta-SGD step sizes. Adapting one frame at a time.')
+        elif runner.tile_size or runner.adapt_tile:
+            print('adapt_batch does not support tiles (tile_size / adapt_tile). Adapting one frame at a time.')
+        elif runner.lora:
+            print('adapt_batch does not support low-rank adapters (lora_rank). Adapting one frame at a time.')
+        elif runner.self_ensemble:
+            print('adapt_batch does not support self_ensemble. Adapting one frame at a time.')
+        elif runner.early_stopping is not None:
+            print('adapt_batch does not support early_stop. Adapting one frame at a time.')
+        elif warm_start or maml_opt['warm_start_bank']:
+            print('adapt_batch does not support warm_start / warm_start_bank. Adapting one frame at a time.')
+        elif maml_opt['memory_budget']:
+            print('adapt_batch does not support memory_budget. Adapting one frame at a time.')
+        elif runner.prefix_cache is not None:
+            print('adapt_batch does not support prefix_cache. Adapting one frame at a time.')
+        elif not batched_adaptation_available():
+            print('adapt_batch requires torch.func (PyTorch >= 2.0). Adapting one frame at a time.')
+        else:
+            batched = BatchedAdaptation([model.netG, est_model.netE],
+                                        [lr_alpha, lr_alpha if adapt_E else None],
+                                        opt['train']['maml'], adapt_batch_size, filters=[filter_G, None])
+            call_G, call_E = batched.call(0), batched.call(1)
+            print('Adapting {:d} frames at a time (adapt_batch).'.format(adapt_batch_size))
+
+    def batched_loss(states, src_seq, GT, slr_initialized):
+        """SLR loss of one frame under BatchedAdaptation, same as inner_loss"""
+        # Make SuperLR seq using UPDATED estimation model
+        if not opt['train']['use_real']:
+            B, T, C, H, W = src_seq.shape
+            if est_modelcp.mode == 'image':
+                superlr_seq = call_E(states[1], src_seq.reshape(B*T, C, H, W))
+                superlr_seq = superlr_seq.reshape(B, T, C, superlr_seq.size(-2), superlr_seq.size(-1))
+            else:
+                superlr_seq = call_E(states[1], src_seq.transpose(1, 2)).transpose(1, 2)
+        else:
+            superlr_seq = src_seq
+        train_seq, slr_seq = superlr_seq, superlr_seq
 
-        Args:
-            LR_seq: (B=1) x T x C x H x W
-            HR: (B=1) x C x H x W
+        if opt['network_G']['which_model_G'] == 'TOF':
+            # Bicubic upsample to match the size
+            B, T, C, H, W = superlr_seq.shape
+            LQs = superlr_seq.reshape(B*T, C, H, W)
+            Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
+            train_seq = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
+            slr_seq = LQs.squeeze(0)
+        if detach_G_input:
+            train_seq = train_seq.detach()
 
-            patch_size (int, optional):
+        if opt['train']['maml']['use_patch']:
+            # Crop positions are shared by the frames of one batch
+            train_seq, GT = crop(train_seq, GT, opt['train']['maml']['num_patch'],
+                                 opt['train']['maml']['patch_size'])
 
-        Return:
-            B(=batch_size) x T x C x H x W
-        """
-        # Find the lowest resolution
-        cropped_lr = []
-        cropped_hr = []
-        assert HR.size(0) == 1
-        LR_seq_ = LR_seq[0]
-        HR_ = HR[0]
-        for _ in range(num_patches_for_batch):
-            patch_lr, patch_hr = preprocessing.common_crop(LR_seq_, HR_, patch_size=patch_size // 2)
-            cropped_lr.append(patch_lr)
-            cropped_hr.append(patch_hr)
-
-        cropped_lr = torch.stack(cropped_lr, dim=0)
-        cropped_hr = torch.stack(cropped_hr, dim=0)
-
-        return cropped_lr, cropped_hr
+        fake_H = call_G(states[0], train_seq)
+        loss_train = modelcp.l_pix_w * modelcp.cri_pix(fake_H, GT)
+
+        ##################### SLR LOSS ###################
+        loss_train = loss_train + 10 * F.l1_loss(slr_seq, slr_initialized)
+        return loss_train
 
     # Single GPU
     # PSNR_rlt: psnr_init, psnr_before, psnr_after
@@ -151,22 +384,21 @@ def main():
     # SSIM_rlt: ssim_init, ssim_after
     ssim_rlt = [{}, {}]
 
-    pbar = util.ProgressBar(len(val_set))
-    for val_data in val_loader:
-        folder = val_data['folder'][0]
-        idx_d = int(val_data['idx'][0].split('/')[0])
+    def prepare(val_data):
+        """Per-frame setup: output folder, test input and the bicubic-trained reference"""
+        frame = {'val_data': val_data}
+        frame['folder'] = folder = val_data['folder'][0]
+        frame['idx_d'] = int(val_data['idx'][0].split('/')[0])
         if 'name' in val_data.keys():
             name = val_data['name'][0][center_idx][0]
         else:
             name = folder
 
         train_folder = os.path.join(opt['path']['img_save_path'], 'DynaVSR-R', name)
-        maml_train_folder = train_folder
+        frame['maml_train_folder'] = train_folder
 
-        if not os.path.exists(train_folder):
-            os.makedirs(train_folder, exist_ok=False)
-        if not os.path.exists(maml_train_folder):
-            os.mkdir(maml_train_folder)
+        # Shards / serving threads of the same experiment create it concurrently
+        os.makedirs(train_folder, exist_ok=True)
 
         for i in range(len(psnr_rlt)):
             if psnr_rlt[i].get(folder, None) is None:
@@ -175,12 +407,8 @@ def main():
             if ssim_rlt[i].get(folder, None) is None:
                 ssim_rlt[i][folder] = []
         
-        cropped_meta_train_data = {}
-        meta_train_data = {}
         meta_test_data = {}
 
-        # Make SuperLR seq using estimation model
-        meta_train_data['GT'] = val_data['LQs'][:, center_idx]
         meta_test_data['LQs'] = val_data['LQs'][0:1]
         meta_test_data['GT'] = val_data['GT'][0:1, center_idx] if with_GT else None
         # Check whether the batch size of each validation data is 1
@@ -192,118 +420,62 @@ def main():
             LQs = LQs.reshape(B*T, C, H, W)
             Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
             meta_test_data['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
+        frame['meta_test_data'] = meta_test_data
         
         ## Before start testing
-        # Bicubic Model Results
-        modelcp.load_network(opt['path']['bicubic_G'], modelcp.netG)
-        modelcp.feed_data(meta_test_data, need_GT=with_GT)
-        modelcp.test()
-
+        # Bicubic Model Results (only the forward here, metrics are computed by the writers)
         if with_GT:
-            model_start_visuals = modelcp.get_current_visuals(need_GT=True)
-            hr_image = util.tensor2img(model_start_visuals['GT'], mode='rgb')
-            start_image = util.tensor2img(model_start_visuals['rlt'], mode='rgb')
-            psnr_rlt[0][folder].append(util.calculate_psnr(start_image, hr_image))
-            ssim_rlt[0][folder].append(util.calculate_ssim(start_image, hr_image))
+            # Tiled / self-ensembled like the adapted forward
+            frame['GT'] = meta_test_data['GT'][0].float().cpu()
+            with timer.stage('reference'):
+                frame['bicubic'] = runner.test(model_fixed, meta_test_data['LQs'])
+        return frame
 
-        modelcp.netG, est_modelcp.netE = deepcopy(model.netG), deepcopy(est_model.netE)
-
-        ########## SLR LOSS Preparation ############
-        est_model_fixed.load_network(opt['path']['fixed_E'], est_model_fixed.netE)
-
-        optim_params = []
-        for k, v in modelcp.netG.named_parameters():
-            if v.requires_grad:
-                optim_params.append(v)
-        
-        if not opt['train']['use_real']:
-            for k, v in est_modelcp.netE.named_parameters():
-                if v.requires_grad:
-                    optim_params.append(v)
-        
-        if opt['train']['maml']['optimizer'] == 'Adam':
-            inner_optimizer = torch.optim.Adam(optim_params, lr=lr_alpha,
-                                               betas=(
-                                                   opt['train']['maml']['beta1'],
-                                                   opt['train']['maml']['beta2']))
-        elif opt['train']['maml']['optimizer'] == 'SGD':
-            inner_optimizer = torch.optim.SGD(optim_params, lr=lr_alpha)
-        else:
-            raise NotImplementedError()
+    def write_and_measure(frame, output):
+        """CPU-side work of one frame, run by the writer threads: PNG encoding and metrics
 
-        # Inner Loop Update
+        Return:
+            metrics (None without GT) and the time of the convert / write / metrics stages
+        """
+        times = {}
         st = time.time()
-        for i in range(update_step):
-            # Make SuperLR seq using UPDATED estimation model
-            if not opt['train']['use_real']:
-                est_modelcp.feed_data(val_data)
-                est_modelcp.forward_without_optim()
-                superlr_seq = est_modelcp.fake_L
-                meta_train_data['LQs'] = superlr_seq
-            else:
-                meta_train_data['LQs'] = val_data['SuperLQs']
-
-            if opt['network_G']['which_model_G'] == 'TOF':
-                # Bicubic upsample to match the size
-                LQs = meta_train_data['LQs']
-                B, T, C, H, W = LQs.shape
-                LQs = LQs.reshape(B*T, C, H, W)
-                Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
-                meta_train_data['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
-
-            # Update both modelcp + estmodelcp jointly
-            inner_optimizer.zero_grad()
-            if opt['train']['maml']['use_patch']:
-                cropped_meta_train_data['LQs'], cropped_meta_train_data['GT'] = \
-                    crop(meta_train_data['LQs'], meta_train_data['GT'],
-                         opt['train']['maml']['num_patch'],
-                         opt['train']['maml']['patch_size'])
-                modelcp.feed_data(cropped_meta_train_data)
-            else:
-                modelcp.feed_data(meta_train_data)
-
-            loss_train = modelcp.calculate_loss()
-            
-            ##################### SLR LOSS ###################
-            est_model_fixed.feed_data(val_data)
-            est_model_fixed.test()
-            slr_initialized = est_model_fixed.fake_L
-            slr_initialized = slr_initialized.to('cuda')
-            if opt['network_G']['which_model_G'] == 'TOF':
-                loss_train += 10 * F.l1_loss(LQs.to('cuda').squeeze(0), slr_initialized)
-            else:
-                loss_train += 10 * F.l1_loss(meta_train_data['LQs'].to('cuda'), slr_initialized)
-            
-            loss_train.backward()
-            inner_optimizer.step()
-
-        et = time.time()
-        update_time = et - st
-
-        modelcp.feed_data(meta_test_data, need_GT=with_GT)
-        modelcp.test()
-
-        model_update_visuals = modelcp.get_current_visuals(need_GT=False)
-        update_image = util.tensor2img(model_update_visuals['rlt'], mode='rgb')
+        update_image = util.tensor2img(output, mode='rgb')
+        times['T_Convert'] = time.time() - st
         # Save and calculate final image
-        imageio.imwrite(os.path.join(maml_train_folder, '{:08d}.png'.format(idx_d)), update_image)
-
+        st = time.time()
+        util.atomic_write(os.path.join(frame['maml_train_folder'], '{:08d}.png'.format(frame['idx_d'])),
+                          lambda path: imageio.imwrite(path, update_image))
+        times['T_Write'] = time.time() - st
+        if not with_GT:
+            return None, times
+        st = time.time()
+        hr_image = util.tensor2img(frame['GT'], mode='rgb')
+        start_image = util.tensor2img(frame['bicubic'], mode='rgb')
+        metrics = [util.calculate_psnr(start_image, hr_image), util.calculate_psnr(update_image, hr_image),
+                   util.calculate_ssim(start_image, hr_image), util.calculate_ssim(update_image, hr_image)]
+        times['T_Metrics'] = time.time() - st
+        return metrics, times
+
+    def record(frame, result, update_time, adapted, num_steps):
+        """Log the metrics of one frame, called in frame order on the main thread"""
+        folder, idx_d = frame['folder'], frame['idx_d']
+        metrics, times = result
         if with_GT:
-            psnr_rlt[1][folder].append(util.calculate_psnr(update_image, hr_image))
-            ssim_rlt[1][folder].append(util.calculate_ssim(update_image, hr_image))
+            psnr_rlt[0][folder].append(metrics[0])
+            psnr_rlt[1][folder].append(metrics[1])
+            ssim_rlt[0][folder].append(metrics[2])
+            ssim_rlt[1][folder].append(metrics[3])
 
             name_df = '{}/{:08d}'.format(folder, idx_d)
-            if name_df in pd_log.index:
-                pd_log.at[name_df, 'PSNR_Bicubic'] = psnr_rlt[0][folder][-1]
-                pd_log.at[name_df, 'PSNR_Ours'] = psnr_rlt[1][folder][-1]
-                pd_log.at[name_df, 'SSIM_Bicubic'] = ssim_rlt[0][folder][-1]
-                pd_log.at[name_df, 'SSIM_Ours'] = ssim_rlt[1][folder][-1]
-            else:
-                pd_log.loc[name_df] = [psnr_rlt[0][folder][-1],
-                                    psnr_rlt[1][folder][-1],
-                                    ssim_rlt[0][folder][-1], ssim_rlt[1][folder][-1]]
-
-            pd_log.to_csv(os.path.join('../test_results', folder_name, 'psnr_update.csv'))
+            row = [psnr_rlt[0][folder][-1], psnr_rlt[1][folder][-1],
+                   ssim_rlt[0][folder][-1], ssim_rlt[1][folder][-1],
+                   int(adapted), num_steps, frame.get('saved_warm', 0), frame.get('saved_early', 0),
+                   frame.get('drift', 0.), update_time, frame.get('batch', 1)]
+            if telemetry:
+                timings = frame['timings']
+                timings.update(times)
+                row += [timings[k] for k in TELEMETRY_COLUMNS]
+            results.append(name_df, row)
 
             pbar.update('Test {} - {}: I: {:.3f}/{:.4f} \tF+: {:.3f}/{:.4f} \tTime: {:.3f}s'
                             .format(folder, idx_d,
@@ -314,6 +486,170 @@ def main():
         else:
             pbar.update()
 
+        # Adaptation state carried to the next frames, saved once this frame is complete
+        # (and logged, so that a resumed run never starts before the saved state)
+        if frame.get('state', None) is not None:
+            if results is not None:
+                results.flush()
+            util.atomic_write(state_path, lambda path: torch.save(frame['state'], path))
+
+    def finish(frame, output, update_time, adapted, num_steps):
+        """Hand the adapted result of one frame over to the writer pool"""
+        writers.submit(write_and_measure, (frame, output),
+                       callback=lambda metrics: record(frame, metrics, update_time, adapted, num_steps))
+
+    def adapt_batch(frames):
+        """Adapt and super-resolve several frames concurrently, each with its own weights"""
+        n = len(frames)
+        st = time.time()
+        batched.reset()
+        device = modelcp.device
+        src_key = 'SuperLQs' if opt['train']['use_real'] else 'LQs'
+        inputs = [torch.stack([f['val_data'][src_key] for f in frames]).to(device),
+                  torch.stack([f['val_data']['LQs'][:, center_idx] for f in frames]).to(device),
+                  torch.stack([slr_cache.get(f['val_data']) for f in frames]).to(device)]
+        # No early stopping here, every frame of the batch takes adapt_iter steps
+        for i in range(opt['train']['maml']['adapt_iter']):
+            batched.step(batched_loss, inputs, n)
+        update_time = time.time() - st
+
+        test_LQs = torch.stack([f['meta_test_data']['LQs'] for f in frames]).to(device)
+        outputs = batched.forward(0, [test_LQs], n)
+        for frame, output in zip(frames, outputs):
+            frame['batch'] = n
+            finish(frame, output[0].float().cpu(), update_time, True, opt['train']['maml']['adapt_iter'])
+
+    adapted_folder = None
+    num_adapted = 0
+    num_warm_started = 0
+    bank_folder, bank_key, bank_delta, bank_hits = None, None, None, 0
+
+    # Resume: continue from the first frame whose PNG or pd_log row is missing. The PNGs and
+    # the carried adaptation state are written atomically, and pd_log drops a partial last row.
+    carries_state = adapt_mode != 'frame' or warm_start
+    start = 0
+    if args.resume or opt['resume']:
+        pd_log = results.load() if with_GT else None
+        frames = [(val_set.data_info['folder'][i], int(val_set.data_info['idx'][i].split('/')[0])) for i in indices]
+        start = resume_point(frames, os.path.join(opt['path']['img_save_path'], 'DynaVSR-R'), pd_log)
+        if with_GT:
+            for clip, idx_d in frames[:start]:
+                row = pd_log.loc['{}/{:08d}'.format(clip, idx_d)]
+                psnr_rlt[0].setdefault(clip, []).append(row['PSNR_Bicubic'])
+                psnr_rlt[1].setdefault(clip, []).append(row['PSNR_Ours'])
+                ssim_rlt[0].setdefault(clip, []).append(row['SSIM_Bicubic'])
+                ssim_rlt[1].setdefault(clip, []).append(row['SSIM_Ours'])
+        if carries_state and start < len(indices) and os.path.exists(state_path):
+            state = torch.load(state_path)
+            # The state is only carried within a clip
+            if state['folder'] == val_set.data_info['folder'][indices[start]]:
+                with torch.no_grad():
+                    session.flat.copy_(state['flat'].to(session.flat))
+                adapted_folder, num_warm_started = state['folder'], state['num_warm_started']
+                if drift_monitor is not None and state['drift_reference'] is not None:
+                    drift_monitor.reference = state['drift_reference'].to(session.flat.device)
+                    drift_monitor.current = drift_monitor.reference.clone()
+        print('Resuming from frame {:d} of {:d}.'.format(start, len(indices)))
+    if start > 0 or len(indices) < len(val_set):
+        val_loader = create_dataloader(torch.utils.data.Subset(val_set, indices[start:]), val_opt, opt, None)
+
+    pending = []
+    pbar = util.ProgressBar(len(indices) - start)
+    # Streaming pipeline: a background thread prefetches the next samples, the main thread
+    # adapts and runs the models, and a pool of writer threads encodes PNGs and computes
+    # metrics. Both queues are bounded and results are logged in frame order.
+    writers = OrderedWorkerPool(num_workers=val_opt['n_writers'] if val_opt['n_writers'] is not None else 4)
+    for val_data in timer.iterate(Prefetcher(val_loader, depth=val_opt['prefetch'] if val_opt['prefetch'] else 2)):
+        frame = prepare(val_data)
+        folder, idx_d = frame['folder'], frame['idx_d']
+
+        if batched is not None:
+            # The batched adaptation itself is only reported as Time
+            frame['timings'] = timer.collect()
+            pending.append(frame)
+            if len(pending) == adapt_batch_size:
+                adapt_batch(pending)
+                num_adapted += len(pending)
+                pending = []
+            continue
+
+        if adapt_mode == 'frame':
+            adapt_now = True
+        elif adapt_mode == 'clip':
+            adapt_now = folder != adapted_folder
+        elif adapt_mode == 'interval':
+            adapt_now = folder != adapted_folder or idx_d % adapt_interval == 0
+        else:
+            # The SLR target is cached, so the signature costs no extra estimator forward
+            if folder != adapted_folder:
+                drift_monitor.reset()
+            with timer.stage('slr'):
+                slr = slr_cache.get(val_data)
+            signature = degradation_signature(val_data['LQs'], slr)
+            adapt_now = drift_monitor.update(signature)
+            frame['drift'] = drift_monitor.drift
+
+        if bank is not None and folder != bank_folder:
+            # Keep the adapted weights of the previous clip, then look up a start for this one
+            if bank_key is not None:
+                bank.store(bank_key, session.delta())
+            bank_folder, bank_key = folder, degradation_key(val_data)
+            bank_delta, _ = bank.lookup(bank_key)
+            bank_hits += int(bank_delta is not None)
+
+        # Inner Loop Update
+        st = time.time()
+        num_steps = 0
+        if adapt_now:
+            if warm_start and folder == adapted_folder and \
+                    (not warm_start_reset or num_warm_started < warm_start_reset):
+                session.warm_start(warm_start_decay)
+                num_steps = warm_start_iter
+                num_warm_started += 1
+            elif bank_delta is not None:
+                session.apply_delta(bank_delta)
+                num_steps = bank_iter
+                num_warm_started = 0
+            else:
+                session.reset()
+                num_steps = update_step
+                num_warm_started = 0
+            planned_steps = num_steps
+            num_steps = adapt(sample_windows(val_data, folder, idx_d), num_steps)
+            # update_step is the budget of a frame adapted from the meta weights (max_adapt_iter
+            # with early stopping), only a warm start lowers the planned steps below it
+            frame['saved_warm'] = max(update_step - planned_steps, 0)
+            frame['saved_early'] = planned_steps - num_steps
+            saved = steps_saved.setdefault(folder, [0, 0])
+            saved[0] += frame['saved_warm']
+            saved[1] += frame['saved_early']
+            adapted_folder = folder
+            num_adapted += 1
+            if drift_monitor is not None:
+                drift_monitor.anchor()
+            if carries_state:
+                frame['state'] = {'folder': folder, 'idx_d': idx_d, 'num_warm_started': num_warm_started,
+                                  'flat': session.flat.detach().cpu().clone(),
+                                  'drift_reference': drift_monitor.reference.cpu() if drift_monitor is not None else None}
+
+        et = time.time()
+        update_time = et - st
+
+        with timer.stage('forward'):
+            output = runner.test(modelcp, frame['meta_test_data']['LQs'])
+        frame['timings'] = timer.collect()
+        finish(frame, output, update_time, adapt_now, num_steps)
+
+    if pending:
+        adapt_batch(pending)
+        num_adapted += len(pending)
+    writers.close()
+    if results is not None:
+        results.close()
+    if bank is not None and bank_key is not None:
+        bank.store(bank_key, session.delta())
+        print('Warm-start bank: {:d} of {:d} clips started from a stored entry.'.format(bank_hits, len(clip_indices)))
+
     if with_GT:
         psnr_rlt_avg = {}
         psnr_total_avg = 0.
@@ -363,14 +699,32 @@ def main():
             log_s += ' {}: {:.4e}'.format(k, v)
         print(log_s)
 
+    if telemetry and with_GT:
+        pd_log = results.load()
+        # Per-clip summary: mean time of every stage per frame, inner steps and peak memory
+        summary = pd_log[['Steps'] + list(STAGE_COLUMNS.values()) + ['Peak_MB']].astype(float)
+        summary = summary.groupby(pd_log.index.map(lambda name: name.split('/')[0])).agg(
+            dict([(k, 'mean') for k in ['Steps'] + list(STAGE_COLUMNS.values())] + [('Peak_MB', 'max')]))
+        summary_path = os.path.join('../test_results', folder_name, 'telemetry{}.csv'.format(log_suffix))
+        util.atomic_write(summary_path, summary.to_csv)
+        print('# Telemetry # mean seconds per frame, peak memory in MB:')
+        print(summary.to_string(float_format=lambda v: '{:.4f}'.format(v)))
+
+    if warm_start or bank is not None or runner.early_stopping is not None:
+        for k, (warm, early) in steps_saved.items():
+            print('Saved inner steps on {}: {:d} by warm start, {:d} by early stopping'.format(k, warm, early))
+    print('Adaptation mode [{:s}]: adapted {:d} times for {:d} frames.'.format(
+        adapt_mode, num_adapted, len(indices)))
     print('End of evaluation.')
+    return log_path if with_GT else None
 
 if __name__ == '__main__':
+    args = parse_args()
     with open(os.path.join(args.save_dir, 'DynaVSR-R.txt'), 'a') as f:
         f.write('OK ' + args.opt + '\n')
     begin = time.time()
 
-    main()
+    main(args)
 
     end = time.time()
     with open(os.path.join(args.save_dir, 'DynaVSR-R.txt'), 'a') as f:
@@ -21,12 +21,13 @@ from models import create_model
 
 
 def init_dist(backend='nccl', **kwargs):
-    """initialization for distributed training"""
+    """initialization for distributed training (nccl on GPUs, gloo on CPUs)"""
     if mp.get_start_method(allow_none=True) != 'spawn':
         mp.set_start_method('spawn')
     rank = int(os.environ['RANK'])
-    num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(rank % num_gpus)
+    if backend == 'nccl':
+        num_gpus = torch.cuda.device_count()
+        torch.cuda.set_device(rank % num_gpus)
     dist.init_process_group(backend=backend, **kwargs)
 
 #### options
@@ -49,6 +50,7 @@ def main():
         opt = option.parse(args.opt, is_train=False)
     else:
         opt = option.parse(args.opt, is_train=False, exp_name=args.exp_name)
+    option.set_threads(opt)
 
     # convert to NoneDict, which returns None for missing keys
     opt = option.dict_to_nonedict(opt)
@@ -269,11 +271,11 @@ def main():
             est_model_fixed.feed_data(val_data)
             est_model_fixed.test()
             slr_initialized = est_model_fixed.fake_L
-            slr_initialized = slr_initialized.to('cuda')
+            slr_initialized = slr_initialized.to(modelcp.device)
             if opt['network_G']['which_model_G'] == 'TOF':
-                loss_train += 10 * F.l1_loss(LQs.to('cuda').squeeze(0), slr_initialized)
+                loss_train += 10 * F.l1_loss(LQs.to(modelcp.device).squeeze(0), slr_initialized)
             else:
-                loss_train += 10 * F.l1_loss(meta_train_data['LQs'].to('cuda'), slr_initialized)
+                loss_train += 10 * F.l1_loss(meta_train_data['LQs'].to(modelcp.device), slr_initialized)
             
             loss_train.backward()
             inner_optimizer.step()
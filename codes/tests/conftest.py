@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# The modules are imported as in the scripts, from the codes directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+
+@pytest.fixture
+def make_runner(tmp_path):
+    """DynaVSRRunner of EDVR_R.yml on the CPU with a tiny EDVR / MFDN and random weights,
+    train.maml updated with the keyword arguments"""
+    torch = pytest.importorskip('torch')
+    import options.options as option
+    from models import networks
+    from models.dynavsr_runner import DynaVSRRunner
+
+    with open(os.path.join(os.path.dirname(__file__), os.pardir, 'options', 'test', 'EDVR', 'EDVR_R.yml')) as f:
+        text = f.read().replace('cpu: false', 'cpu: true')
+    path = str(tmp_path / 'runner.yml')
+    with open(path, 'w') as f:
+        f.write(text)
+
+    def make(network_G=None, **maml):
+        opt = option.dict_to_nonedict(option.parse(path, is_train=False))
+        opt['network_G'].update(nf=8, groups=2, front_RBs=1, back_RBs=1)
+        if network_G:
+            opt['network_G'].update(network_G)
+        opt['network_E']['nf'] = 8
+        opt['train']['maml'].update(optimizer='SGD', lr_alpha=0.1)
+        opt['train']['maml'].update(maml)
+        torch.manual_seed(0)
+        G, E, fixed_E = networks.define_G(opt).state_dict(), networks.define_E(opt).state_dict(), \
+            networks.define_E(opt).state_dict()
+        return DynaVSRRunner(opt, shared_weights={'G': G, 'E': E, 'fixed_E': fixed_E})
+    return make
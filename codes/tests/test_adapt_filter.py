@@ -0,0 +1,51 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import options.options as option
+from models.adaptation import ADAPT_GROUPS, adapt_filter
+from models.archs import DUF_arch, EDVR_arch
+
+
+def maml(**kwargs):
+    opt = {'adapt_params': None, 'freeze_params': None, 'adapt_group': None}
+    opt.update(kwargs)
+    return option.NoneDict(opt)
+
+
+def test_explicit_lists():
+    assert adapt_filter(maml()) is None
+    is_adapted = adapt_filter(maml(adapt_params=['recon_trunk', 'conv_last'], freeze_params=['recon_trunk.0']))
+    assert is_adapted('conv_last.weight') and is_adapted('module.recon_trunk.1.conv1.weight')
+    assert not is_adapted('recon_trunk.0.conv1.weight')
+    # Module path prefixes, not string prefixes
+    assert not is_adapted('conv_last_2.weight')
+    is_adapted = adapt_filter(maml(freeze_params=['conv_first']))
+    assert not is_adapted('conv_first.bias') and is_adapted('tsa_fusion.sAtt_1.weight')
+
+
+def test_groups_name_modules_of_their_networks():
+    edvr = EDVR_arch.EDVR(nf=8, nframes=5, groups=2, front_RBs=1, back_RBs=1)
+    duf = DUF_arch.DUF_16L(scale=2, adapt_official=True)
+    for group, net in [('ft_tsa_only', edvr), ('recon_only', edvr), ('freeze_front', duf)]:
+        is_adapted = adapt_filter(maml(adapt_group=group))
+        adapted = [k for k, _ in net.named_parameters() if is_adapted(k)]
+        assert 0 < len(adapted) < len(list(net.parameters())), group
+    with pytest.raises(NotImplementedError):
+        adapt_filter(maml(adapt_group='everything'))
+    assert set(ADAPT_GROUPS) == {'ft_tsa_only', 'recon_only', 'freeze_front'}
+
+
+def test_runner_only_updates_the_group(make_runner):
+    runner = make_runner(adapt_iter=2, adapt_group='recon_only')
+    is_adapted = runner.filter_G
+    assert runner.detach_G_input
+    netG, meta_G = runner.modelcp.netG, runner.model.netG
+    assert all(v.requires_grad == is_adapted(k) for k, v in netG.named_parameters())
+    runner.adapt_and_upscale(torch.rand(5, 3, 16, 16))
+    meta = dict(meta_G.named_parameters())
+    changed = set(k for k, v in netG.named_parameters() if not torch.equal(v, meta[k]))
+    assert changed and all(is_adapted(k) for k in changed)
+    # The estimator is still adapted, through the SLR loss
+    assert any(not torch.equal(v, m) for v, m in zip(runner.est_modelcp.netE.parameters(),
+                                                     runner.est_model.netE.parameters()))
@@ -0,0 +1,49 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+
+def count_adaptations(runner, monkeypatch):
+    calls = []
+    adapt = runner.adapt
+
+    def recording_adapt(windows, num_steps=None):
+        calls.append(int(windows[0]['idx'].split('/')[0]))
+        return adapt(windows, num_steps)
+    monkeypatch.setattr(runner, 'adapt', recording_adapt)
+    return calls
+
+
+@pytest.mark.parametrize('mode, interval, adapted', [
+    ('frame', None, [0, 1, 2, 3, 4, 5]),
+    ('clip', None, [0]),
+    ('interval', 4, [0, 4]),
+])
+def test_adaptation_schedule(make_runner, monkeypatch, mode, interval, adapted):
+    runner = make_runner(adapt_iter=1)
+    calls = count_adaptations(runner, monkeypatch)
+    frames = [torch.rand(3, 16, 16) for _ in range(6)]
+    outputs = list(runner.upscale_clip(frames, adapt_mode=mode, adapt_interval=interval))
+    assert len(outputs) == 6 and outputs[0].shape == (3, 32, 32)
+    assert calls == adapted
+
+
+def test_adapt_mode_and_interval_default_to_the_options(make_runner, monkeypatch):
+    runner = make_runner(adapt_iter=1, adapt_mode='interval', adapt_interval=3)
+    calls = count_adaptations(runner, monkeypatch)
+    list(runner.upscale_clip([torch.rand(3, 16, 16) for _ in range(6)]))
+    assert calls == [0, 3]
+
+
+def test_every_clip_is_adapted_again(make_runner, monkeypatch):
+    runner = make_runner(adapt_iter=1)
+    calls = count_adaptations(runner, monkeypatch)
+    for _ in range(2):
+        list(runner.upscale_clip([torch.rand(3, 16, 16) for _ in range(5)], adapt_mode='clip'))
+    assert calls == [0, 0]
+
+
+def test_unknown_adapt_mode(make_runner):
+    runner = make_runner(adapt_iter=1)
+    with pytest.raises(NotImplementedError):
+        next(runner.upscale_clip([torch.rand(3, 16, 16)], adapt_mode='scene'))
@@ -0,0 +1,56 @@
+import copy
+
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+from torch.nn import functional as F
+
+from models.adaptation import BatchedAdaptation, batched_adaptation_available
+
+pytestmark = pytest.mark.skipif(not batched_adaptation_available(), reason='needs torch.func')
+
+OPT_MAML = {'optimizer': 'SGD', 'beta1': 0.9, 'beta2': 0.99}
+
+
+def make_net():
+    torch.manual_seed(0)
+    return nn.Sequential(nn.Conv2d(1, 4, 3, padding=1), nn.ReLU(), nn.Conv2d(4, 1, 3, padding=1))
+
+
+def test_batched_step_matches_per_frame_steps():
+    net = make_net()
+    batched = BatchedAdaptation([net], [0.1], OPT_MAML, batch_size=3)
+    batched.reset()
+    inputs = torch.rand(2, 1, 1, 8, 8)
+    targets = torch.rand(2, 1, 1, 8, 8)
+
+    f = batched.call(0)
+
+    def loss_fn(states, x, y):
+        return F.l1_loss(f(states[0], x), y)
+
+    batched.step(loss_fn, [inputs, targets], 2)
+    outputs = batched.forward(0, [inputs], 2)
+
+    for i in range(2):
+        ref = copy.deepcopy(net)
+        optimizer = torch.optim.SGD(ref.parameters(), lr=0.1)
+        F.l1_loss(ref(inputs[i]), targets[i]).backward()
+        optimizer.step()
+        with torch.no_grad():
+            assert torch.allclose(outputs[i], ref(inputs[i]), atol=1e-6)
+
+
+def test_reset_restores_the_meta_weights():
+    net = make_net()
+    batched = BatchedAdaptation([net], [0.1], OPT_MAML, batch_size=2)
+    batched.reset()
+    inputs = torch.rand(2, 1, 1, 8, 8)
+    f = batched.call(0)
+    batched.step(lambda states, x: f(states[0], x).abs().mean(), [inputs], 2)
+    batched.reset()
+    outputs = batched.forward(0, [inputs], 2)
+    with torch.no_grad():
+        for i in range(2):
+            assert torch.allclose(outputs[i], net(inputs[i]), atol=1e-6)
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+import options.options as option
+from data.meta_learner import create_dataloader
+
+OPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'options', 'test', 'EDVR', 'EDVR_R.yml')
+
+
+def cpu_options(tmp_path, extra=''):
+    with open(OPT_PATH, 'r') as f:
+        text = f.read().replace('cpu: false', 'cpu: true')
+    path = str(tmp_path / 'cpu.yml')
+    with open(path, 'w') as f:
+        f.write(text + extra)
+    return path
+
+
+def test_cpu_option(tmp_path):
+    opt = option.parse(cpu_options(tmp_path), is_train=False)
+    assert opt['device'] == 'cpu' and opt['gpu_ids'] is None
+
+
+def test_parse_leaves_the_thread_pools_alone(tmp_path):
+    num_threads = torch.get_num_threads()
+    target = 1 if num_threads != 1 else 2
+    opt = option.parse(cpu_options(tmp_path, 'num_threads: {:d}\n'.format(target)), is_train=False)
+    assert torch.get_num_threads() == num_threads
+    try:
+        option.set_threads(opt)
+        assert torch.get_num_threads() == target
+    finally:
+        torch.set_num_threads(num_threads)
+
+
+def test_train_dataloader_on_the_cpu():
+    dataset = torch.utils.data.TensorDataset(torch.arange(8.))
+    dataset_opt = {'phase': 'train', 'n_workers': 0, 'batch_size': 4}
+    loader = create_dataloader(dataset, dataset_opt, opt={'dist': False, 'gpu_ids': None})
+    assert loader.batch_size == 4 and loader.num_workers == 0
+    assert sum(len(batch[0]) for batch in loader) == 8
+
+
+def test_estimator_runs_on_the_cpu(tmp_path):
+    from models.LRestimator_model import LRimgestimator_Model
+    opt = option.dict_to_nonedict(option.parse(cpu_options(tmp_path), is_train=False))
+    opt['path']['pretrain_model_E'] = None
+    model = LRimgestimator_Model(opt)
+    assert model.device.type == 'cpu' and model.device_ids() is None
+    model.feed_data({'LQs': torch.rand(1, 5, 3, 16, 16)})
+    model.test()
+    assert model.fake_L.shape == (1, 5, 3, 8, 8) and model.fake_L.device.type == 'cpu'
+
+
+def test_edvr_runs_on_the_cpu(tmp_path):
+    import models.networks as networks
+    opt = option.dict_to_nonedict(option.parse(cpu_options(tmp_path), is_train=False))
+    opt['network_G'].update({'nf': 16, 'groups': 2, 'front_RBs': 1, 'back_RBs': 1})
+    netG = networks.define_G(opt)
+    x = torch.rand(1, 5, 3, 16, 16, requires_grad=True)
+    out = netG(x)
+    assert out.shape == (1, 3, 16 * opt['scale'], 16 * opt['scale'])
+    out.mean().backward()
+    assert x.grad is not None
+
+
+def test_deformable_conv_fallback_follows_the_offsets():
+    from models.archs.dcn.deform_conv import ModulatedDeformConvPack, modulated_deform_conv
+    dcn = ModulatedDeformConvPack(4, 4, 3, padding=1, deformable_groups=2)
+    x = torch.rand(1, 4, 8, 8)
+    # (dy, dx) = (0, 1) at every kernel position samples the input one pixel to the right
+    offset = torch.zeros(1, 2 * 2 * 9, 8, 8)
+    offset[:, 1::2] = 1.
+    mask = torch.ones(1, 2 * 9, 8, 8)
+    with torch.no_grad():
+        out = modulated_deform_conv(x, offset, mask, dcn.weight, dcn.bias, 1, 1, 1, 1, 2)
+        shifted = torch.nn.functional.pad(x[..., 1:], (0, 1))
+        ref = torch.nn.functional.conv2d(shifted, dcn.weight, dcn.bias, padding=1)
+    # The first column differs: the fallback samples x[0], the padded reference zero
+    assert torch.allclose(out[..., 1:], ref[..., 1:], atol=1e-5)
+
+
+def test_old_kernel_generator_on_the_cpu():
+    from data import old_kernel_generator as oldkg
+    kernel_gen = oldkg.Degradation(21, 2, type=0.7, theta=0.3, sigma=[1.2, 0.8], device='cpu')
+    assert kernel_gen.get_kernel().device.type == 'cpu'
+    assert abs(float(kernel_gen.get_kernel().sum()) - 1) < 1e-5
+    lr = kernel_gen.apply(torch.rand(2, 3, 32, 32))
+    assert lr.shape == (2, 3, 16, 16) and lr.device.type == 'cpu'
+    # A constant image stays constant under a normalized kernel
+    flat = kernel_gen.apply(torch.full((3, 32, 32), 0.5))
+    assert torch.allclose(flat, torch.full((3, 16, 16), 0.5), atol=1e-4)
@@ -0,0 +1,70 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+from torch.nn import functional as F
+
+from models.adaptation import DriftMonitor, degradation_signature
+
+
+def blurred(x, sigma):
+    radius = 3
+    r = torch.arange(-radius, radius + 1).float()
+    k = torch.exp(-r ** 2 / (2 * sigma ** 2))
+    k = k / k.sum()
+    kernel = (k[:, None] * k[None]).expand(3, 1, -1, -1)
+    return F.conv2d(F.pad(x, [radius] * 4, mode='reflect'), kernel, groups=3)
+
+
+def test_signature_tracks_the_blur_of_the_slr():
+    torch.manual_seed(0)
+    LQs = torch.rand(1, 5, 3, 32, 32)
+    frames = LQs[0]
+
+    def slr(sigma):
+        return F.interpolate(blurred(frames, sigma), scale_factor=0.5, mode='bicubic',
+                             align_corners=False).unsqueeze(0)
+    sharp, blurry = degradation_signature(LQs, slr(0.3)), degradation_signature(LQs, slr(2.0))
+    assert sharp.shape == (7,)
+    # Last entry: gradient energy of the SLR frames relative to a bicubic downscale
+    assert blurry[-1] < sharp[-1] < 1.1
+    assert torch.equal(degradation_signature(LQs, slr(2.0)), blurry)
+
+
+def test_monitor_fires_on_drift_and_anchors():
+    monitor = DriftMonitor(threshold=0.1)
+    a, b = torch.tensor([1., 1., 1.]), torch.tensor([1., 1., 1.5])
+    assert monitor.update(a) and monitor.drift == float('inf')
+    monitor.anchor()
+    assert not monitor.update(a * 1.01)
+    assert monitor.update(b)
+    assert abs(monitor.drift - 0.5 / 3 ** 0.5) < 1e-6
+    monitor.anchor()
+    assert not monitor.update(b)
+    monitor.reset()
+    assert monitor.update(b)
+
+
+def test_momentum_smooths_a_single_outlier():
+    monitor = DriftMonitor(threshold=0.1, momentum=0.9)
+    base = torch.ones(3)
+    monitor.update(base)
+    monitor.anchor()
+    assert not monitor.update(base * 1.5)
+    # Sustained drift gets through the moving average
+    assert any(monitor.update(base * 1.5) for _ in range(10))
+
+
+def test_drift_mode_adapts_when_the_degradation_changes(make_runner, monkeypatch):
+    runner = make_runner(adapt_iter=1, drift_threshold=0.2)
+    calls = []
+    adapt = runner.adapt
+    monkeypatch.setattr(runner, 'adapt', lambda windows, num_steps=None: calls.append(windows[0]['idx']) or
+                        adapt(windows, num_steps))
+    torch.manual_seed(0)
+    scene = torch.rand(3, 16, 16)
+    frames = [scene] * 5 + [blurred(scene[None], 2.0)[0]] * 5
+    list(runner.upscale_clip(frames, adapt_mode='drift'))
+    adapted = [int(idx.split('/')[0]) for idx in calls]
+    # Frames 1 and 2 see the same degradation as frame 0, later windows the blurred frames
+    assert adapted[0] == 0 and 1 < len(adapted) < 10
+    assert all(i >= 3 for i in adapted[1:])
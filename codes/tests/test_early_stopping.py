@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.adaptation import EarlyStopping
+
+
+def run(stopper, losses):
+    """Number of steps taken before the stopper ends the loop"""
+    stopper.reset()
+    for i, loss in enumerate(losses):
+        if stopper.step(loss):
+            return i + 1
+    return len(losses)
+
+
+def test_absolute_and_relative_thresholds():
+    losses = [1.0, 0.5, 0.45, 0.44, 0.3]
+    assert run(EarlyStopping(delta=0.1), losses) == 3
+    assert run(EarlyStopping(delta=0.02), losses) == 4
+    # 0.05 / 0.5 = 10% improvement, then 0.01 / 0.45
+    assert run(EarlyStopping(rel=0.05), losses) == 4
+    assert run(EarlyStopping(rel=0.2), losses) == 3
+    assert run(EarlyStopping(), losses) == len(losses)
+
+
+def test_min_steps_and_patience():
+    losses = [1.0, 1.0, 1.0, 0.5, 0.5, 0.5, 0.5]
+    assert run(EarlyStopping(delta=0.1), losses) == 2
+    assert run(EarlyStopping(delta=0.1, min_steps=4), losses) == 5
+    # The improvement at step 4 clears the stalled count
+    assert run(EarlyStopping(delta=0.1, patience=3), losses) == 7
+
+
+def test_rising_loss_stalls():
+    assert run(EarlyStopping(delta=0.), [1.0, 1.2]) == 2
+
+
+def test_runner_stops_early(make_runner):
+    runner = make_runner(adapt_iter=2, max_adapt_iter=6, early_stop=True, stop_delta=float('inf'), min_adapt_iter=3)
+    assert runner.update_step == 6
+    runner.session.reset()
+    window = runner._window_data(torch.rand(5, 3, 16, 16), 'clip', 2, 5)
+    assert runner.adapt([window]) == 3
+    assert runner.adapt([window], 2) == 2
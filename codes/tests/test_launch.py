@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('pandas')
+import torch.nn as nn
+
+from launch_dynavsr import shard_indices, split_cores
+from models import weight_registry
+
+
+class FakeTestSet():
+    def __init__(self, clip_lengths):
+        self.data_info = {'folder': [clip for clip, n in clip_lengths for _ in range(n)]}
+
+    def __len__(self):
+        return len(self.data_info['folder'])
+
+
+def test_shard_by_clip_keeps_clips_whole():
+    val_set = FakeTestSet([('a', 5), ('b', 3), ('c', 2), ('d', 2)])
+    shards = shard_indices(val_set, 2, 'clip')
+    assert sorted(i for shard in shards for i in shard) == list(range(len(val_set)))
+    for shard in shards:
+        clips = set(val_set.data_info['folder'][i] for i in shard)
+        for clip in clips:
+            assert val_set.data_info['folder'].count(clip) == \
+                sum(val_set.data_info['folder'][i] == clip for i in shard)
+    assert sorted(len(shard) for shard in shards) == [5, 7]
+
+
+def test_shard_by_frame_is_contiguous_and_balanced():
+    shards = shard_indices(FakeTestSet([('a', 7)]), 3, 'frame')
+    assert shards == [[0, 1], [2, 3], [4, 5, 6]]
+    with pytest.raises(NotImplementedError):
+        shard_indices(FakeTestSet([('a', 7)]), 3, 'folder')
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'), reason='needs CPU affinity')
+def test_split_cores():
+    available = sorted(os.sched_getaffinity(0))
+    cores = split_cores(2)
+    assert len(cores) == 2
+    assert all(len(c) == max(len(available) // 2, 1) for c in cores)
+    if len(available) >= 2:
+        assert not set(cores[0]) & set(cores[1])
+    assert [len(c) for c in split_cores(3, threads=1)] == [1, 1, 1]
+
+
+def test_bound_networks_share_the_registered_tensors(tmp_path):
+    net = nn.Conv2d(3, 3, 3)
+    path = os.path.join(str(tmp_path), 'net.pth')
+    torch.save(net.state_dict(), path)
+    state_dict = weight_registry.share(path)
+    copies = [nn.Conv2d(3, 3, 3) for _ in range(2)]
+    for copy in copies:
+        weight_registry.bind(copy, state_dict)
+    assert copies[0].weight.data_ptr() == copies[1].weight.data_ptr() == state_dict['weight'].data_ptr()
+    assert torch.equal(copies[0].weight, net.weight)
+    weight_registry.release(path)
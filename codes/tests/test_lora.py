@@ -0,0 +1,50 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+
+from models.lora import LoRAConv, attach_lora, is_lora_param, merged
+
+
+class TinyNet(nn.Module):
+    def __init__(self):
+        super(TinyNet, self).__init__()
+        self.conv_first = nn.Conv2d(3, 8, 3, padding=1)
+        self.conv3d = nn.Conv3d(8, 8, 3, padding=1)
+        self.conv_last = nn.Conv2d(8, 3, 3, padding=1)
+
+    def forward(self, x):
+        x = self.conv_first(x)
+        x = self.conv3d(x.unsqueeze(2)).squeeze(2)
+        return self.conv_last(x)
+
+
+def test_lora_is_the_plain_network_at_init():
+    torch.manual_seed(0)
+    net = TinyNet()
+    x = torch.rand(2, 3, 8, 8)
+    with torch.no_grad():
+        ref = net(x)
+    keys = set(net.state_dict().keys())
+    assert attach_lora(net, rank=2) == 3
+    assert isinstance(net.conv3d, LoRAConv)
+    assert torch.allclose(net(x), ref, atol=1e-6)
+    assert set(net.state_dict().keys()) - keys == \
+        set(name for name in net.state_dict().keys() if is_lora_param(name))
+
+
+def test_merged_forward_matches_and_restores_the_weights():
+    torch.manual_seed(0)
+    net = TinyNet()
+    attach_lora(net, rank=2, modules=['conv_last'])
+    assert not isinstance(net.conv_first, LoRAConv)
+    with torch.no_grad():
+        net.conv_last.lora_B.normal_()
+    x = torch.rand(2, 3, 8, 8)
+    weight = net.conv_last.weight.detach().clone()
+    with torch.no_grad():
+        ref = net(x)
+        with merged([net]):
+            assert not torch.equal(net.conv_last.weight, weight)
+            assert torch.allclose(net(x), ref, atol=1e-5)
+    assert torch.equal(net.conv_last.weight, weight)
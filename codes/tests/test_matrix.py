@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('pandas')
+
+import matrix_dynavsr
+import test_dynavsr
+
+OPT_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'options', 'test', 'EDVR', 'EDVR_R.yml')
+
+
+def test_every_cell_saves_its_images_in_its_own_folder():
+    settings = matrix_dynavsr.load_settings(None, 'impulse')
+    folders = set()
+    for setting in settings:
+        args = test_dynavsr.parse_args(matrix_dynavsr.cell_argv(OPT_PATH, setting, '../test_results', []))
+        opt, _ = test_dynavsr.load_options(args)
+        folders.add(opt['path']['img_save_path'])
+    assert len(folders) == len(settings)
+
+
+def test_settings():
+    settings = matrix_dynavsr.load_settings(None, 'impulse')
+    assert settings[-1] == 'preset'
+    assert matrix_dynavsr.setting_name(settings[0]) == 'impulse_0.8_0.8_0'
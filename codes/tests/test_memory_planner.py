@@ -0,0 +1,87 @@
+import warnings
+
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+
+from models.memory_planner import MemoryPlanner, CheckpointedSequential, enable_checkpointing
+
+OPT_MAML = {'use_patch': False, 'num_patch': 4, 'patch_size': 32}
+
+
+class TinyG(nn.Module):
+    def __init__(self):
+        super(TinyG, self).__init__()
+        self.conv_first = nn.Conv2d(3, 8, 3, padding=1)
+        self.trunk = nn.Sequential(*[nn.Conv2d(8, 8, 3, padding=1) for _ in range(9)])
+        self.conv_last = nn.Conv2d(8, 3, 3, padding=1)
+
+    def forward(self, x):
+        return self.conv_last(self.trunk(self.conv_first(x[:, x.shape[1] // 2])))
+
+
+def make_planner(frozen_front=False, G_input_grad=False):
+    torch.manual_seed(0)
+    netG = TinyG()
+    if frozen_front:
+        netG.conv_first.weight.requires_grad_(False)
+        netG.conv_first.bias.requires_grad_(False)
+    return MemoryPlanner(netG, None, 'video', (5, 3, 64, 64), 1, optimizer='SGD',
+                         G_input_grad=G_input_grad)
+
+
+def test_checkpointing_only_counted_when_it_runs():
+    planner = make_planner(frozen_front=True)
+    assert planner.G_px_ckpt == planner.G_px
+    assert planner.G_recompute == 0.
+
+    planner = make_planner(frozen_front=True, G_input_grad=True)
+    assert planner.G_px_ckpt < planner.G_px
+    planner = make_planner()
+    assert planner.G_px_ckpt < planner.G_px
+
+
+def test_groups_are_sorted_by_cost():
+    planner = make_planner()
+    for group in planner.candidates(OPT_MAML):
+        costs = [planner.cost(*plan) for plan in group]
+        assert costs == sorted(costs)
+        assert not group[0][3]
+
+
+def test_plan_is_the_cheapest_fitting_one():
+    planner = make_planner()
+    full, full_ckpt = (False, 4, 32, False), (False, 4, 32, True)
+    plan = planner.plan(OPT_MAML, planner.estimate(*full))
+    assert plan['fits'] and not plan['use_patch'] and not plan['checkpointing']
+
+    plan = planner.plan(OPT_MAML, planner.estimate(*full_ckpt))
+    assert plan['fits'] and not plan['use_patch'] and plan['checkpointing']
+
+    plan = planner.plan(OPT_MAML, 0)
+    assert not plan['fits']
+
+
+def test_checkpointed_forward_matches():
+    torch.manual_seed(0)
+    net = TinyG()
+    x = torch.rand(1, 3, 3, 8, 8, requires_grad=True)
+    ref = net(x)
+    assert enable_checkpointing(net) == 1
+    assert isinstance(net.trunk, CheckpointedSequential)
+    assert torch.allclose(net(x), ref)
+
+
+def test_checkpointed_gradients_match_without_warnings():
+    torch.manual_seed(0)
+    net = TinyG()
+    x = torch.rand(1, 3, 3, 8, 8, requires_grad=True)
+    net(x).sum().backward()
+    ref = [p.grad.clone() for p in net.parameters()]
+    net.zero_grad()
+    enable_checkpointing(net)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        net(x).sum().backward()
+    assert all(torch.allclose(p.grad, g, atol=1e-6) for p, g in zip(net.parameters(), ref))
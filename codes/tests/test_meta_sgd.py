@@ -0,0 +1,73 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+
+from models.adaptation import AdaptationSession
+from models.meta_sgd import InnerLearningRates, MetaSGD
+
+
+def make_net():
+    torch.manual_seed(0)
+    net = nn.Sequential(nn.Conv2d(3, 4, 3), nn.Conv2d(4, 3, 1))
+    net[1].bias.requires_grad_(False)
+    return net
+
+
+def test_step_sizes_follow_the_adapted_parameters():
+    net = make_net()
+    per_element = InnerLearningRates(net, 0.01)
+    per_layer = InnerLearningRates(net, 0.01, per_layer=True)
+    assert len(per_element.step_sizes) == len(per_layer.step_sizes) == 3
+    assert per_element.get('0.weight').shape == net[0].weight.shape
+    assert per_layer.get('module.0.weight').shape == (1, )
+    assert torch.all(per_element.get('1.weight') == 0.01)
+    assert [s for _, s in per_element.pairs(net)] == [per_element.get(k) for k in ['0.weight', '0.bias', '1.weight']]
+    # Saved and loaded like a network
+    copy = InnerLearningRates(net, 0.)
+    copy.load_state_dict(per_element.state_dict())
+    assert torch.equal(copy.get('0.bias'), per_element.get('0.bias'))
+
+
+def test_meta_sgd_takes_per_element_steps():
+    net = make_net()
+    lrs = InnerLearningRates(net, 0.1)
+    with torch.no_grad():
+        lrs.get('0.weight')[0].fill_(0.)
+    params = [v for v in net.parameters() if v.requires_grad]
+    optimizer = MetaSGD([{'params': params, 'lr': 0., 'step_sizes': [s for _, s in lrs.pairs(net)]}])
+    before = [v.detach().clone() for v in params]
+    net(torch.rand(1, 3, 8, 8)).sum().backward()
+    optimizer.step()
+    for v, b, (_, s) in zip(params, before, lrs.pairs(net)):
+        assert torch.allclose(v, b - s * v.grad)
+    assert torch.equal(net[0].weight[0], before[0][0])
+    assert all(s.grad is None for s in lrs.parameters())
+
+
+def test_first_order_step_size_gradient():
+    torch.manual_seed(0)
+    theta, g = torch.rand(5), torch.rand(5)
+    for per_layer in [False, True]:
+        lr = torch.full((1, ) if per_layer else (5, ), 0.1, requires_grad=True)
+        adapted = theta - lr * g
+        loss = (adapted ** 2).sum()
+        expected, = torch.autograd.grad(loss, lr)
+        step_size = nn.Parameter(lr.detach().clone())
+        InnerLearningRates.accumulate_grad(step_size, g, 2 * adapted.detach())
+        assert torch.allclose(step_size.grad, expected)
+        # Accumulated over the tasks of a meta batch
+        InnerLearningRates.accumulate_grad(step_size, g, 2 * adapted.detach())
+        assert torch.allclose(step_size.grad, 2 * expected)
+
+
+def test_session_uses_meta_sgd_for_learned_step_sizes():
+    net = make_net()
+    lrs = InnerLearningRates(net, 0.05)
+    session = AdaptationSession([net], [lrs], {'optimizer': 'Adam', 'beta1': 0.9, 'beta2': 0.99})
+    assert isinstance(session.optimizer, MetaSGD)
+    working = session.nets[0]
+    working(torch.rand(1, 3, 8, 8)).sum().backward()
+    grad = working[0].weight.grad.clone()
+    session.optimizer.step()
+    assert torch.allclose(working[0].weight, net[0].weight - 0.05 * grad)
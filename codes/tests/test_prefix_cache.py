@@ -0,0 +1,44 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.adaptation import PrefixCache
+from models.archs import DUF_arch, TOF_arch
+
+RECON_ONLY = {'adapt_group': 'recon_only', 'adapt_estimator': False}
+
+
+def test_cached_adaptation_matches_the_full_network(make_runner):
+    frames = torch.rand(5, 3, 16, 16)
+    outputs = []
+    for prefix_cache in [False, True]:
+        runner = make_runner(adapt_iter=3, prefix_cache=prefix_cache, **RECON_ONLY)
+        assert (runner.prefix_cache is not None) == prefix_cache
+        outputs.append(runner.adapt_and_upscale(frames))
+    assert torch.allclose(outputs[0], outputs[1], atol=1e-6)
+    # Three steps move the weights away from the meta weights
+    assert not torch.allclose(outputs[1], runner.adapt_and_upscale(frames, num_steps=0), atol=1e-4)
+
+
+def test_adapted_prefix_is_not_cached(make_runner):
+    assert make_runner(prefix_cache=True, adapt_estimator=False).prefix_cache is None
+    assert make_runner(prefix_cache=True, adapt_group='recon_only').prefix_cache is None
+
+
+def test_random_crops_need_an_explicit_option(make_runner):
+    assert make_runner(prefix_cache=True, use_patch=True, patch_size=8, **RECON_ONLY).prefix_cache is None
+    assert make_runner(prefix_cache=True, use_patch=True, patch_size=8, prefix_cache_fixed_crops=True,
+                       **RECON_ONLY).prefix_cache is not None
+
+
+@pytest.mark.parametrize('net', [lambda: TOF_arch.TOFlow(adapt_official=True),
+                                 lambda: DUF_arch.DUF_16L(scale=2, adapt_official=True)])
+def test_prefix_with_batch_statistics_is_not_cached(net):
+    net = net()
+    frozen = lambda k: not any(k.startswith(p + '.') for p in net.prefix_modules)
+    assert PrefixCache.batch_statistics(net)
+    assert not PrefixCache.supported(net, frozen)
+    # In eval mode BatchNorm uses its running stats, the prefix is a fixed function again
+    net.eval()
+    assert not PrefixCache.batch_statistics(net)
+    assert PrefixCache.supported(net, frozen)
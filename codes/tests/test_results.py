@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from utils.results import ResultLog, load_results, clip_average
+
+COLUMNS = ['PSNR_Bicubic', 'PSNR_Ours']
+
+
+def test_rows_are_appended_and_reloaded(tmp_path):
+    path = os.path.join(str(tmp_path), 'log', 'psnr_update.csv')
+    log = ResultLog(path, COLUMNS, flush_every=2)
+    log.append('calendar/00000000', [20., 21.])
+    assert len(load_results(path)) == 0
+    log.append('calendar/00000001', [22., 23.])
+    assert len(load_results(path)) == 2
+    log.append('city/00000000', [30., 33.])
+    log.append('calendar/00000001', [24., 25.])
+    df = log.load()
+    assert list(df.columns) == COLUMNS
+    assert sorted(df.index) == ['calendar/00000000', 'calendar/00000001', 'city/00000000']
+    assert df.loc['calendar/00000001', 'PSNR_Ours'] == 25.
+
+    avg, per_clip = clip_average(df, COLUMNS)
+    assert per_clip.loc['calendar', 'PSNR_Ours'] == 23.
+    assert avg['PSNR_Ours'] == 28.
+    with pytest.raises(ValueError):
+        log.append('city/00000001', [1.])
+
+
+def test_append_keeps_rows_and_drops_a_partial_line(tmp_path):
+    path = os.path.join(str(tmp_path), 'psnr_update.csv')
+    log = ResultLog(path, COLUMNS)
+    log.append('calendar/00000000', [20., 21.])
+    log.close()
+    with open(path, 'a') as f:
+        f.write('calendar/00000001,22.')
+
+    log = ResultLog(path, COLUMNS, append=True)
+    log.append('calendar/00000002', [24., 25.])
+    assert list(log.load().index) == ['calendar/00000000', 'calendar/00000002']
+
+    log = ResultLog(path, COLUMNS)
+    assert len(log.load()) == 0
+
+
+def test_append_to_a_log_with_other_columns(tmp_path):
+    path = os.path.join(str(tmp_path), 'psnr_update.csv')
+    log = ResultLog(path, COLUMNS)
+    log.append('calendar/00000000', [20., 21.])
+    log.close()
+
+    log = ResultLog(path, COLUMNS + ['T_Forward'], append=True)
+    log.append('calendar/00000001', [22., 23., 0.5])
+    df = log.load()
+    assert list(df.columns) == COLUMNS + ['T_Forward']
+    assert df.loc['calendar/00000000', 'PSNR_Ours'] == 21.
+    assert df.loc['calendar/00000001', 'T_Forward'] == 0.5
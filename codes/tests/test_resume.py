@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('pandas')
+
+from test_dynavsr import resume_point
+from utils.results import ResultLog
+
+COLUMNS = ['PSNR_Bicubic', 'PSNR_Ours']
+FRAMES = [('calendar', 0), ('calendar', 1), ('calendar', 2), ('city', 0), ('city', 1)]
+
+
+def write_pngs(folder, frames):
+    for clip, idx_d in frames:
+        os.makedirs(os.path.join(folder, clip), exist_ok=True)
+        open(os.path.join(folder, clip, '{:08d}.png'.format(idx_d)), 'wb').close()
+
+
+def test_resume_after_the_last_complete_frame(tmp_path):
+    png_folder = os.path.join(str(tmp_path), 'DynaVSR-R')
+    write_pngs(png_folder, FRAMES[:4])
+    assert resume_point(FRAMES, png_folder) == 4
+    assert resume_point(FRAMES, os.path.join(str(tmp_path), 'missing')) == 0
+
+    path = os.path.join(str(tmp_path), 'psnr_update.csv')
+    log = ResultLog(path, COLUMNS)
+    for clip, idx_d in FRAMES[:3]:
+        log.append('{}/{:08d}'.format(clip, idx_d), [20., 21.])
+    log.close()
+    # Interrupted while writing the row of city/00000000
+    with open(path, 'a') as f:
+        f.write('city/00000000,20.')
+    pd_log = ResultLog(path, COLUMNS, append=True).load()
+    assert resume_point(FRAMES, png_folder, pd_log) == 3
+
+
+def test_missing_png_stops_the_resume(tmp_path):
+    png_folder = os.path.join(str(tmp_path), 'DynaVSR-R')
+    write_pngs(png_folder, FRAMES[:1] + FRAMES[2:])
+    path = os.path.join(str(tmp_path), 'psnr_update.csv')
+    log = ResultLog(path, COLUMNS)
+    for clip, idx_d in FRAMES:
+        log.append('{}/{:08d}'.format(clip, idx_d), [20., 21.])
+    # Frames after a gap are done again, the rerun rows replace theirs
+    assert resume_point(FRAMES, png_folder, log.load()) == 1
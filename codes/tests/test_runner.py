@@ -0,0 +1,41 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import numpy as np
+
+
+def test_array_frames_give_arrays(make_runner):
+    runner = make_runner(adapt_iter=1)
+    frames = [np.random.randint(0, 256, (16, 24, 3), dtype=np.uint8) for _ in range(5)]
+    output = runner.adapt_and_upscale(frames)
+    assert output.dtype == np.uint8 and output.shape == (32, 48, 3)
+    outputs = list(runner.upscale_clip(iter(frames)))
+    assert len(outputs) == 5 and all(o.shape == (32, 48, 3) for o in outputs)
+
+
+def test_clip_is_read_lazily(make_runner):
+    runner = make_runner(adapt_iter=1)
+    read = []
+
+    def frames():
+        for i in range(7):
+            read.append(i)
+            yield torch.rand(3, 16, 16)
+    outputs = runner.upscale_clip(frames())
+    next(outputs)
+    # new_info padding looks 2 * (N_frames // 2) frames ahead
+    assert read == [0, 1, 2, 3, 4]
+    next(outputs)
+    assert read == [0, 1, 2, 3, 4, 5]
+    assert len(list(outputs)) == 5
+
+
+def test_clip_matches_windows_adapted_one_by_one(make_runner):
+    runner = make_runner(adapt_iter=2)
+    torch.manual_seed(0)
+    frames = torch.rand(5, 3, 16, 16)
+    clip = list(runner.upscale_clip(list(frames)))
+    # The window of the center frame is the whole clip
+    assert torch.allclose(clip[2], runner.adapt_and_upscale(frames), atol=1e-6)
+    # Every window starts from the meta weights again
+    assert torch.allclose(clip[2], list(runner.upscale_clip(list(frames)))[2], atol=1e-6)
@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+import urllib.request
+import urllib.error
+
+import pytest
+
+torch = pytest.importorskip('torch')
+imageio = pytest.importorskip('imageio')
+pytest.importorskip('scipy')
+import numpy as np
+
+import serve_dynavsr
+from serve_dynavsr import JobQueue, JobHandler, ThreadingHTTPServer
+
+
+@pytest.fixture
+def job_queue(make_runner, monkeypatch):
+    """JobQueue factory whose workers run small random-weight runners"""
+    def make_queue(num_workers=1, max_queued=4):
+        monkeypatch.setattr(serve_dynavsr, 'DynaVSRRunner', lambda opt: make_runner(adapt_iter=1))
+        opt = make_runner(adapt_iter=1).opt
+        return JobQueue(opt, num_workers=num_workers, max_queued=max_queued)
+    return make_queue
+
+
+def write_clip(folder, n=5):
+    os.makedirs(folder)
+    for i in range(n):
+        imageio.imwrite(os.path.join(folder, '{:08d}.png'.format(i)),
+                        np.random.randint(0, 256, (16, 16, 3), dtype=np.uint8))
+    return folder
+
+
+def test_jobs_are_run_and_reported(job_queue, tmp_path):
+    jobs = job_queue()
+    clip = write_clip(str(tmp_path / 'clip'))
+    output = str(tmp_path / 'out')
+    job = jobs.submit({'input': clip, 'output': output, 'adapt_mode': 'clip'})
+    jobs.queue.join()
+    status = jobs.status(job)
+    assert status['status'] == 'done' and status['error'] is None
+    assert status['frames_done'] == status['frames_total'] == 5 and status['fps'] > 0
+    assert sorted(os.listdir(output)) == ['{:08d}.png'.format(i) for i in range(5)]
+    assert imageio.imread(os.path.join(output, '00000000.png')).shape == (32, 32, 3)
+    json.dumps([jobs.status(j) for j in jobs.jobs.values()])
+
+
+@pytest.mark.skipif(not hasattr(np, 'int'), reason='random_kernel_generator needs numpy < 1.24')
+def test_hr_input_is_degraded_on_the_fly(job_queue, tmp_path):
+    jobs = job_queue()
+    output = str(tmp_path / 'out')
+    job = jobs.submit({'input': write_clip(str(tmp_path / 'clip')), 'output': output,
+                       'degradation': {'sigma_x': 1., 'sigma_y': 1., 'theta': 0}})
+    jobs.queue.join()
+    assert jobs.status(job)['status'] == 'done'
+    # Scale 2 down, then 2 up
+    assert imageio.imread(os.path.join(output, '00000000.png')).shape == (16, 16, 3)
+
+
+def test_invalid_and_failing_jobs(job_queue, tmp_path):
+    jobs = job_queue()
+    clip = write_clip(str(tmp_path / 'clip'))
+    for request in [{'input': clip}, {'input': str(tmp_path / 'missing'), 'output': 'out'},
+                    {'input': clip, 'output': 'out', 'adapt_mode': 'scene'}]:
+        with pytest.raises(ValueError):
+            jobs.submit(request)
+    text = tmp_path / 'clip.txt'
+    text.write_text('')
+    job = jobs.submit({'input': str(text), 'output': str(tmp_path / 'out')})
+    jobs.queue.join()
+    assert jobs.status(job)['status'] == 'failed' and 'ValueError' in jobs.status(job)['error']
+
+
+def test_full_queue_rejects_jobs(job_queue, tmp_path):
+    jobs = job_queue(num_workers=0, max_queued=1)
+    clip = write_clip(str(tmp_path / 'clip'))
+    assert jobs.submit({'input': clip, 'output': 'out'}) is not None
+    assert jobs.submit({'input': clip, 'output': 'out'}) is None
+    assert list(jobs.jobs) == [0]
+
+
+def test_http_api(job_queue, tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JobHandler)
+    server.jobs = job_queue(num_workers=0, max_queued=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{:d}/jobs'.format(server.server_address[1])
+
+    def post(body):
+        request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST')
+        try:
+            with urllib.request.urlopen(request) as r:
+                return r.status, json.loads(r.read().decode())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read().decode())
+    try:
+        clip = write_clip(str(tmp_path / 'clip'))
+        code, job = post({'input': clip, 'output': 'out'})
+        assert code == 202 and job['status'] == 'queued'
+        assert post({'input': clip, 'output': 'out'})[0] == 503
+        assert post({'output': 'out'})[0] == 400
+        with urllib.request.urlopen('{}/{:d}'.format(url, job['id'])) as r:
+            assert json.loads(r.read().decode())['id'] == job['id']
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + '/7')
+    finally:
+        server.shutdown()
+        server.server_close()
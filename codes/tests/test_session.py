@@ -0,0 +1,83 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+
+from models.adaptation import AdaptationSession
+
+OPT_MAML = {'optimizer': 'Adam', 'beta1': 0.9, 'beta2': 0.99}
+
+
+def make_nets():
+    torch.manual_seed(0)
+    G = nn.Sequential(nn.Conv2d(3, 4, 3, padding=1), nn.BatchNorm2d(4), nn.Conv2d(4, 3, 3, padding=1))
+    E = nn.Conv2d(3, 3, 3, padding=1)
+    return G, E
+
+
+def adapt(session, steps=2):
+    G, E = session.nets
+    x = torch.rand(2, 3, 8, 8)
+    for _ in range(steps):
+        session.optimizer.zero_grad()
+        G(E(x)).abs().mean().backward()
+        session.optimizer.step()
+
+
+def test_working_tensors_are_views_of_one_flat_buffer():
+    G, E = make_nets()
+    session = AdaptationSession([G, E], [0.1, 0.1], OPT_MAML)
+    tensors = list(session.nets[0].parameters()) + list(session.nets[1].parameters()) + \
+        [b for b in session.nets[0].buffers() if b.is_floating_point()]
+    assert session.flat.numel() == sum(t.numel() for t in tensors)
+    storage = session.flat.data_ptr()
+    end = storage + session.flat.numel() * session.flat.element_size()
+    assert all(storage <= t.data_ptr() < end for t in tensors)
+    # The meta networks are copied, not shared
+    assert session.nets[0][0].weight.data_ptr() != G[0].weight.data_ptr()
+
+
+def test_reset_restores_weights_buffers_and_optimizer_state():
+    G, E = make_nets()
+    session = AdaptationSession([G, E], [0.1, 0.1], OPT_MAML)
+    adapt(session)
+    assert session.delta().abs().sum() > 0
+    bn = session.nets[0][1]
+    assert bn.num_batches_tracked.item() == 2
+    session.reset()
+    assert torch.equal(session.delta(), torch.zeros_like(session.flat))
+    for working, meta in zip(session.nets, [G, E]):
+        for (k, t), (_, m) in zip(working.state_dict().items(), meta.state_dict().items()):
+            assert torch.equal(t, m), k
+    assert all(torch.all(v == 0) for state in session.optimizer.state.values()
+               for v in state.values() if torch.is_tensor(v))
+
+
+def test_capture_follows_updated_meta_weights():
+    G, E = make_nets()
+    session = AdaptationSession([G, E], [0.1, None], OPT_MAML)
+    with torch.no_grad():
+        G[0].weight.add_(1.)
+    session.reset()
+    assert not torch.equal(session.nets[0][0].weight, G[0].weight)
+    session.reset(capture=True)
+    assert torch.equal(session.nets[0][0].weight, G[0].weight)
+
+
+def test_delta_round_trips_through_apply_delta():
+    G, E = make_nets()
+    session = AdaptationSession([G, E], [0.1, 0.1], OPT_MAML)
+    adapt(session)
+    delta = session.delta()
+    adapted = session.flat.clone()
+    session.reset()
+    session.apply_delta(delta)
+    assert torch.allclose(session.flat, adapted, atol=1e-6)
+
+
+def test_fixed_network_is_not_adapted():
+    G, E = make_nets()
+    session = AdaptationSession([G, E], [0.1, None], OPT_MAML)
+    adapt(session)
+    assert torch.equal(session.nets[1].weight, E.weight)
+    assert not torch.equal(session.nets[0][0].weight, G[0].weight)
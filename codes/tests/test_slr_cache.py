@@ -0,0 +1,50 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.slr_cache import SLRCache, cacheable
+
+
+class FakeEstimator():
+    def __init__(self, mode='video'):
+        self.mode = mode
+        self.calls = 0
+
+    def feed_data(self, data):
+        self.LQs = data['LQs']
+
+    def test(self):
+        self.calls += 1
+        self.fake_L = self.LQs * 0.5
+
+
+def window(idx, folder='clip', value=1.):
+    return {'folder': folder, 'idx': '{:d}/10'.format(idx), 'LQs': torch.full((1, 5, 3, 4, 4), value)}
+
+
+def test_window_is_estimated_once():
+    est = FakeEstimator()
+    cache = SLRCache(est, 5)
+    first = cache.get(window(3))
+    second = cache.get(window(3, value=2.))
+    assert est.calls == 1 and (cache.hits, cache.misses) == (1, 1)
+    assert torch.equal(first, second)
+
+    cache.get(window(3, folder='other'))
+    assert est.calls == 2
+
+
+def test_disabled_cache_estimates_every_window():
+    est = FakeEstimator()
+    cache = SLRCache(est, 5, enabled=False)
+    cache.get(window(3))
+    slr = cache.get(window(3, value=2.))
+    assert est.calls == 2
+    assert torch.equal(slr, torch.full((1, 5, 3, 4, 4), 1.))
+
+
+def test_cacheable_degradation_modes():
+    assert cacheable({'mode': 'demo', 'degradation_mode': None})
+    assert cacheable({'mode': 'video_test', 'degradation_mode': 'set'})
+    assert cacheable({'mode': 'video_test', 'degradation_mode': 'preset'})
+    assert not cacheable({'mode': 'video_test', 'degradation_mode': 'random'})
@@ -0,0 +1,63 @@
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from utils.telemetry import StageTimer, STAGE_COLUMNS, STEP_COLUMNS, TELEMETRY_COLUMNS, current_rss
+
+
+def test_stage_times_are_collected_and_reset():
+    timer = StageTimer(torch.device('cpu'))
+    with timer.stage('forward'):
+        pass
+    items = list(timer.iterate(range(3)))
+    assert items == [0, 1, 2]
+    timings = timer.collect()
+    assert list(timings.keys()) == TELEMETRY_COLUMNS
+    assert timings[STAGE_COLUMNS['forward']] >= 0 and timings['Peak_MB'] > 0
+    assert timer.times == {} and timer.peak_rss == 0.
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='needs /proc')
+def test_cpu_peak_is_per_frame():
+    timer = StageTimer(torch.device('cpu'))
+    with timer.stage('forward'):
+        big = torch.ones(64, 1024, 1024)  # 256 MB
+    del big
+    first = timer.collect()['Peak_MB']
+    with timer.stage('forward'):
+        pass
+    second = timer.collect()['Peak_MB']
+    assert second < first
+    assert abs(second - current_rss()) < 64
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer(torch.device('cpu'), enabled=False)
+    with timer.stage('forward'):
+        pass
+    timings = timer.collect()
+    assert all(not v for v in timings.values())
+
+
+def test_inner_stages_are_also_kept_per_step():
+    timer = StageTimer(torch.device('cpu'))
+    # Cached prefix activations before the first step only count in the sum
+    with timer.stage('inner_fwd'):
+        pass
+    for i in range(3):
+        timer.next_step()
+        with timer.stage('inner_fwd'):
+            pass
+        if i != 1:
+            with timer.stage('inner_bwd'):
+                pass
+    timings = timer.collect()
+    fwd = [float(t) for t in timings[STEP_COLUMNS['inner_fwd']].split(';')]
+    bwd = [float(t) for t in timings[STEP_COLUMNS['inner_bwd']].split(';')]
+    assert len(fwd) == len(bwd) == 3
+    assert bwd[1] == 0.
+    assert sum(fwd) <= timings[STAGE_COLUMNS['inner_fwd']] + 1e-5
+    assert len(timings[STEP_COLUMNS['inner_opt']].split(';')) == 3
+    assert timer.collect()[STEP_COLUMNS['inner_fwd']] == ''
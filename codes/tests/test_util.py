@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+from torch.nn import functional as F
+
+from utils import util
+
+
+def upsample(x):
+    # Pointwise network: B x T x C x H x W -> B x C x 2H x 2W of the center frame
+    return F.interpolate(x[:, x.shape[1] // 2] * 2., scale_factor=2, mode='nearest')
+
+
+def test_tile_positions_cover_the_length():
+    assert util.tile_positions(10, 16, 4) == [0]
+    assert util.tile_positions(40, 16, 4) == [0, 12, 24]
+    assert util.tile_positions(30, 16, 4) == [0, 12, 14]
+
+
+def test_feather_weights():
+    w = util._feather(8, 0, 0)
+    assert torch.equal(w, torch.ones(8))
+    w = util._feather(8, 3, 2)
+    assert torch.allclose(w[:3], torch.tensor([0.25, 0.5, 0.75]))
+    assert torch.allclose(w[-2:], torch.tensor([2. / 3, 1. / 3]))
+    assert (w > 0).all() and (w <= 1).all()
+
+
+def test_tiled_forward_matches_full_forward():
+    inp = torch.rand(1, 3, 3, 37, 29)
+    out = util.tiled_forward(upsample, inp, tile_size=16, overlap=4)
+    assert torch.allclose(out, upsample(inp), atol=1e-6)
+
+
+@pytest.mark.parametrize('ensemble', [4, 8])
+def test_ensemble_forward(ensemble):
+    torch.manual_seed(0)
+    conv = torch.nn.Conv2d(3, 3, 3, padding=1)
+
+    def forward_fn(x):
+        return F.interpolate(conv(x[:, x.shape[1] // 2]), scale_factor=2, mode='nearest')
+
+    for shape in [(2, 3, 3, 8, 8), (2, 3, 3, 8, 6)]:
+        inp = torch.rand(*shape)
+        with torch.no_grad():
+            # Equivariant network: the ensemble is the plain forward
+            assert torch.allclose(util.ensemble_forward(upsample, inp, ensemble), upsample(inp), atol=1e-6)
+            # One transformed window per forward gives the same average as one batch
+            batched = util.ensemble_forward(forward_fn, inp, ensemble)
+            single = util.ensemble_forward(forward_fn, inp, ensemble, max_batch=2)
+            assert batched.shape == (2, 3) + tuple(2 * s for s in shape[-2:])
+            assert torch.allclose(batched, single, atol=1e-6)
+    with pytest.raises(NotImplementedError):
+        util.ensemble_forward(upsample, inp, 2)
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / 'frame.png')
+    seen = []
+
+    def write_fn(tmp_path):
+        seen.append(tmp_path)
+        assert tmp_path.endswith('.png')
+        with open(tmp_path, 'w') as f:
+            f.write('data')
+
+    util.atomic_write(path, write_fn)
+    util.atomic_write(path, write_fn)
+    with open(path, 'r') as f:
+        assert f.read() == 'data'
+    assert seen[0] != path and sorted(p.name for p in tmp_path.iterdir()) == ['frame.png']
+
+    def failing_write_fn(tmp_path):
+        with open(tmp_path, 'w') as f:
+            f.write('partial')
+        raise IOError('disk full')
+
+    with pytest.raises(IOError):
+        util.atomic_write(path, failing_write_fn)
+    with open(path, 'r') as f:
+        assert f.read() == 'data'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['frame.png']
+
+
+def test_concurrent_atomic_writes_use_their_own_files(tmp_path):
+    path = str(tmp_path / 'state.pth')
+    tmp_paths = []
+    barrier = threading.Barrier(4)
+
+    def write_fn(tmp_path):
+        tmp_paths.append(tmp_path)
+        barrier.wait()
+        with open(tmp_path, 'w') as f:
+            f.write(tmp_path)
+
+    threads = [threading.Thread(target=util.atomic_write, args=(path, write_fn)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(tmp_paths)) == 4
+    with open(path, 'r') as f:
+        assert f.read() in tmp_paths
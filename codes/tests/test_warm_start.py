@@ -0,0 +1,63 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+import torch.nn as nn
+
+from models.adaptation import AdaptationSession
+
+OPT_MAML = {'optimizer': 'Adam', 'beta1': 0.9, 'beta2': 0.99}
+
+
+def adapted_session():
+    torch.manual_seed(0)
+    session = AdaptationSession([nn.Conv2d(3, 3, 3, padding=1)], [0.1], OPT_MAML)
+    net = session.nets[0]
+    session.optimizer.zero_grad()
+    net(torch.rand(1, 3, 8, 8)).abs().mean().backward()
+    session.optimizer.step()
+    return session
+
+
+@pytest.mark.parametrize('decay', [0., 0.25, 1.])
+def test_warm_start_decays_toward_the_meta_weights(decay):
+    session = adapted_session()
+    delta = session.delta()
+    session.warm_start(decay)
+    assert torch.allclose(session.delta(), (1 - decay) * delta, atol=1e-7)
+    assert all(torch.all(v == 0) for state in session.optimizer.state.values()
+               for v in state.values() if torch.is_tensor(v))
+
+
+def record_steps(runner, monkeypatch):
+    steps = []
+    adapt = runner.adapt
+
+    def recording_adapt(windows, num_steps=None):
+        steps.append(runner.update_step if num_steps is None else num_steps)
+        return adapt(windows, num_steps)
+    monkeypatch.setattr(runner, 'adapt', recording_adapt)
+    return steps
+
+
+def test_clip_chains_warm_starts_until_the_reset(make_runner, monkeypatch):
+    runner = make_runner(adapt_iter=3, warm_start=True, warm_start_iter=1, warm_start_reset=2)
+    steps, resets = record_steps(runner, monkeypatch), []
+    reset = runner.session.reset
+
+    def recording_reset(*args, **kwargs):
+        resets.append(len(steps))
+        return reset(*args, **kwargs)
+    monkeypatch.setattr(runner.session, 'reset', recording_reset)
+    list(runner.upscale_clip([torch.rand(3, 16, 16) for _ in range(7)]))
+    # A hard reset every warm_start_reset warm starts, which then take warm_start_iter steps
+    assert steps == [3, 1, 1, 3, 1, 1, 3]
+    assert resets == [0, 3, 6]
+
+
+def test_warm_start_is_not_carried_across_clips(make_runner, monkeypatch):
+    runner = make_runner(adapt_iter=2, warm_start=True, warm_start_iter=1)
+    steps = record_steps(runner, monkeypatch)
+    for _ in range(2):
+        list(runner.upscale_clip([torch.rand(3, 16, 16) for _ in range(5)], adapt_mode='interval',
+                                 adapt_interval=3))
+    assert steps == [2, 1, 2, 1]
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from models.warm_start_bank import WarmStartBank
+
+
+def test_lookup_returns_the_nearest_entry(tmp_path):
+    bank = WarmStartBank(str(tmp_path), 4)
+    bank.store([1., 0.], torch.ones(4))
+    bank.store([0., 1.], torch.full((4, ), 2.))
+    delta, distance = bank.lookup([1., 0.05])
+    assert torch.equal(delta, torch.ones(4)) and distance < 0.1
+    assert bank.lookup([5., 5.]) == (None, None)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    bank = WarmStartBank(str(tmp_path), 4, capacity=2)
+    bank.store([1., 0.], torch.ones(4))
+    bank.store([0., 1.], torch.ones(4))
+    bank.lookup([1., 0.])
+    bank.store([1., 1.], torch.ones(4))
+    keys = sorted(e['key'] for e in bank.entries)
+    assert keys == [[1., 0.], [1., 1.]]
+    assert sorted(os.listdir(str(tmp_path))) == ['0.pth', '2.pth', 'index.json', 'index.lock']
+
+
+def test_index_round_trip(tmp_path):
+    bank = WarmStartBank(str(tmp_path), 4)
+    bank.store([1., 0.], torch.ones(4))
+    reopened = WarmStartBank(str(tmp_path), 4)
+    assert reopened.entries == bank.entries and reopened.next_id == 1
+    delta, _ = reopened.lookup([1., 0.])
+    assert torch.equal(delta, torch.ones(4))
+
+
+def test_entries_of_another_model_are_kept(tmp_path):
+    other = WarmStartBank(str(tmp_path), 8)
+    other.store([1., 0.], torch.ones(8))
+    bank = WarmStartBank(str(tmp_path), 4)
+    assert bank.lookup([1., 0.]) == (None, None)
+    bank.store([1., 0.], torch.ones(4))
+    with open(os.path.join(str(tmp_path), 'index.json'), 'r') as f:
+        index = json.load(f)
+    assert sorted(e['num_params'] for e in index['entries']) == [4, 8]
+    delta, _ = other.lookup([1., 0.])
+    assert delta.numel() == 8
+
+
+def test_concurrent_banks_do_not_lose_entries(tmp_path):
+    first = WarmStartBank(str(tmp_path), 4)
+    second = WarmStartBank(str(tmp_path), 4)
+    first.store([1., 0.], torch.ones(4))
+    second.store([0., 1.], torch.ones(4))
+    assert len(WarmStartBank(str(tmp_path), 4).entries) == 2
+    assert [f for f in os.listdir(str(tmp_path)) if 'tmp' in f] == []
@@ -19,12 +19,13 @@ from models import create_model
 import utility
 
 def init_dist(backend='nccl', **kwargs):
-    """initialization for distributed training"""
+    """initialization for distributed training (nccl on GPUs, gloo on CPUs)"""
     if mp.get_start_method(allow_none=True) != 'spawn':
         mp.set_start_method('spawn')
     rank = int(os.environ['RANK'])
-    num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(rank % num_gpus)
+    if backend == 'nccl':
+        num_gpus = torch.cuda.device_count()
+        torch.cuda.set_device(rank % num_gpus)
     dist.init_process_group(backend=backend, **kwargs)
 
 
@@ -37,6 +38,7 @@ def main():
     parser.add_argument('--local_rank', type=int, default=0)
     args = parser.parse_args()
     opt = option.parse(args.opt, is_train=True)
+    option.set_threads(opt)
 
     #### distributed training settings
     if args.launcher == 'none':  # disabled distributed training
@@ -45,16 +47,16 @@ def main():
         print('Disabled distributed training.')
     else:
         opt['dist'] = True
-        init_dist()
+        init_dist('nccl' if opt['device'] == 'cuda' else 'gloo')
         world_size = torch.distributed.get_world_size()
         rank = torch.distributed.get_rank()
 
     #### loading resume state if exists
     if opt['path'].get('resume_state', None):
-        # distributed resuming: all load into default GPU
-        device_id = torch.cuda.current_device()
+        # distributed resuming: all load into default GPU (or the CPU)
+        device_id = torch.cuda.current_device() if opt['device'] == 'cuda' else None
         resume_state = torch.load(opt['path']['resume_state'],
-                                  map_location=lambda storage, loc: storage.cuda(device_id))
+                                  map_location=lambda storage, loc: storage if device_id is None else storage.cuda(device_id))
         option.check_resume(opt, resume_state['iter'])  # check resume options
     else:
         resume_state = None
@@ -249,14 +251,14 @@ def main():
                                 os.makedirs(train_folder, exist_ok=True)
                             if psnr_rlt.get(folder, None) is None:
                                 psnr_rlt[folder] = torch.zeros(max_idx, dtype=torch.float32,
-                                                               device='cuda')
+                                                               device=model.device)
                             '''
                             folder = val_data['folder']
                             idx_d, max_idx = val_data['idx'].split('/')
                             idx_d, max_idx = int(idx_d), int(max_idx)
                             if psnr_rlt.get(folder, None) is None:
                                 psnr_rlt[folder] = torch.zeros(max_idx, dtype=torch.float32,
-                                                               device='cuda')
+                                                               device=model.device)
                             # tmp = torch.zeros(max_idx, dtype=torch.float32, device='cuda')
                             '''
                             if max_idx < 80 or (idx_d < max_idx/2 and max_idx >= 80):
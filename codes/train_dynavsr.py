@@ -5,7 +5,6 @@ import random
 import logging
 import imageio
 import time
-import pandas as pd
 from copy import deepcopy
 
 import torch
@@ -16,17 +15,22 @@ from data.data_sampler import DistIterSampler
 
 import options.options as option
 from utils import util
+from utils.results import ResultLog
 from data.meta_learner import loader, create_dataloader, create_dataset, preprocessing
 from models import create_model
+from models.slr_cache import SLRCache, cacheable as slr_cacheable
+from models.adaptation import AdaptationSession
+from models.meta_sgd import InnerLearningRates
 
 
 def init_dist(backend='nccl', **kwargs):
-    """initialization for distributed training"""
+    """initialization for distributed training (nccl on GPUs, gloo on CPUs)"""
     if mp.get_start_method(allow_none=True) != 'spawn':
         mp.set_start_method('spawn')
     rank = int(os.environ['RANK'])
-    num_gpus = torch.cuda.device_count()
-    torch.cuda.set_device(rank % num_gpus)
+    if backend == 'nccl':
+        num_gpus = torch.cuda.device_count()
+        torch.cuda.set_device(rank % num_gpus)
     dist.init_process_group(backend=backend, **kwargs)
 
 
@@ -44,6 +48,7 @@ def main():
         opt = option.parse(args.opt, is_train=True)
     else:
         opt = option.parse(args.opt, is_train=True, exp_name=args.exp_name)
+    option.set_threads(opt)
 
     # convert to NoneDict, which returns None for missing keys
     opt = option.dict_to_nonedict(opt)
@@ -59,16 +64,16 @@ def main():
         print('Disabled distributed training.')
     else:
         opt['dist'] = True
-        init_dist()
+        init_dist('nccl' if opt['device'] == 'cuda' else 'gloo')
         world_size = torch.distributed.get_world_size()
         rank = torch.distributed.get_rank()
 
     #### loading resume state if exists
     if opt['path'].get('resume_state', None):
-        # distributed resuming: all load into default GPU
-        device_id = torch.cuda.current_device()
+        # distributed resuming: all load into default GPU (or the CPU)
+        device_id = torch.cuda.current_device() if opt['device'] == 'cuda' else None
         resume_state = torch.load(opt['path']['resume_state'],
-                                  map_location=lambda storage, loc: storage.cuda(device_id))
+                                  map_location=lambda storage, loc: storage if device_id is None else storage.cuda(device_id))
         option.check_resume(opt, resume_state['iter'])  # check resume options
     else:
         resume_state = None
@@ -163,6 +168,28 @@ def main():
     model, est_model = models[0], models[1]
     modelcp, est_modelcp = create_model(opt)
     model_fixed, est_model_fixed = create_model(opt)
+    if opt['datasets'].get('val', None):
+        val_opt = opt['datasets']['val']
+        slr_cache = SLRCache(est_model_fixed, val_opt['N_frames'], padding=val_opt['padding'],
+                             share_frames=(val_opt['mode'] == 'demo' or val_opt['degradation_mode'] == 'set'),
+                             enabled=slr_cacheable(val_opt))
+
+    #### Meta-SGD: inner step sizes learned with the weights ('param': per element, 'layer': per tensor)
+    meta_sgd = opt['train']['maml']['meta_sgd']
+    if meta_sgd:
+        lr_alpha = opt['train']['maml']['lr_alpha']
+        lr_alpha_est = opt['train']['maml']['lr_alpha_est'] if opt['train']['maml']['lr_alpha_est'] is not None else lr_alpha
+        lrs_G = InnerLearningRates(model.netG, lr_alpha, per_layer=meta_sgd == 'layer').to(model.device)
+        lrs_E = InnerLearningRates(est_model.netE, lr_alpha_est, per_layer=meta_sgd == 'layer').to(est_model.device)
+        load_path_G_lr, load_path_E_lr = opt['path']['pretrain_model_G_lr'], opt['path']['pretrain_model_E_lr']
+        if resume_state:
+            # Saved next to the G / E checkpoints of the resumed iteration
+            load_path_G_lr = os.path.join(opt['path']['models'], '{}_G_lr.pth'.format(resume_state['iter']))
+            load_path_E_lr = os.path.join(opt['path']['models'], '{}_E_lr.pth'.format(resume_state['iter']))
+        if load_path_G_lr is not None:
+            model.load_network(load_path_G_lr, lrs_G)
+        if load_path_E_lr is not None:
+            est_model.load_network(load_path_E_lr, lrs_E)
 
     #### Define combined optimizer + scheduler
     optim_params = []
@@ -172,6 +199,8 @@ def main():
     for k, v in est_model.netE.named_parameters():
         if v.requires_grad:
             optim_params.append(v)
+    if meta_sgd:
+        optim_params += list(lrs_G.parameters()) + list(lrs_E.parameters())
     if opt['train']['optim'] == 'Adam':
         optimizer = torch.optim.Adam(optim_params, lr=opt['train']['lr_G'], betas=(opt['train']['beta1'], opt['train']['beta2']))
     elif opt['train']['optim'] == 'SGD':
@@ -204,9 +233,15 @@ def main():
     lr_alpha = opt['train']['maml']['lr_alpha']
     lr_alpha_est = opt['train']['maml']['lr_alpha_est'] if opt['train']['maml']['lr_alpha_est'] is not None else opt['train']['maml']['lr_alpha'] 
     update_step = opt['train']['maml']['adapt_iter']
+    # Working copy of G/E shared by every task, re-synced with the meta weights before each one
+    if meta_sgd:
+        session = AdaptationSession([model.netG, est_model.netE], [lrs_G, lrs_E], opt['train']['maml'])
+    else:
+        session = AdaptationSession([model.netG, est_model.netE], [lr_alpha, lr_alpha_est], opt['train']['maml'])
+    modelcp.netG, est_modelcp.netE = session.nets
 
-    pd_log = pd.DataFrame(columns=['PSNR_Init', 'PSNR_Start', 'PSNR_Final({})'.format(update_step),
-                                   'SSIM_Init', 'SSIM_Final'])
+    # Validation results are appended in batches (utils.results) instead of rewriting the table every frame
+    log_columns = ['PSNR_Init', 'PSNR_Start', 'PSNR_Final({})'.format(update_step), 'SSIM_Init', 'SSIM_Final']
 
     def crop(LR_seq, HR, num_patches_for_batch=4, patch_size=44):
         """
@@ -242,6 +277,73 @@ def main():
 
         return cropped_lr, cropped_hr
 
+    def accumulate_grad(params, grads):
+        for param, grad in zip(params, grads):
+            if param.grad is None:
+                param.grad = grad.detach().clone()
+            else:
+                param.grad += grad
+
+    def meta_sgd_task(train_data_i, meta_train_data_i, meta_test_data_i, batch_size):
+        """
+        First-order Meta-SGD update of one task: the working copy is adapted with the learned
+        step sizes, then the query losses give the gradients of the meta weights and of the
+        step sizes (accumulated in .grad).
+
+        Return:
+            query loss of G
+        """
+        session.reset(capture=True)
+        pairs_G, pairs_E = lrs_G.pairs(modelcp.netG), lrs_E.pairs(est_modelcp.netE)
+        grad_sums = [torch.zeros_like(p) for p, _ in pairs_G + pairs_E]
+        for k in range(update_step):
+            session.optimizer.zero_grad()
+            # Make SuperLR seq using the adapted estimation model
+            if not opt['train']['use_real']:
+                est_modelcp.feed_data(train_data_i)
+                est_modelcp.forward_without_optim()
+                meta_train_data_i['LQs'] = est_modelcp.fake_L
+            else:
+                meta_train_data_i['LQs'] = train_data_i['SuperLQs']
+            slr_seq = meta_train_data_i['LQs']
+            if opt['network_G']['which_model_G'] == 'TOF':
+                # Bicubic upsample to match the size
+                B, T, C, H, W = slr_seq.shape
+                Bic_LQs = F.interpolate(slr_seq.reshape(B*T, C, H, W), scale_factor=opt['scale'],
+                                        mode='bicubic', align_corners=True)
+                meta_train_data_i['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
+
+            if opt['train']['maml']['use_patch']:
+                cropped_LQs, cropped_GT = crop(meta_train_data_i['LQs'], meta_train_data_i['GT'],
+                                               opt['train']['maml']['num_patch'],
+                                               opt['train']['maml']['patch_size'])
+                modelcp.feed_data({'LQs': cropped_LQs, 'GT': cropped_GT})
+            else:
+                modelcp.feed_data(meta_train_data_i)
+            loss_train = modelcp.calculate_loss()
+            loss_train += F.l1_loss(slr_seq.to(modelcp.device), train_data_i['SuperLQs'].to(modelcp.device))
+            loss_train.backward()
+            for (p, _), grad_sum in zip(pairs_G + pairs_E, grad_sums):
+                if p.grad is not None:
+                    grad_sum += p.grad
+            session.optimizer.step()
+
+        # Query losses with the adapted weights
+        modelcp.feed_data(meta_test_data_i)
+        loss_q = modelcp.calculate_loss()
+        est_modelcp.feed_data(train_data_i)
+        est_modelcp.forward_without_optim()
+        loss_e = est_modelcp.MyLoss(est_modelcp.fake_L, est_modelcp.real_L)
+
+        grads_G = torch.autograd.grad(loss_q / batch_size, [p for p, _ in pairs_G])
+        grads_E = torch.autograd.grad(loss_e / (batch_size*10), [p for p, _ in pairs_E])
+        meta_G = [p for p in model.netG.parameters() if p.requires_grad]
+        meta_E = [p for p in est_model.netE.parameters() if p.requires_grad]
+        accumulate_grad(meta_G + meta_E, list(grads_G) + list(grads_E))
+        for (_, step_size), grad_sum, grad in zip(pairs_G + pairs_E, grad_sums, list(grads_G) + list(grads_E)):
+            InnerLearningRates.accumulate_grad(step_size, grad_sum, grad)
+        return loss_q.item()
+
     print(folder_name)
 
     # initialize bicubic performance
@@ -318,39 +420,13 @@ def main():
                     LQs = LQs.reshape(B*T, C, H, W)
                     Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
                     meta_test_data_i['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
-                
-                modelcp.netG, est_modelcp.netE = deepcopy(model.netG), deepcopy(est_model.netE)
-                optim_params = []
 
-                sr_params = []
-                for k, v in modelcp.netG.named_parameters():
-                    if v.requires_grad:
-                        sr_params.append(v)
+                if meta_sgd:
+                    total_loss_q += meta_sgd_task(train_data_i, meta_train_data_i, meta_test_data_i, batch_size) / batch_size
+                    continue
                 
-                est_params = []
-                for k, v in est_modelcp.netE.named_parameters():
-                    if v.requires_grad:
-                        est_params.append(v)
-
-                optim_params = [
-                    {  # add normal params first
-                        'params': sr_params,
-                        'lr': lr_alpha
-                    },
-                    {
-                        'params': est_params,
-                        'lr': lr_alpha_est
-                    },
-                ]
-
-                if opt['train']['maml']['optimizer'] == 'Adam':
-                    inner_optimizer = torch.optim.Adam(optim_params, lr=lr_alpha,
-                                                      betas=(
-                                                      opt['train']['maml']['beta1'], opt['train']['maml']['beta2']))
-                elif opt['train']['maml']['optimizer'] == 'SGD':
-                    inner_optimizer = torch.optim.SGD(optim_params, lr=lr_alpha)
-                else:
-                    raise NotImplementedError()
+                session.reset(capture=True)
+                inner_optimizer = session.optimizer
 
                 for k in range(update_step):
                     inner_optimizer.zero_grad()
@@ -388,11 +464,11 @@ def main():
                     #est_model_fixed.feed_data(train_data_i)
                     #est_model_fixed.test()
                     #slr_initialized = est_model_fixed.fake_L
-                    #slr_initialized = slr_initialized.to('cuda') 
+                    #slr_initialized = slr_initialized.to(modelcp.device) 
                     if opt['network_G']['which_model_G'] == 'TOF':
-                        loss_train += F.l1_loss(LQs.to('cuda'), train_data_i['SuperLQs'].to('cuda'))
+                        loss_train += F.l1_loss(LQs.to(modelcp.device), train_data_i['SuperLQs'].to(modelcp.device))
                     else:
-                        loss_train += F.l1_loss(meta_train_data_i['LQs'].to('cuda'), train_data_i['SuperLQs'].to('cuda'))
+                        loss_train += F.l1_loss(meta_train_data_i['LQs'].to(modelcp.device), train_data_i['SuperLQs'].to(modelcp.device))
 
                     loss_train.backward()
                     # print('Inner Update, {}'.format(k+1))
@@ -405,7 +481,7 @@ def main():
                 loss_q = model.calculate_loss()
                 # Copy base parameters to current model
                 for param, base_param in zip(model.netG.parameters(), modelcp.netG.parameters()):
-                    param.data = base_param.data
+                    param.data.copy_(base_param.data)
 
                 # Calculate gradient & update meta-learner
                 #print(type(model.netG.parameters()))
@@ -418,7 +494,7 @@ def main():
                 est_model.forward_without_optim()
                 loss_e = est_model.MyLoss(est_model.fake_L, est_model.real_L) # / 100  # compare with GT SLR image to current output
                 for param, base_param in zip(est_model.netE.parameters(), est_modelcp.netE.parameters()):
-                    param.data = base_param.data
+                    param.data.copy_(base_param.data)
                 # TODO: set different loss scales for loss_e and loss_q?
                 gradsE = torch.autograd.grad(loss_e / (batch_size*10), est_model.netE.parameters())
                 # print(gradsE)
@@ -429,8 +505,7 @@ def main():
                 #(loss_q/batch_size).backward()
                 total_loss_q += loss_q.item() / batch_size
                 # print(batch, k, loss_train.item(), loss_q.item())
-                
-                del modelcp.netG, est_modelcp.netE
+
 
             tb_logger.add_scalar('Train loss', total_loss_q, global_step=current_step)
             # print('Meta Update')
@@ -500,6 +575,10 @@ def main():
                     if opt['dist']:
                         # multi-GPU testing
                         for val_idx, val_set_frag in enumerate(val_set):
+                            slr_cache.reset()
+                            # One log per rank, each rank runs every world_size-th frame
+                            results = ResultLog(os.path.join('../results', folder_name,
+                                                             'psnr_update_{}_rank{}.csv'.format(val_idx, rank)), log_columns)
                             # PSNR_rlt: psnr_init, psnr_before, psnr_after
                             psnr_rlt = [{}, {}, {}]
                             # SSIM_rlt: ssim_init, ssim_after
@@ -525,10 +604,10 @@ def main():
                                 idx_d, max_idx = int(idx_d), int(max_idx)
                                 for i in range(len(psnr_rlt)):
                                     if psnr_rlt[i].get(folder, None) is None:
-                                        psnr_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device='cuda')
+                                        psnr_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device=modelcp.device)
                                 for i in range(len(ssim_rlt)):
                                     if ssim_rlt[i].get(folder, None) is None:
-                                        ssim_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device='cuda')
+                                        ssim_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device=modelcp.device)
 
                                 cropped_meta_train_data = {}
                                 meta_train_data = {}
@@ -548,40 +627,8 @@ def main():
                                     Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
                                     meta_test_data['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
 
-                                #modelcp.netG = deepcopy(model.netG)
-                                modelcp.netG, est_modelcp.netE = deepcopy(model.netG), deepcopy(est_model.netE)
-                                
-                                optim_params = []
-
-                                sr_params = []
-                                for k, v in modelcp.netG.named_parameters():
-                                    if v.requires_grad:
-                                        sr_params.append(v)
-                                
-                                est_params = []
-                                for k, v in est_modelcp.netE.named_parameters():
-                                    if v.requires_grad:
-                                        est_params.append(v)
-
-                                optim_params = [
-                                    {  # add normal params first
-                                        'params': sr_params,
-                                        'lr': lr_alpha
-                                    },
-                                    {
-                                        'params': est_params,
-                                        'lr': lr_alpha_est
-                                    },
-                                ]
-                                
-                                if opt['train']['maml']['optimizer'] == 'Adam':
-                                    inner_optimizer = torch.optim.Adam(optim_params, lr=lr_alpha,
-                                                                    betas=(
-                                                                    opt['train']['maml']['beta1'], opt['train']['maml']['beta2']))
-                                elif opt['train']['maml']['optimizer'] == 'SGD':
-                                    inner_optimizer = torch.optim.SGD(optim_params, lr=lr_alpha)
-                                else:
-                                    raise NotImplementedError()
+                                session.reset(capture=True)
+                                inner_optimizer = session.optimizer
 
                                 #if opt['train']['maml']['optimizer'] == 'Adam':
                                 #    inner_optimizer = torch.optim.Adam(modelcp.netG.parameters(), lr=lr_alpha,
@@ -663,15 +710,13 @@ def main():
 
                                         loss_train = modelcp.calculate_loss()
                                         ## Add SLR pixelwise loss while training
-                                        est_model_fixed.feed_data(val_data)
-                                        est_model_fixed.test()
-                                        slr_initialized = est_model_fixed.fake_L
-                                        slr_initialized = slr_initialized.to('cuda')
+                                        slr_initialized = slr_cache.get(val_data)
+                                        slr_initialized = slr_initialized.to(modelcp.device)
                                         
                                         if opt['network_G']['which_model_G'] == 'TOF':
-                                            loss_train += F.l1_loss(LQs.to('cuda'), slr_initialized)
+                                            loss_train += F.l1_loss(LQs.to(modelcp.device), slr_initialized)
                                         else:
-                                            loss_train += F.l1_loss(meta_train_data['LQs'].to('cuda'), slr_initialized)
+                                            loss_train += F.l1_loss(meta_train_data['LQs'].to(modelcp.device), slr_initialized)
 
                                         loss_train.backward()
                                         inner_optimizer.step()
@@ -688,19 +733,10 @@ def main():
                                     psnr_rlt[2][folder][idx_d] = util.calculate_psnr(update_image, hr_image)
                                     ssim_rlt[1][folder][idx_d] = 0 #util.calculate_ssim(update_image, hr_image)
 
-                                    if name in pd_log.index:
-                                        pd_log.at[name, 'PSNR_Init'] = psnr_rlt[0][folder][idx_d].item()
-                                        pd_log.at[name, 'PSNR_Start'] = (psnr_rlt[1][folder][idx_d] - psnr_rlt[0][folder][idx_d]).item()
-                                        pd_log.at[name, 'PSNR_Final({})'.format(update_step)] = (psnr_rlt[2][folder][idx_d] - psnr_rlt[0][folder][idx_d]).item()
-                                        pd_log.at[name, 'SSIM_Init'] = ssim_rlt[0][folder][idx_d].item()
-                                        pd_log.at[name, 'SSIM_Final'] = ssim_rlt[1][folder][idx_d].item()
-                                    else:
-                                        pd_log.loc[name] = [psnr_rlt[0][folder][idx_d].item(),
-                                                            psnr_rlt[1][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
-                                                            psnr_rlt[2][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
-                                                            ssim_rlt[0][folder][idx_d].item(), ssim_rlt[1][folder][idx_d].item()]
-
-                                    pd_log.to_csv(os.path.join('../results', folder_name, 'psnr_update_{}.csv'.format(val_idx)))
+                                    results.append(name, [psnr_rlt[0][folder][idx_d].item(),
+                                                          psnr_rlt[1][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
+                                                          psnr_rlt[2][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
+                                                          ssim_rlt[0][folder][idx_d].item(), ssim_rlt[1][folder][idx_d].item()])
 
                                     if rank == 0:
                                         for _ in range(world_size):
@@ -712,6 +748,7 @@ def main():
                                                                 ))
 
                             
+                            results.close()
                             if BICUBIC_EVALUATE[val_idx]:
                                 bicubic_performance[val_idx] = {}
                                 bicubic_performance[val_idx]['psnr'] = deepcopy(psnr_rlt[0])
@@ -776,6 +813,9 @@ def main():
                     else:
                         # Single GPU
                         for val_idx, val_set_frag in enumerate(val_set):
+                            slr_cache.reset()
+                            results = ResultLog(os.path.join('../results', folder_name,
+                                                             'psnr_update_{}.csv'.format(val_idx)), log_columns)
                             # PSNR_rlt: psnr_init, psnr_before, psnr_after
                             psnr_rlt = [{}, {}, {}]
                             # SSIM_rlt: ssim_init, ssim_after
@@ -795,11 +835,11 @@ def main():
 
                                 for i in range(len(psnr_rlt)):
                                     if psnr_rlt[i].get(folder, None) is None:
-                                        psnr_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device='cuda')
+                                        psnr_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device=modelcp.device)
                                         #psnr_rlt[i][folder] = []
                                 for i in range(len(ssim_rlt)):
                                     if ssim_rlt[i].get(folder, None) is None:
-                                        ssim_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device='cuda')
+                                        ssim_rlt[i][folder] = torch.zeros(max_idx, dtype=torch.float32, device=modelcp.device)
                                         #ssim_rlt[i][folder] = []
 
                                 cropped_meta_train_data = {}
@@ -829,39 +869,8 @@ def main():
                                     Bic_LQs = F.interpolate(LQs, scale_factor=opt['scale'], mode='bicubic', align_corners=True)
                                     meta_test_data['LQs'] = Bic_LQs.reshape(B, T, C, H*opt['scale'], W*opt['scale'])
 
-                                #modelcp.netG = deepcopy(model.netG)
-                                modelcp.netG, est_modelcp.netE = deepcopy(model.netG), deepcopy(est_model.netE)
-                                optim_params = []
-
-                                sr_params = []
-                                for k, v in modelcp.netG.named_parameters():
-                                    if v.requires_grad:
-                                        sr_params.append(v)
-                                
-                                est_params = []
-                                for k, v in est_modelcp.netE.named_parameters():
-                                    if v.requires_grad:
-                                        est_params.append(v)
-
-                                optim_params = [
-                                    {  # add normal params first
-                                        'params': sr_params,
-                                        'lr': lr_alpha
-                                    },
-                                    {
-                                        'params': est_params,
-                                        'lr': lr_alpha_est
-                                    },
-                                ]
-
-                                if opt['train']['maml']['optimizer'] == 'Adam':
-                                    inner_optimizer = torch.optim.Adam(optim_params, lr=lr_alpha,
-                                                                    betas=(
-                                                                    opt['train']['maml']['beta1'], opt['train']['maml']['beta2']))
-                                elif opt['train']['maml']['optimizer'] == 'SGD':
-                                    inner_optimizer = torch.optim.SGD(optim_params, lr=lr_alpha)
-                                else:
-                                    raise NotImplementedError()
+                                session.reset(capture=True)
+                                inner_optimizer = session.optimizer
 
                                 #if opt['train']['maml']['optimizer'] == 'Adam':
                                 #    inner_optimizer = torch.optim.Adam(modelcp.netG.parameters(), lr=lr_alpha,
@@ -944,15 +953,13 @@ def main():
                                         loss_train = modelcp.calculate_loss()
 
                                         ## Add SLR pixelwise loss while training
-                                        est_model_fixed.feed_data(val_data)
-                                        est_model_fixed.test()
-                                        slr_initialized = est_model_fixed.fake_L
-                                        slr_initialized = slr_initialized.to('cuda')
+                                        slr_initialized = slr_cache.get(val_data)
+                                        slr_initialized = slr_initialized.to(modelcp.device)
 
                                         if opt['network_G']['which_model_G'] == 'TOF':
-                                            loss_train += F.l1_loss(LQs.to('cuda'), slr_initialized)
+                                            loss_train += F.l1_loss(LQs.to(modelcp.device), slr_initialized)
                                         else:
-                                            loss_train += F.l1_loss(meta_train_data['LQs'].to('cuda'), slr_initialized)
+                                            loss_train += F.l1_loss(meta_train_data['LQs'].to(modelcp.device), slr_initialized)
                                         loss_train.backward()
                                         inner_optimizer.step()
 
@@ -968,19 +975,10 @@ def main():
                                     psnr_rlt[2][folder][idx_d] = util.calculate_psnr(update_image, hr_image)
                                     ssim_rlt[1][folder][idx_d] = 0.11 #util.calculate_ssim(update_image, hr_image)
 
-                                    if name in pd_log.index:
-                                        pd_log.at[name, 'PSNR_Init'] = psnr_rlt[0][folder][idx_d].item()
-                                        pd_log.at[name, 'PSNR_Start'] = (psnr_rlt[1][folder][idx_d] - psnr_rlt[0][folder][idx_d]).item()
-                                        pd_log.at[name, 'PSNR_Final({})'.format(update_step)] = (psnr_rlt[2][folder][idx_d] - psnr_rlt[0][folder][idx_d]).item()
-                                        pd_log.at[name, 'SSIM_Init'] = ssim_rlt[0][folder][idx_d].item()
-                                        pd_log.at[name, 'SSIM_Final'] = ssim_rlt[1][folder][idx_d].item()
-                                    else:
-                                        pd_log.loc[name] = [psnr_rlt[0][folder][idx_d].item(),
-                                                            psnr_rlt[1][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
-                                                            psnr_rlt[2][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
-                                                            ssim_rlt[0][folder][idx_d].item(), ssim_rlt[1][folder][idx_d].item()]
-
-                                    pd_log.to_csv(os.path.join('../results', folder_name, 'psnr_update_{}.csv'.format(val_idx)))
+                                    results.append(name, [psnr_rlt[0][folder][idx_d].item(),
+                                                          psnr_rlt[1][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
+                                                          psnr_rlt[2][folder][idx_d].item() - psnr_rlt[0][folder][idx_d].item(),
+                                                          ssim_rlt[0][folder][idx_d].item(), ssim_rlt[1][folder][idx_d].item()])
 
                                     pbar.update('Test {} - {}/{}: I: {:.3f}/{:.4f} \tF+: {:.3f}/{:.4f} \tTime: {:.3f}s'
                                                 .format(folder, idx_d, max_idx,
@@ -990,6 +988,7 @@ def main():
                                                         ))
 
 
+                            results.close()
                             if BICUBIC_EVALUATE[val_idx]:
                                 bicubic_performance[val_idx] = {}
                                 bicubic_performance[val_idx]['psnr'] = deepcopy(psnr_rlt[0])
@@ -1100,10 +1099,17 @@ def main():
                     model.save_training_state(epoch, current_step, model_type='G')
                     est_model.save(current_step)
                     est_model.save_training_state(epoch, current_step, model_type='E')
+                    if meta_sgd:
+                        model.save_network(lrs_G, 'G_lr', current_step)
+                        est_model.save_network(lrs_E, 'E_lr', current_step)
 
     if rank <= 0:
         logger.info('Saving the final model.')
         model.save('latest')
+        est_model.save('latest')
+        if meta_sgd:
+            model.save_network(lrs_G, 'G_lr', 'latest')
+            est_model.save_network(lrs_E, 'E_lr', 'latest')
         logger.info('End of training.')
         tb_logger.close()
 
@@ -0,0 +1,77 @@
+"""Helpers to overlap data loading, model compute and CPU-side post-processing at test time"""
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+class Prefetcher():
+    """Iterate over an iterable (e.g. a DataLoader) from a background thread.
+
+    At most depth items are buffered ahead of the consumer. Exceptions raised while loading
+    are re-raised in the consuming thread.
+    """
+
+    def __init__(self, iterable, depth=2):
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.thread = threading.Thread(target=self._run, args=(iterable, ), daemon=True)
+        self.thread.start()
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                self.queue.put(item)
+        except Exception as e:
+            self.queue.put(e)
+        self.queue.put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class OrderedWorkerPool():
+    """Run jobs on a thread pool and hand their results back in submission order.
+
+    submit() blocks once max_pending jobs are in flight: the oldest job is waited for and its
+    callback is run in the calling thread. drain() finishes every remaining job. With
+    num_workers=0 jobs run synchronously, which keeps the serial behaviour.
+    """
+
+    def __init__(self, num_workers=2, max_pending=None):
+        self.num_workers = num_workers
+        self.max_pending = max_pending if max_pending else max(2 * num_workers, 1)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers) if num_workers > 0 else None
+        self.pending = deque()
+
+    def submit(self, fn, args=(), callback=None):
+        if self.executor is None:
+            result = fn(*args)
+            if callback is not None:
+                callback(result)
+            return
+        self.pending.append((self.executor.submit(fn, *args), callback))
+        while len(self.pending) >= self.max_pending:
+            self._pop()
+
+    def _pop(self):
+        future, callback = self.pending.popleft()
+        result = future.result()
+        if callback is not None:
+            callback(result)
+
+    def drain(self):
+        while self.pending:
+            self._pop()
+
+    def close(self):
+        self.drain()
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,89 @@
+"""Append-only per-frame results log
+
+Rows are buffered and appended to a CSV file in batches, so logging a frame costs O(1)
+instead of rewriting the whole table. The table is only built (load) when it is needed,
+e.g. for the averages at the end of a run.
+"""
+import os
+
+import pandas as pd
+
+
+class ResultLog():
+    """
+    Args:
+        path (str): CSV file, with the row name as first column (same layout as DataFrame.to_csv)
+        columns (list [str]): columns of the rows
+        flush_every (int): number of buffered rows written at once
+        append (bool): keep the rows of an existing file (resume), else start a new file.
+            A partial last line (interrupted write) is dropped, and a file with other
+            columns is rewritten once with the new ones.
+    """
+
+    def __init__(self, path, columns, flush_every=50, append=False):
+        self.path = path
+        self.columns = list(columns)
+        self.flush_every = max(flush_every, 1)
+        self.buffer = []
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        header = ','.join([''] + self.columns) + '\n'
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb+') as f:
+                data = f.read()
+                end = data.rfind(b'\n') + 1
+                if end < len(data):
+                    f.truncate(end)
+            with open(path, 'r') as f:
+                existing = f.readline()
+            if existing != header:
+                old = pd.read_csv(path, index_col=0).reindex(columns=self.columns)
+                old.to_csv(path)
+        else:
+            with open(path, 'w') as f:
+                f.write(header)
+
+    def append(self, name, row):
+        """Add one row (values in the order of columns)"""
+        if len(row) != len(self.columns):
+            raise ValueError('Expected {:d} values, got {:d}.'.format(len(self.columns), len(row)))
+        self.buffer.append([name] + list(row))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        # One write per batch, so an interrupted run loses at most the last batch
+        pd.DataFrame(self.buffer).to_csv(self.path, mode='a', header=False, index=False)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def load(self):
+        """
+        Return:
+            DataFrame of every row written so far, indexed by name. When a name was
+            logged several times, its last row is kept.
+        """
+        self.flush()
+        return load_results(self.path)
+
+
+def load_results(path):
+    """Rows of a results log written by ResultLog, the last one of every name"""
+    df = pd.read_csv(path, index_col=0)
+    return df[~df.index.duplicated(keep='last')]
+
+
+def clip_average(pd_log, columns):
+    """
+    Return:
+        (average over the clips, per-clip averages) of the given columns, the clip being
+        the folder part of the row names ('<clip>/<frame>'), as printed by test_dynavsr.py
+    """
+    clip_avg = pd_log[columns].astype(float).groupby(pd_log.index.map(lambda name: name.split('/')[0])).mean()
+    return clip_avg.mean(), clip_avg
@@ -0,0 +1,123 @@
+"""Per-frame timings of the test-time stages and peak memory"""
+import os
+import time
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+
+# Stage name -> pd_log column
+STAGE_COLUMNS = OrderedDict([
+    ('fetch', 'T_Fetch'),                # waiting for the prefetched sample
+    ('reference', 'T_Reference'),        # bicubic-trained reference forward
+    ('slr', 'T_SLR'),                    # SLR targets of the fixed estimator
+    ('inner_fwd', 'T_InnerFwd'),         # inner loop, summed over the steps (see STEP_COLUMNS)
+    ('inner_bwd', 'T_InnerBwd'),
+    ('inner_opt', 'T_InnerOpt'),
+    ('forward', 'T_Forward'),            # final forward with the adapted weights
+    ('convert', 'T_Convert'),            # tensor to image (writer threads)
+    ('write', 'T_Write'),                # PNG encoding and write
+    ('metrics', 'T_Metrics'),            # PSNR / SSIM
+])
+# Inner loop stages also logged step by step, as ';'-separated seconds of every inner step.
+# The prefix activations of the prefix cache (inner_fwd before the first step) are only in the sum.
+STEP_COLUMNS = OrderedDict((stage, STAGE_COLUMNS[stage] + '_Steps')
+                           for stage in ['inner_fwd', 'inner_bwd', 'inner_opt'])
+TELEMETRY_COLUMNS = list(STAGE_COLUMNS.values()) + ['Peak_MB'] + list(STEP_COLUMNS.values())
+
+
+def current_rss():
+    """Resident set size of the process in MB, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return resident * os.sysconf('SC_PAGE_SIZE') / 1024. ** 2
+
+
+class StageTimer():
+    """Wall-clock time of named stages, accumulated until collect().
+
+    On CUDA the device is synchronized around every stage, so that asynchronous kernels are
+    charged to the stage that launched them. This costs some overlap, so a disabled timer
+    (the default of DynaVSRRunner) does nothing. On the CPU the resident set size is sampled
+    at the stage boundaries, and its maximum is the peak memory of the frame. The stages of
+    STEP_COLUMNS are also kept per inner step, started with next_step().
+    """
+
+    def __init__(self, device=None, enabled=True):
+        self.device = device
+        self.enabled = enabled
+        self.cuda = device is not None and device.type == 'cuda'
+        self.times = {}
+        self.step_times = {}
+        self.num_steps = 0
+        self.peak_rss = 0.
+
+    def _sync(self):
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+        else:
+            rss = current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        self._sync()
+        st = time.time()
+        try:
+            yield
+        finally:
+            self._sync()
+            elapsed = time.time() - st
+            self.times[name] = self.times.get(name, 0.) + elapsed
+            if name in STEP_COLUMNS and self.num_steps:
+                steps = self.step_times.setdefault(name, [])
+                steps.extend([0.] * (self.num_steps - len(steps)))
+                steps[-1] += elapsed
+
+    def next_step(self):
+        """Start the next inner step of the per-step timings"""
+        if self.enabled:
+            self.num_steps += 1
+
+    def iterate(self, iterable, name='fetch'):
+        """Iterate over iterable, timing the wait for every item as the stage name"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def peak_memory(self):
+        """Peak allocated CUDA memory or peak sampled RSS since the last collect(), in MB.
+        Without /proc, the RSS peak falls back to the lifetime peak of the process."""
+        if self.cuda:
+            return torch.cuda.max_memory_allocated(self.device) / 1024. ** 2
+        if self.peak_rss:
+            return self.peak_rss
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+    def collect(self):
+        """Timings (pd_log columns) and peak memory since the last call, then start over"""
+        timings = OrderedDict((column, self.times.get(stage, 0.)) for stage, column in STAGE_COLUMNS.items())
+        timings['Peak_MB'] = self.peak_memory() if self.enabled else 0.
+        for stage, column in STEP_COLUMNS.items():
+            steps = self.step_times.get(stage, [])
+            steps += [0.] * (self.num_steps - len(steps))
+            timings[column] = ';'.join('{:.6f}'.format(t) for t in steps)
+        self.times = {}
+        self.step_times = {}
+        self.num_steps = 0
+        self.peak_rss = 0.
+        if self.enabled and self.cuda:
+            torch.cuda.reset_max_memory_allocated(self.device)
+        return timings
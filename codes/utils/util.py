@@ -2,6 +2,7 @@ import os
 import sys
 import time
 import math
+import threading
 import torch.nn.functional as F
 from datetime import datetime
 import random
@@ -67,6 +68,22 @@ def mkdir_and_rename(path):
     os.makedirs(path)
 
 
+def atomic_write(path, write_fn):
+    '''Write a file through write_fn(tmp_path) and move it into place, so that an
+    interrupted write never leaves a partial file at path. The temporary name is unique
+    to the process and thread, so concurrent writers never share a partial file.'''
+    root, ext = os.path.splitext(path)
+    # keep the extension for format detection
+    tmp_path = '{}.{:d}.{:d}.tmp{}'.format(root, os.getpid(), threading.get_ident(), ext)
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 def set_random_seed(seed):
     random.seed(seed)
     np.random.seed(seed)
@@ -238,20 +255,120 @@ def flipx4_forward(model, inp):
     Returns:
         output (Tensor): outputs of the model. float, in CPU
     """
-    # normal
-    output_f = single_forward(model, inp)
-
-    # flip W
-    output = single_forward(model, torch.flip(inp, (-1, )))
-    output_f = output_f + torch.flip(output, (-1, ))
-    # flip H
-    output = single_forward(model, torch.flip(inp, (-2, )))
-    output_f = output_f + torch.flip(output, (-2, ))
-    # flip both H and W
-    output = single_forward(model, torch.flip(inp, (-2, -1)))
-    output_f = output_f + torch.flip(output, (-2, -1))
-
-    return output_f / 4
+    def forward(x):
+        with torch.no_grad():
+            model_output = model(x)
+        return model_output[0] if isinstance(model_output, (list, tuple)) else model_output
+
+    return ensemble_forward(forward, inp, ensemble=4).data.float().cpu()
+
+
+# (flipped dims, transposed H and W) of the self ensemble, x4 then the transposed x8
+ENSEMBLE_TRANSFORMS = [((), False), ((-1, ), False), ((-2, ), False), ((-2, -1), False),
+                       ((), True), ((-1, ), True), ((-2, ), True), ((-2, -1), True)]
+
+
+def ensemble_forward(forward_fn, inp, ensemble=4, max_batch=None):
+    """Self ensemble (flips, and transposes for x8) batched into as few forwards as possible
+    Args:
+        forward_fn (function): B x T x C x H x W window -> B x C x (H*s) x (W*s) output
+        inp (Tensor): B x T x C x H x W window
+        ensemble (int): 4 (flips) or 8 (flips of the window and of its transpose)
+        max_batch (int): maximum number of transformed windows per forward, all at once by default
+
+    Returns:
+        output (Tensor): B x C x (H*s) x (W*s) average, on the device of the outputs of forward_fn
+    """
+    if ensemble not in [4, 8]:
+        raise NotImplementedError('Self ensemble [x{}] is not recognized.'.format(ensemble))
+    B = inp.shape[0]
+    transforms = ENSEMBLE_TRANSFORMS[:ensemble]
+    # Transposed windows only share a batch with the others when the frames are square
+    if inp.shape[-2] == inp.shape[-1]:
+        groups = [transforms]
+    else:
+        groups = [transforms[:4], transforms[4:]] if ensemble == 8 else [transforms]
+    step = max(max_batch // B, 1) if max_batch else len(transforms)
+
+    output = None
+    for group in groups:
+        for i in range(0, len(group), step):
+            chunk = group[i:i + step]
+            x = torch.cat([_ensemble_transform(inp, dims, transpose) for dims, transpose in chunk], dim=0)
+            out = forward_fn(x)
+            for j, (dims, transpose) in enumerate(chunk):
+                # Undo the transform on the device, in reverse order
+                o = out[j * B:(j + 1) * B]
+                if transpose:
+                    o = o.transpose(-2, -1)
+                if dims:
+                    o = torch.flip(o, dims)
+                output = o.clone() if output is None else output + o
+    return output / len(transforms)
+
+
+def _ensemble_transform(x, dims, transpose):
+    if dims:
+        x = torch.flip(x, dims)
+    if transpose:
+        x = x.transpose(-2, -1)
+    return x
+
+
+def tile_positions(length, tile, overlap):
+    """Start offsets of overlapping tiles covering [0, length), the last one flush with the end"""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile, max(tile - overlap, 1)))
+    positions.append(length - tile)
+    return positions
+
+
+def _feather(length, overlap_lo, overlap_hi):
+    """Blending weights along one side of a tile: linear ramps over the overlaps with the
+    previous and the next tiles, never reaching zero"""
+    w = torch.ones(length)
+    overlap_lo, overlap_hi = min(overlap_lo, length), min(overlap_hi, length)
+    if overlap_lo > 0:
+        w[:overlap_lo] = torch.arange(1, overlap_lo + 1).float() / (overlap_lo + 1)
+    if overlap_hi > 0:
+        w[length - overlap_hi:] = torch.min(w[length - overlap_hi:],
+                                            torch.arange(overlap_hi, 0, -1).float() / (overlap_hi + 1))
+    return w
+
+
+def tiled_forward(forward_fn, inp, tile_size, overlap=16, align=1):
+    """Forward a window tile by tile and blend the overlapping outputs (feathering)
+    Args:
+        forward_fn (function): B x T x C x h x w window -> B x C x (h*s) x (w*s) output
+        inp (Tensor): B x T x C x H x W window, tiled at the same positions on every frame
+        tile_size (int): side of the tiles, in LR pixels
+        overlap (int): overlap of neighbouring tiles, in LR pixels
+        align (int): input pixels per LR pixel, e.g. the scale for bicubic upsampled inputs
+            (TOF). Tiles start on the LR pixel grid, as in preprocessing.common_crop.
+
+    Returns:
+        output (Tensor): B x C x (H*s) x (W*s), on the device of the outputs of forward_fn
+    """
+    H, W = inp.shape[-2] // align, inp.shape[-1] // align
+    th, tw = min(tile_size, H), min(tile_size, W)
+    ys, xs = tile_positions(H, tile_size, overlap), tile_positions(W, tile_size, overlap)
+    output, weight, s = None, None, None
+    for iy, y in enumerate(ys):
+        for ix, x in enumerate(xs):
+            out = forward_fn(inp[..., y * align:(y + th) * align, x * align:(x + tw) * align])
+            if output is None:
+                s = out.shape[-2] // th  # output pixels per LR pixel
+                output = out.new_zeros(out.shape[:-2] + (H * s, W * s))
+                weight = out.new_zeros(H * s, W * s)
+            wy = _feather(th * s, (ys[iy - 1] + th - y) * s if iy > 0 else 0,
+                          (y + th - ys[iy + 1]) * s if iy + 1 < len(ys) else 0)
+            wx = _feather(tw * s, (xs[ix - 1] + tw - x) * s if ix > 0 else 0,
+                          (x + tw - xs[ix + 1]) * s if ix + 1 < len(xs) else 0)
+            w = (wy[:, None] * wx[None, :]).to(out)
+            output[..., y * s:(y + th) * s, x * s:(x + tw) * s] += out * w
+            weight[y * s:(y + th) * s, x * s:(x + tw) * s] += w
+    return output / weight
 
 
 ####################